@@ -0,0 +1 @@
+#Benchmark data generator, micro benchmarks and a locust load scenario, see the README
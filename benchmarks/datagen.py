@@ -0,0 +1,74 @@
+import datetime
+import random
+from project import db
+from project.models import User, BlogPost, Comments, followers
+from project.passwords import hash_password
+from project.counters import recount_all
+from project.fulltext import reindex
+
+#Every generated user logs in with bench<i>@bench.test and this password, bench0 is an admin
+BENCH_PASSWORD = 'benchmark'
+BENCH_EMAIL = 'bench{}@bench.test'
+BENCH_SLUG = 'benchmark-post-{}'
+
+WORDS = ('flask', 'python', 'database', 'index', 'query', 'cache', 'worker', 'request', 'template',
+         'session', 'latency', 'profile', 'comment', 'search', 'image', 'upload', 'server', 'proxy',
+         'thread', 'process', 'memory', 'network', 'deploy', 'release', 'backup', 'schema', 'migration',
+         'cursor', 'pagination', 'token', 'password', 'follower', 'blog', 'editor', 'gallery', 'signal')
+
+def _sentence(rnd, words):
+    return ' '.join(rnd.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+def _content(rnd, paragraphs):
+    return ''.join('<p>{}</p>'.format(' '.join(_sentence(rnd, rnd.randint(6, 14)) for _ in range(5)))
+                   for _ in range(paragraphs))
+
+def _insert(model, rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        db.session.bulk_insert_mappings(model, rows[start:start + batch_size])
+        db.session.commit()
+
+#Fill an empty database: `users` users, `posts` posts, `comments` comments spread over
+#the posts and `follows` followed users per user. Rows are bulk inserted, the counters
+#and the search index are rebuilt at the end. The same seed gives the same data.
+def generate(users=100, posts=1000, comments=10000, follows=10, seed=1, batch_size=1000):
+    rnd = random.Random(seed)
+    start = datetime.datetime(2020, 1, 1)
+    password = hash_password(BENCH_PASSWORD)
+    _insert(User, [{
+        'name': 'bench{}'.format(i), 'email': BENCH_EMAIL.format(i), 'password': password,
+        'registered_on': start, 'confirmed': True, 'confirmed_on': start,
+        'admin': i == 0, 'role': 'admin' if i == 0 else 'user',
+        'about': _sentence(rnd, 10),
+    } for i in range(users)], batch_size)
+    user_ids = [user_id for user_id, in db.session.query(User.id).filter(User.email.like('%@bench.test')).order_by(User.id)]
+
+    _insert(BlogPost, [{
+        'title': 'Benchmark post {}: {}'.format(i, _sentence(rnd, 4)[:-1]),
+        'content': _content(rnd, rnd.randint(2, 8)), 'slug': BENCH_SLUG.format(i),
+        'author_id': rnd.choice(user_ids), 'timestamp': start + datetime.timedelta(minutes=i),
+    } for i in range(posts)], batch_size)
+    post_ids = [post_id for post_id, in db.session.query(BlogPost.id).filter(BlogPost.slug.like('benchmark-post-%'))]
+    slugs = dict(db.session.query(BlogPost.id, BlogPost.slug).filter(BlogPost.id.in_(post_ids)))
+
+    #a few posts get most of the comments, like on a real blog
+    weights = [1.0 / (rank + 1) for rank in range(len(post_ids))]
+    commented = rnd.choices(post_ids, weights, k=comments) if post_ids else []
+    _insert(Comments, [{
+        'comment_content': _sentence(rnd, rnd.randint(5, 30)), 'post_id': post_id,
+        'comment_post_title': slugs[post_id], 'comment_user_id': rnd.choice(user_ids),
+        'timestamp': start + datetime.timedelta(seconds=i * 30),
+    } for i, post_id in enumerate(commented)], batch_size)
+
+    pairs = []
+    for follower in user_ids:
+        for followed in rnd.sample(user_ids, min(follows, len(user_ids))):
+            if followed != follower:
+                pairs.append({'follower_id': follower, 'followed_id': followed})
+    for batch in range(0, len(pairs), batch_size):
+        db.session.execute(followers.insert(), pairs[batch:batch + batch_size])
+        db.session.commit()
+
+    recount_all()
+    reindex()
+    return len(user_ids), len(post_ids), len(commented), len(pairs)
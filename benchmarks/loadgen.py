@@ -0,0 +1,120 @@
+#Closed-loop HTTP load against a running server, to compare serving modes (gunicorn.conf.py)
+#without installing locust:
+#
+#   python -m benchmarks.loadgen --host 127.0.0.1:8000 --concurrency 32 --duration 20 /blog /blog/search?q=cache
+#
+#Every connection logs in as a generated user (python manage.py bench_data) and then
+#requests the given paths round robin over a kept-alive connection. Like locustfile.py it
+#doesn't import the app, the server may run somewhere else.
+import argparse
+import http.client
+import math
+import re
+import threading
+import time
+from urllib.parse import urlencode
+
+BENCH_EMAIL = 'bench{}@bench.test'
+BENCH_PASSWORD = 'benchmark'
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+SESSION_COOKIE = re.compile(r'(session=[^;]+)')
+
+#Nearest-rank percentile of sorted `values`, as in micro.py
+def percentile(values, pct):
+    return values[max(0, int(math.ceil(pct / 100.0 * len(values))) - 1)]
+
+class Client(object):
+    def __init__(self, host, user):
+        self.host = host
+        self.user = user
+        self.cookie = ''
+        self.connection = http.client.HTTPConnection(host, timeout=60)
+
+    def request(self, method, path, body=None):
+        headers = {'Cookie': self.cookie}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            #the server closed the kept-alive connection, reconnect once
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, timeout=60)
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+        data = response.read()
+        cookie = SESSION_COOKIE.search(response.getheader('Set-Cookie') or '')
+        if cookie:
+            self.cookie = cookie.group(1)
+        return response.status, data
+
+    def login(self):
+        status, page = self.request('GET', '/login')
+        match = CSRF_TOKEN.search(page.decode('utf-8', 'replace'))
+        status, _ = self.request('POST', '/login', urlencode({
+            'email': BENCH_EMAIL.format(self.user), 'password': BENCH_PASSWORD,
+            'csrf_token': match.group(1) if match else ''}))
+        if status != 302:
+            raise RuntimeError('login as {} failed with {}'.format(BENCH_EMAIL.format(self.user), status))
+
+def run(host, paths, concurrency=16, duration=10, users=100):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    clients = [Client(host, i % users) for i in range(concurrency)]
+    for client in clients:
+        client.login()
+    deadline = time.time() + duration
+
+    def loop(client, offset):
+        mine, failed, i = [], 0, offset
+        while time.time() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                status, _ = client.request('GET', path)
+            except (http.client.HTTPException, OSError):
+                status = None
+            if status is None or status >= 400:
+                failed += 1
+            else:
+                mine.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=loop, args=(client, i)) for i, client in enumerate(clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    latencies.sort()
+    if not latencies:
+        return {'requests': 0, 'errors': errors[0]}
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50': round(percentile(latencies, 50), 1),
+        'p95': round(percentile(latencies, 95), 1),
+        'p99': round(percentile(latencies, 99), 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Closed-loop HTTP load generator')
+    parser.add_argument('--host', default='127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=int, default=10)
+    parser.add_argument('--users', type=int, default=100, help='users created by bench_data')
+    parser.add_argument('paths', nargs='*', default=['/blog'])
+    args = parser.parse_args()
+    result = run(args.host, args.paths, args.concurrency, args.duration, args.users)
+    print(' '.join('{}={}'.format(key, result[key]) for key in ('requests', 'errors', 'rps', 'p50', 'p95', 'p99')
+                   if key in result))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#Load scenario for a local gunicorn serving data from `python manage.py bench_data`:
+#
+#   APP_RATELIMIT_ENABLED=0 gunicorn -c gunicorn.conf.py run:app
+#   locust -f benchmarks/locustfile.py --host http://127.0.0.1:8000
+#
+#BENCH_USERS and BENCH_POSTS must match the bench_data options. Locust (not in
+#requirements.txt) reports the latency percentiles and the failures per request.
+import os
+import random
+import re
+from locust import HttpUser, between, task
+
+BENCH_USERS = int(os.environ.get('BENCH_USERS', 100))
+BENCH_POSTS = int(os.environ.get('BENCH_POSTS', 1000))
+BENCH_PASSWORD = 'benchmark'
+QUERIES = ('database', 'cache worker', 'flask template', 'search index', 'memory')
+
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+class BlogReader(HttpUser):
+    wait_time = between(1, 5)
+
+    def on_start(self):
+        page = self.client.get('/login')
+        match = CSRF_TOKEN.search(page.text)
+        self.client.post('/login', name='/login', data={
+            'email': 'bench{}@bench.test'.format(random.randrange(BENCH_USERS)),
+            'password': BENCH_PASSWORD,
+            'csrf_token': match.group(1) if match else '',
+        })
+
+    def _slug(self):
+        #recent posts are read the most
+        return 'benchmark-post-{}'.format(BENCH_POSTS - 1 - min(int(random.expovariate(0.05)), BENCH_POSTS - 1))
+
+    @task(10)
+    def home(self):
+        self.client.get('/blog')
+
+    @task(8)
+    def post_detail(self):
+        self.client.get('/blog/{}/'.format(self._slug()), name='/blog/[slug]/')
+
+    @task(3)
+    def load_comments(self):
+        self.client.post('/{}/load_comments'.format(self._slug()), name='/[slug]/load_comments')
+
+    @task(2)
+    def search(self):
+        self.client.get('/blog/search', params={'q': random.choice(QUERIES)}, name='/blog/search')
+
+    @task(2)
+    def profile(self):
+        self.client.get('/profile/bench{}'.format(random.randrange(BENCH_USERS)), name='/profile/[name]')
@@ -0,0 +1,140 @@
+import json
+import math
+import platform
+import time
+import tracemalloc
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
+from project import app, db, cache
+from project.fragments import fragments
+from project.models import User, BlogPost, Comments
+from project.blog.views import global_map
+from benchmarks.datagen import BENCH_EMAIL, BENCH_PASSWORD
+
+#Nearest-rank percentile of sorted `values`
+def percentile(values, pct):
+    return values[max(0, int(math.ceil(pct / 100.0 * len(values))) - 1)]
+
+class QueryCounter(object):
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+def _login(client):
+    response = client.post('/login', data={'email': BENCH_EMAIL.format(0), 'password': BENCH_PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError('Could not log in as {}, run `python manage.py bench_data` first'.format(BENCH_EMAIL.format(0)))
+
+def _check(response):
+    if response.status_code >= 400:
+        raise RuntimeError('{} {}'.format(response.status_code, response.headers.get('Location', '')))
+    return response
+
+#name -> callable(client, fixtures), run against generated data (benchmarks/datagen.py)
+def scenarios():
+    def global_map_scenario(client, fixtures):
+        with app.test_request_context('/blog'):
+            global_map()
+
+    def login(client, fixtures):
+        #a client of its own, the shared one is already logged in
+        _login(app.test_client())
+
+    return [
+        ('global_map', global_map_scenario),
+        ('blog.home', lambda client, fixtures: _check(client.get('/blog'))),
+        ('post_detail', lambda client, fixtures: _check(client.get('/blog/{}/'.format(fixtures['slug'])))),
+        ('load_comments', lambda client, fixtures: _check(client.post('/{}/load_comments'.format(fixtures['slug']),
+                                                                      data={'limit': 20}))),
+        ('search', lambda client, fixtures: _check(client.get('/blog/search', query_string={'q': fixtures['query']}))),
+        ('profile', lambda client, fixtures: _check(client.get('/profile/{}'.format(fixtures['username'])))),
+        ('login', login),
+    ]
+
+def _fixtures():
+    #the most commented post, the most active commenter
+    slug = db.session.query(BlogPost.slug).order_by(BlogPost.comment_count.desc()).limit(1).scalar()
+    user_id = db.session.query(Comments.comment_user_id).group_by(Comments.comment_user_id) \
+        .order_by(func.count().desc()).limit(1).scalar()
+    if slug is None or user_id is None:
+        raise RuntimeError('No posts or comments, run `python manage.py bench_data` first')
+    return {'slug': slug, 'username': User.query.get(user_id).name, 'query': 'database cache'}
+
+#Time every scenario `iterations` times after `warmup` runs. Latency percentiles are in
+#milliseconds, queries is the mean per run, peak_kb the peak Python allocation of one
+#extra traced run. `cold` empties the caches before every run.
+def run(iterations=50, warmup=5, cold=False, only=None):
+    #in process, without the form tokens a browser would send
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['RATELIMIT_ENABLED'] = False
+    app.config['PERF_SLOW_REQUEST_MS'] = float('inf')
+    client = app.test_client()
+    _login(client)
+    fixtures = _fixtures()
+    results = {}
+    for name, scenario in scenarios():
+        if only and name not in only:
+            continue
+        for _ in range(warmup):
+            scenario(client, fixtures)
+        timings = []
+        with QueryCounter() as queries:
+            for _ in range(iterations):
+                if cold:
+                    cache.clear()
+                    fragments.clear()
+                start = time.perf_counter()
+                scenario(client, fixtures)
+                timings.append((time.perf_counter() - start) * 1000)
+        tracemalloc.start()
+        scenario(client, fixtures)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        timings.sort()
+        results[name] = {
+            'iterations': iterations,
+            'p50': round(percentile(timings, 50), 2),
+            'p95': round(percentile(timings, 95), 2),
+            'p99': round(percentile(timings, 99), 2),
+            'mean': round(sum(timings) / len(timings), 2),
+            'queries': round(float(queries.count) / iterations, 2),
+            'peak_kb': round(peak / 1024.0, 1),
+        }
+    return results
+
+def report(results):
+    lines = ['{:<14} {:>9} {:>9} {:>9} {:>9} {:>8} {:>9}'.format(
+        'scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'mean ms', 'queries', 'peak KB')]
+    for name, result in results.items():
+        lines.append('{:<14} {p50:>9.2f} {p95:>9.2f} {p99:>9.2f} {mean:>9.2f} {queries:>8.2f} {peak_kb:>9.1f}'.format(name, **result))
+    return '\n'.join(lines)
+
+def save_baseline(results, path):
+    with open(path, 'w') as f:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                   'database': db.engine.dialect.name, 'results': results}, f, indent=2, sort_keys=True)
+
+#Regressions against a baseline saved by save_baseline: a p95 more than `tolerance`
+#(a fraction) slower, or more queries per run. Returns a list of messages.
+def compare(results, path, tolerance=0.25):
+    with open(path) as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['p95'] > base['p95'] * (1 + tolerance):
+            regressions.append('{}: p95 {:.2f} ms, baseline {:.2f} ms'.format(name, result['p95'], base['p95']))
+        if result['queries'] > base['queries']:
+            regressions.append('{}: {:.2f} queries, baseline {:.2f}'.format(name, result['queries'], base['queries']))
+    return regressions
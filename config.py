@@ -8,7 +8,23 @@ class BaseConfig(object):
     SECURITY_PASSWORD_SALT = 'yoursalt'
     PASSWORD_RESET_SALT = 'yoursalt'
     SQLALCHEMY_DATABASE_URI = os.environ['APP_DATABASE_URL']
-    SQLALCHEMY_TRACK_MODIFICATIONS = True
+    #model changes go through project/events.py
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    #Connection pool of every process (not used with sqlite). Pre ping replaces
+    #connections the database closed while they sat in the pool.
+    SQLALCHEMY_POOL_SIZE = int(os.environ.get('APP_DB_POOL_SIZE', 5))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.environ.get('APP_DB_MAX_OVERFLOW', 10))
+    SQLALCHEMY_POOL_TIMEOUT = 10
+    SQLALCHEMY_POOL_RECYCLE = 1800
+    SQLALCHEMY_POOL_PRE_PING = True
+    #Statements run for a request are cancelled after this long (0: no limit)
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('APP_DB_STATEMENT_TIMEOUT_MS', 15000))
+    #Read only views (database.replica_reads) query these replicas, comma separated
+    #in APP_DATABASE_REPLICA_URLS. Replicas further behind than DB_REPLICA_MAX_LAG
+    #seconds are skipped, users read from the primary for as long after they wrote.
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.environ.get('APP_DATABASE_REPLICA_URLS', '').split(',') if uri]
+    DB_REPLICA_MAX_LAG = 5
+    DB_REPLICA_LAG_CHECK_INTERVAL = 5
   
     #Flask-mail settings
     MAIL_SERVER = os.environ['APP_MAIL_SERVER']
@@ -21,23 +37,156 @@ class BaseConfig(object):
     #Flask-mail accounts 
     MAIL_DEFAULT_SENDER = os.environ['APP_MAIL_USERNAME']
     
+    #Outbound mail queue
+    MAIL_QUEUE_WORKERS = 2
+    MAIL_QUEUE_BATCH_SIZE = 20
+    MAIL_QUEUE_MAX_ATTEMPTS = 5
+    #seconds before the first retry, doubled on every further attempt
+    MAIL_QUEUE_RETRY_DELAY = 30
+    #seconds a claimed message stays reserved for the worker that claimed it
+    MAIL_QUEUE_LEASE = 300
+    MAIL_QUEUE_POLL_INTERVAL = 5
+    #run the worker pool inside the web process instead of `manage.py mail_worker`
+    MAIL_QUEUE_IN_PROCESS = False
+    
     #Flask-CKEditor
     CKEDITOR_FILE_UPLOADER = '/blog/upload' #name of your view route
     CKEDITOR_SERVE_LOCAL = True
     CK_UPLOAD_PATH = os.environ['APP_CK_UPLOAD_PATH']
     CKEDITOR_EXTRA_PLUGINS=['imagebrowser']
-    #Flask-msearch
+    #max-age of content-hashed uploads served from /files/
+    FILES_CACHE_TIMEOUT = 365 * 24 * 3600
+    #internal nginx location mapped to CK_UPLOAD_PATH, /files/ then answers with X-Accel-Redirect
+    FILES_X_ACCEL_PREFIX = os.environ.get('APP_FILES_X_ACCEL_PREFIX')
+    #let a front server that understands X-Sendfile (apache, lighttpd) send the file
+    USE_X_SENDFILE = os.environ.get('APP_USE_X_SENDFILE') == '1'
+    #editor image browser, served from the upload index
+    FILES_PER_PAGE = 50
+    FILES_MAX_PAGE_SIZE = 200
+    FILES_LIST_CACHE_TIMEOUT = 300
+    #Full-text search (project/fulltext.py): postgresql, sqlite (FTS5) or whoosh,
+    #defaults to the database's own full-text search
+    SEARCH_BACKEND = os.environ.get('APP_SEARCH_BACKEND')
+    #Postgres text search configuration
+    SEARCH_LANGUAGE = 'english'
+    SEARCH_RESULTS_PER_PAGE = 10
+    #result pages are cached per normalized query until the index changes
+    SEARCH_CACHE_TIMEOUT = 300
+    #browser caching of the GET /blog/search?q= page
+    SEARCH_PAGE_MAX_AGE = 60
+    SEARCH_SUGGEST_LIMIT = 8
+    #Processes catch their title index up from the posts changed in the versions they
+    #missed (kept this long), more than SEARCH_SUGGEST_MAX_CATCH_UP versions behind they reload it
+    SEARCH_SUGGEST_CHANGES_TIMEOUT = 3600
+    SEARCH_SUGGEST_MAX_CATCH_UP = 100
+    #Post changes go through the search_outbox table, drained by `manage.py search_indexer`
+    SEARCH_INDEX_BATCH_SIZE = 200
+    SEARCH_INDEX_POLL_INTERVAL = 2
+    #run the indexer thread inside the web process instead
+    SEARCH_INDEX_IN_PROCESS = False
+    #index right after each commit (tests)
+    SEARCH_INDEX_SYNC = False
+    #Flask-msearch, whoosh index used by the whoosh search backend
     MSEARCH_INDEX_NAME = 'whoosh_index'
     #setting backend to whoosh
     MSEARCH_BACKEND = 'whoosh'
-    #auto create or update index
-    MSEARCH_ENABLE = True
+    #the search backend updates the index itself
+    MSEARCH_ENABLE = False
+    
+    #Cache, 'lru' is per worker and only right with a single worker (gunicorn.conf.py
+    #refuses to start more), 'redis' is shared by all of them
+    CACHE_TYPE = os.environ.get('APP_CACHE_TYPE', 'lru')
+    CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_LRU_MAX_ENTRIES = 1024
+    CACHE_REDIS_URL = os.environ.get('APP_REDIS_URL')
+    CACHE_KEY_PREFIX = 'flaskapp:'
+    RECENT_POSTS_CACHE_TIMEOUT = 300
+    #Logged in user (name, email, role...), dropped on commit when the row changes
+    SESSION_USER_CACHE_TIMEOUT = 60
+    #Rendered template fragments ({% cache %}), bounded to FRAGMENT_CACHE_LRU_MAX_ENTRIES
+    FRAGMENT_CACHE_TYPE = CACHE_TYPE
+    FRAGMENT_CACHE_DEFAULT_TIMEOUT = 3600
+    FRAGMENT_CACHE_LRU_MAX_ENTRIES = 2048
+    FRAGMENT_CACHE_KEY_PREFIX = 'flaskapp:fragment:'
+    
+    #Last seen times are written per worker every ACTIVITY_FLUSH_INTERVAL seconds,
+    #0 leaves them in memory until flushed by hand (tests)
+    ACTIVITY_FLUSH_INTERVAL = 60
+    ACTIVITY_FLUSH_BATCH_SIZE = 500
+    #seen within this many seconds counts as online
+    ACTIVITY_ONLINE_WINDOW = 300
+    
+    #Password hashing (project/passwords.py), bcrypt cost, see `manage.py bcrypt_benchmark`.
+    #Hashes at another cost are rehashed at the next login.
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('APP_BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = 2
+    #queued or running hashes per worker process before logins get a 429
+    PASSWORD_HASH_MAX_PENDING = 8
+    PASSWORD_HASH_TIMEOUT = 10
+    PASSWORD_HASH_RETRY_AFTER = 2
+    #hash on the request thread instead (tests)
+    PASSWORD_HASH_SYNC = False
+    
+    #Rate limits (project/ratelimit.py), 'memory' counts per worker, 'redis' across workers
+    RATELIMIT_ENABLED = os.environ.get('APP_RATELIMIT_ENABLED', '1') == '1'
+    RATELIMIT_STORAGE = os.environ.get('APP_RATELIMIT_STORAGE', 'memory')
+    RATELIMIT_REDIS_URL = os.environ.get('APP_REDIS_URL')
+    RATELIMIT_KEY_PREFIX = 'flaskapp:ratelimit:'
+    #policy: [(requests, per seconds, counted per 'ip', 'user' or posted 'email'), ...]
+    RATELIMIT_POLICIES = {
+        'login': [(20, 60, 'ip'), (5, 300, 'email')],
+        'register': [(5, 3600, 'ip')],
+        'reset': [(5, 3600, 'ip'), (3, 3600, 'email')],
+        'resend_confirmation': [(3, 3600, 'user')],
+        'comment': [(10, 60, 'user')],
+    }
+    
+    #Request instrumentation (project/instrumentation.py): SQL and template time and bytes sent per request,
+    #sent as Server-Timing headers, requests slower than PERF_SLOW_REQUEST_MS are logged
+    #with their slowest statements (to APP_SLOW_LOG_PATH when set)
+    PERF_INSTRUMENTATION = True
+    PERF_SERVER_TIMING = True
+    PERF_SLOW_REQUEST_MS = 500
+    PERF_SLOW_LOG_STATEMENTS = 5
+    PERF_SLOW_LOG_PATH = os.environ.get('APP_SLOW_LOG_PATH')
+    #cProfile a sample of the requests to these endpoints, .prof files go to PERF_PROFILE_DIR
+    PERF_PROFILE_ENDPOINTS = []
+    PERF_PROFILE_SAMPLE_RATE = 0.01
+    PERF_PROFILE_DIR = os.environ.get('APP_PROFILE_DIR', 'profiles')
     
     #File uploads
     UPLOAD_FOLDER = os.environ['APP_FILE_UPLOADS_FOLDER']
     ALLOWED_EXTENSIONS = set(['jpg', 'gif', 'png', 'jpeg'])
     MAX_CONTENT_LENGTH = 3 * 1024 * 1024
     UPLOADS_URL = os.environ['APP_FILE_UPLOADS_URL']
+    #Pillow resizing runs in a process pool of this size
+    IMAGE_WORKERS = 2
+    #resize on the request thread instead (tests)
+    IMAGE_PROCESSING_SYNC = False
+    #Widths generated per kind of upload, `default` is the one image_url/the editor link to
+    IMAGE_VARIANTS = {
+        'profile': {'widths': [48, 96, 350], 'default': 350},
+        'upload': {'widths': [350, 700, 1400], 'default': 700},
+    }
+    #Output formats, the ones Pillow cannot write (avif without a plugin) are skipped
+    IMAGE_FORMATS = ['avif', 'webp', 'jpeg']
+    IMAGE_QUALITY = {'avif': 50, 'webp': 75, 'jpeg': 80}
+    
+    #Blog index, keyset pagination
+    BLOG_POSTS_PER_PAGE = 5
+    #Show the (estimated) number of posts on the blog index
+    BLOG_SHOW_POST_COUNT = True
+    POST_COUNT_CACHE_TIMEOUT = 600
+    
+    #Blog query loader strategies (joined/selectin/subquery/lazy)
+    BLOG_LOADER_STRATEGIES = {
+        'post_author': 'joined',
+        'comment_author': 'joined',
+    }
+    
+    #Comments, keyset pagination
+    COMMENTS_PER_PAGE = 5
+    COMMENTS_MAX_PAGE_SIZE = 50
 
 class TestConfig(BaseConfig):
     DEBUG = True
@@ -45,11 +194,19 @@ class TestConfig(BaseConfig):
     WTF_CSRF_ENABLED = False
     PRESERVE_CONTEXT_ON_EXCEPTION = False
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    ACTIVITY_FLUSH_INTERVAL = 0
+    BCRYPT_LOG_ROUNDS = 4
+    PASSWORD_HASH_SYNC = True
     TEST_IMG_PATH = os.environ['APP_TEST_IMG_PATH']
+    IMAGE_PROCESSING_SYNC = True
+    SEARCH_INDEX_SYNC = True
 
 class DevelopmentConfig(BaseConfig):
     DEBUG = True
     MAIL_DEBUG = True
     
 class ProductionConfig(BaseConfig):
-    DEBUG = False
\ No newline at end of file
+    DEBUG = False
+    #invalidations have to reach every worker
+    CACHE_TYPE = os.environ.get('APP_CACHE_TYPE', 'redis')
+    FRAGMENT_CACHE_TYPE = CACHE_TYPE
\ No newline at end of file
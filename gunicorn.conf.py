@@ -0,0 +1,57 @@
+#Gunicorn settings: gunicorn -c gunicorn.conf.py run:app
+#Every setting can be overridden from the environment (see the README).
+import multiprocessing
+import os
+
+#'sync' serves one request per worker at a time, 'gevent' many, switching while
+#a request waits on the database, SMTP or file I/O
+worker_class = os.environ.get('APP_WORKER_CLASS', 'sync')
+gevent = worker_class in ('gevent', 'gunicorn.workers.ggevent.GeventWorker')
+
+bind = os.environ.get('APP_BIND', '0.0.0.0:{}'.format(os.environ.get('PORT', '8000')))
+#gevent workers each hold many requests, one or two per CPU are enough
+workers = int(os.environ.get('APP_WORKERS', multiprocessing.cpu_count() * (1 if gevent else 2) + 1))
+#concurrent requests per gevent worker, keep it in line with the database pool
+#(SQLALCHEMY_POOL_SIZE + SQLALCHEMY_MAX_OVERFLOW), requests past that wait for a connection
+worker_connections = int(os.environ.get('APP_WORKER_CONNECTIONS', 50))
+keepalive = int(os.environ.get('APP_KEEPALIVE', 5))
+timeout = int(os.environ.get('APP_WORKER_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('APP_GRACEFUL_TIMEOUT', 30))
+#recycle workers after this many requests (0: never), jittered so they don't restart together
+max_requests = int(os.environ.get('APP_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+#Preloading imports the app once in the master. gevent has to patch the standard library
+#before the app is imported, so it always loads the app in the workers.
+preload_app = os.environ.get('APP_PRELOAD', '0') == '1' and not gevent
+
+accesslog = os.environ.get('APP_ACCESS_LOG') or None
+errorlog = '-'
+
+#The 'lru' caches live in each worker and a write clears them in its own worker only,
+#the others would serve stale pages until the entries expire
+def local_caches(settings):
+    return [name for name in ('CACHE_TYPE', 'FRAGMENT_CACHE_TYPE') if getattr(settings, name, 'lru') == 'lru']
+
+def on_starting(server):
+    from werkzeug.utils import import_string
+    caches = local_caches(import_string(os.environ['APP_SETTINGS']))
+    if server.cfg.workers > 1 and caches:
+        raise RuntimeError('Per worker cache ({}) with {} workers, set APP_CACHE_TYPE=redis or APP_WORKERS=1'.format(
+            ', '.join(caches), server.cfg.workers))
+
+def post_fork(server, worker):
+    #the master must not hand its database connections to the workers
+    if preload_app:
+        from project import app, db
+        db.dispose_engines(app)
+
+def post_worker_init(worker):
+    if gevent:
+        #psycopg2 waits on the socket through gevent instead of blocking the worker
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError as e:
+            worker.log.warning('Postgres queries block the gevent worker: %s', e)
+        else:
+            patch_psycopg()
@@ -2,9 +2,18 @@ from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 import datetime
 import os
+import sys
+import time
+import bcrypt
 
 from project import app, db
 from project.models import User
+from project.counters import recount_all
+from project.mailqueue import MailWorker, queue_status
+from project.uploads import index_directory
+from project.images import is_listed_upload
+from project.fulltext import backend, reindex as rebuild_index
+from project.searchindex import SearchIndexer, indexing_lag
 
 app.config.from_object(os.environ['APP_SETTINGS'])
 migrate = Migrate(app, db)
@@ -42,6 +51,118 @@ def create_user():
     )
     db.session.commit()
 
+@manager.command
+def recount():
+    """Recomputes the post, comment and follower counters."""
+    print('Recounting')
+    recount_all()
+
+@manager.option('-w', '--workers', dest='workers', type=int, default=None)
+def mail_worker(workers=None):
+    """Sends queued mail until interrupted."""
+    worker = MailWorker()
+    if workers:
+        worker.workers = workers
+    print('Mail worker running with {} threads'.format(worker.workers))
+    worker.run()
+    
+@manager.command
+def mail_status():
+    """Shows the mail queue by status."""
+    counts, oldest = queue_status()
+    for status in sorted(counts):
+        print('{}: {}'.format(status, counts[status]))
+    if oldest:
+        print('oldest pending: {}'.format(oldest))
+
+@manager.option('-b', '--batch', dest='batch', type=int, default=500)
+def index_uploads(batch=500):
+    """Adds the editor uploads missing from the upload index."""
+    added = index_directory(app.config['CK_UPLOAD_PATH'], is_listed_upload, batch)
+    print('Indexed {} uploads'.format(added))
+
+@manager.option('-b', '--batch', dest='batch', type=int, default=500)
+def reindex(batch=500):
+    """Rebuilds the full-text search index."""
+    print('Reindexing posts ({} backend)'.format(backend().name))
+    print('Indexed {} posts'.format(rebuild_index(batch)))
+
+@manager.command
+def search_indexer():
+    """Indexes queued post changes until interrupted."""
+    print('Search indexer running ({} backend)'.format(backend().name))
+    SearchIndexer().run()
+
+@manager.command
+def search_status():
+    """Shows the search indexing lag."""
+    count, age = indexing_lag()
+    print('queued changes: {}'.format(count))
+    print('oldest: {:.1f}s'.format(age))
+
+@manager.command
+def replica_status():
+    """Shows the replication lag of the read replicas."""
+    status = db.replicas().status()
+    if not status:
+        print('No replicas configured (APP_DATABASE_REPLICA_URLS)')
+    for url, lag in status:
+        print('{}: {}'.format(url, 'unreachable' if lag is None else '{:.1f}s behind'.format(lag)))
+
+@manager.option('-t', '--target', dest='target', type=int, default=250)
+@manager.option('-n', '--samples', dest='samples', type=int, default=3)
+def bcrypt_benchmark(target=250, samples=3):
+    """Times a bcrypt hash per cost, to pick BCRYPT_LOG_ROUNDS."""
+    print('Current BCRYPT_LOG_ROUNDS: {}'.format(app.config['BCRYPT_LOG_ROUNDS']))
+    best = None
+    for rounds in range(10, 16):
+        start = time.time()
+        for _ in range(samples):
+            bcrypt.hashpw(b'benchmark password', bcrypt.gensalt(rounds))
+        ms = (time.time() - start) * 1000 / samples
+        print('rounds {}: {:.0f} ms'.format(rounds, ms))
+        if ms <= target:
+            best = rounds
+        else:
+            break
+    if best:
+        print('Highest cost under {} ms: {}'.format(target, best))
+    else:
+        print('Every cost takes longer than {} ms'.format(target))
+
+@manager.option('-u', '--users', dest='users', type=int, default=100)
+@manager.option('-p', '--posts', dest='posts', type=int, default=1000)
+@manager.option('-c', '--comments', dest='comments', type=int, default=10000)
+@manager.option('-f', '--follows', dest='follows', type=int, default=10)
+@manager.option('-s', '--seed', dest='seed', type=int, default=1)
+def bench_data(users=100, posts=1000, comments=10000, follows=10, seed=1):
+    """Fills an empty database with generated users, posts, comments and followers."""
+    from benchmarks.datagen import generate
+    print('Created {} users, {} posts, {} comments and {} follows'.format(
+        *generate(users, posts, comments, follows, seed)))
+
+@manager.option('-n', '--iterations', dest='iterations', type=int, default=50)
+@manager.option('-w', '--warmup', dest='warmup', type=int, default=5)
+@manager.option('--cold', dest='cold', action='store_true', default=False)
+@manager.option('--only', dest='only', default=None)
+@manager.option('--save-baseline', dest='save', default=None)
+@manager.option('--baseline', dest='baseline', default=None)
+@manager.option('--tolerance', dest='tolerance', type=float, default=0.25)
+def bench(iterations=50, warmup=5, cold=False, only=None, save=None, baseline=None, tolerance=0.25):
+    """Times the hot paths, optionally failing on regressions against a baseline."""
+    from benchmarks import micro
+    results = micro.run(iterations, warmup, cold, only.split(',') if only else None)
+    print(micro.report(results))
+    if save:
+        micro.save_baseline(results, save)
+        print('Baseline saved to {}'.format(save))
+    if baseline:
+        regressions = micro.compare(results, baseline, tolerance)
+        for regression in regressions:
+            print('REGRESSION {}'.format(regression))
+        if regressions:
+            sys.exit(1)
+
 
 if __name__ == '__main__':
     manager.run()
\ No newline at end of file
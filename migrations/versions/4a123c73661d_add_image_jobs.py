@@ -0,0 +1,39 @@
+"""add image jobs
+
+Revision ID: 4a123c73661d
+Revises: aec15270b00c
+Create Date: 2026-10-18 19:56:57.689201
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a123c73661d'
+down_revision = 'aec15270b00c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('image_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('source_path', sa.String(), nullable=False),
+        sa.Column('target_path', sa.String(), nullable=False),
+        sa.Column('target_url', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('created_on', sa.DateTime(), nullable=False),
+        sa.Column('finished_on', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_image_jobs_user_id'), 'image_jobs', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_image_jobs_user_id'), table_name='image_jobs')
+    op.drop_table('image_jobs')
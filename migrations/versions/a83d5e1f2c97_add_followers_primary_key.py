@@ -0,0 +1,47 @@
+"""add followers primary key
+
+Revision ID: a83d5e1f2c97
+Revises: f19a6c0b7e24
+Create Date: 2026-10-18 23:05:41.302518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a83d5e1f2c97'
+down_revision = 'f19a6c0b7e24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Without a key the table may hold half empty rows and duplicates,
+    # keep one row per pair
+    op.execute('DELETE FROM followers WHERE follower_id IS NULL OR followed_id IS NULL')
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DELETE FROM followers a USING followers b WHERE a.ctid < b.ctid '
+                   'AND a.follower_id = b.follower_id AND a.followed_id = b.followed_id')
+    else:
+        op.execute('DELETE FROM followers WHERE rowid NOT IN '
+                   '(SELECT min(rowid) FROM followers GROUP BY follower_id, followed_id)')
+    with op.batch_alter_table('followers') as batch_op:
+        batch_op.alter_column('follower_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('followed_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_primary_key('followers_pkey', ['follower_id', 'followed_id'])
+    # The key answers "whom does X follow", this index "who follows X"
+    op.create_index('ix_followers_followed_id_follower_id', 'followers',
+                    ['followed_id', 'follower_id'], unique=False)
+    # Duplicates were counted too
+    op.execute('UPDATE users SET '
+               'follower_count = (SELECT count(*) FROM followers WHERE followers.followed_id = users.id), '
+               'following_count = (SELECT count(*) FROM followers WHERE followers.follower_id = users.id)')
+
+
+def downgrade():
+    op.drop_index('ix_followers_followed_id_follower_id', table_name='followers')
+    with op.batch_alter_table('followers') as batch_op:
+        batch_op.drop_constraint('followers_pkey', type_='primary')
+        batch_op.alter_column('follower_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.alter_column('followed_id', existing_type=sa.Integer(), nullable=True)
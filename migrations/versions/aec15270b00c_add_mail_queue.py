@@ -0,0 +1,41 @@
+"""add mail queue
+
+Revision ID: aec15270b00c
+Revises: d3b4bb9a4e27
+Create Date: 2026-10-18 19:54:36.846680
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'aec15270b00c'
+down_revision = 'd3b4bb9a4e27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('mail_queue',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('recipient', sa.String(), nullable=False),
+        sa.Column('subject', sa.String(), nullable=False),
+        sa.Column('html', sa.Text(), nullable=False),
+        sa.Column('sender_name', sa.String(), nullable=True),
+        sa.Column('sender_address', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.Column('created_on', sa.DateTime(), nullable=False),
+        sa.Column('sent_on', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_mail_queue_status_next_attempt_at', 'mail_queue',
+                    ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_mail_queue_status_next_attempt_at', table_name='mail_queue')
+    op.drop_table('mail_queue')
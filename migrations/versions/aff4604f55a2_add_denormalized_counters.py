@@ -0,0 +1,36 @@
+"""add denormalized counters
+
+Revision ID: aff4604f55a2
+Revises: c4f25b1b8e6a
+Create Date: 2026-10-18 19:50:32.318345
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'aff4604f55a2'
+down_revision = 'c4f25b1b8e6a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('comment_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('users', sa.Column('post_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('users', sa.Column('follower_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('users', sa.Column('following_count', sa.Integer(), nullable=False, server_default='0'))
+    op.execute('UPDATE posts SET comment_count = '
+               '(SELECT count(*) FROM comments WHERE comments.post_id = posts.id)')
+    op.execute('UPDATE users SET '
+               'post_count = (SELECT count(*) FROM posts WHERE posts.author_id = users.id), '
+               'follower_count = (SELECT count(*) FROM followers WHERE followers.followed_id = users.id), '
+               'following_count = (SELECT count(*) FROM followers WHERE followers.follower_id = users.id)')
+
+
+def downgrade():
+    op.drop_column('users', 'following_count')
+    op.drop_column('users', 'follower_count')
+    op.drop_column('users', 'post_count')
+    op.drop_column('posts', 'comment_count')
@@ -0,0 +1,31 @@
+"""require post and comment timestamps
+
+Revision ID: b52e7c0d9a14
+Revises: a83d5e1f2c97
+Create Date: 2026-10-19 10:12:37.418265
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b52e7c0d9a14'
+down_revision = 'a83d5e1f2c97'
+branch_labels = None
+depends_on = None
+
+
+#Keyset pagination orders on (timestamp, id), rows without a timestamp get the
+#epoch and so come last in the blog and first under a post
+def upgrade():
+    for table in ('posts', 'comments'):
+        op.execute("UPDATE {} SET timestamp = '1970-01-01 00:00:00' WHERE timestamp IS NULL".format(table))
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    for table in ('posts', 'comments'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=True)
@@ -0,0 +1,43 @@
+"""add uploads index
+
+Revision ID: b7e1f09c3d52
+Revises: 4a123c73661d
+Create Date: 2026-10-18 20:41:12.318805
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e1f09c3d52'
+down_revision = '4a123c73661d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('uploads',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('filename', sa.String(), nullable=False),
+        sa.Column('digest', sa.String(length=16), nullable=False),
+        sa.Column('mimetype', sa.String(), nullable=True),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('width', sa.Integer(), nullable=True),
+        sa.Column('height', sa.Integer(), nullable=True),
+        sa.Column('uploader_id', sa.Integer(), nullable=True),
+        sa.Column('created_on', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['uploader_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('filename')
+    )
+    op.create_index(op.f('ix_uploads_digest'), 'uploads', ['digest'], unique=False)
+    op.create_index(op.f('ix_uploads_uploader_id'), 'uploads', ['uploader_id'], unique=False)
+    op.create_index('ix_uploads_created_on_id', 'uploads', ['created_on', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_uploads_created_on_id', table_name='uploads')
+    op.drop_index(op.f('ix_uploads_uploader_id'), table_name='uploads')
+    op.drop_index(op.f('ix_uploads_digest'), table_name='uploads')
+    op.drop_table('uploads')
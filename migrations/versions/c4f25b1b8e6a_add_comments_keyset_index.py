@@ -0,0 +1,25 @@
+"""add comments keyset index
+
+Revision ID: c4f25b1b8e6a
+Revises: 
+Create Date: 2026-10-18 19:47:28.599176
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f25b1b8e6a'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_comments_post_id_timestamp_id', 'comments',
+                    ['post_id', 'timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_comments_post_id_timestamp_id', table_name='comments')
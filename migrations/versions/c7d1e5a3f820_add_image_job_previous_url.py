@@ -0,0 +1,25 @@
+"""add image job previous url
+
+Revision ID: c7d1e5a3f820
+Revises: b52e7c0d9a14
+Create Date: 2026-10-19 10:48:03.227691
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d1e5a3f820'
+down_revision = 'b52e7c0d9a14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('image_jobs', sa.Column('previous_url', sa.String(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('image_jobs') as batch_op:
+        batch_op.drop_column('previous_url')
@@ -0,0 +1,51 @@
+"""cascade comment deletes
+
+Revision ID: d3b4bb9a4e27
+Revises: aff4604f55a2
+Create Date: 2026-10-18 19:52:22.053383
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3b4bb9a4e27'
+down_revision = 'aff4604f55a2'
+branch_labels = None
+depends_on = None
+
+
+# The foreign keys of comments to posts, looked up by their columns since the
+# names depend on how the database was created. SQLite cannot alter constraints
+# and relies on the explicit DELETE in blog.delete_post.
+CONSTRAINTS = [
+    ('posts', ['post_id'], ['id']),
+    ('posts', ['comment_post_title'], ['slug']),
+]
+
+
+def _foreign_key_name(referent, local_cols, remote_cols):
+    for fk in sa.inspect(op.get_bind()).get_foreign_keys('comments'):
+        if fk['referred_table'] == referent and fk['constrained_columns'] == local_cols \
+                and fk['referred_columns'] == remote_cols:
+            return fk['name']
+    raise RuntimeError('comments has no foreign key ({}) to {} ({})'.format(
+        ', '.join(local_cols), referent, ', '.join(remote_cols)))
+
+
+def _replace_foreign_keys(**options):
+    if op.get_bind().dialect.name == 'sqlite':
+        return
+    for referent, local_cols, remote_cols in CONSTRAINTS:
+        name = _foreign_key_name(referent, local_cols, remote_cols)
+        op.drop_constraint(name, 'comments', type_='foreignkey')
+        op.create_foreign_key(name, 'comments', referent, local_cols, remote_cols, **options)
+
+
+def upgrade():
+    _replace_foreign_keys(ondelete='CASCADE')
+
+
+def downgrade():
+    _replace_foreign_keys()
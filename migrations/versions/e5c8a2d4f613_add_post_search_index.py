@@ -0,0 +1,33 @@
+"""add post search index
+
+Revision ID: e5c8a2d4f613
+Revises: b7e1f09c3d52
+Create Date: 2026-10-18 21:08:44.902117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c8a2d4f613'
+down_revision = 'b7e1f09c3d52'
+branch_labels = None
+depends_on = None
+
+
+#Filled by `python manage.py reindex`, other databases use the whoosh index
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE TABLE post_search ('
+                   'post_id INTEGER PRIMARY KEY REFERENCES posts (id) ON DELETE CASCADE, '
+                   'title TEXT NOT NULL, body TEXT NOT NULL, document TSVECTOR NOT NULL)')
+        op.execute('CREATE INDEX ix_post_search_document ON post_search USING GIN (document)')
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE post_search USING fts5(title, body, tokenize='porter unicode61')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name in ('postgresql', 'sqlite'):
+        op.execute('DROP TABLE post_search')
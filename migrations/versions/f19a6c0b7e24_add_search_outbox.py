@@ -0,0 +1,30 @@
+"""add search outbox
+
+Revision ID: f19a6c0b7e24
+Revises: e5c8a2d4f613
+Create Date: 2026-10-18 21:32:05.114630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f19a6c0b7e24'
+down_revision = 'e5c8a2d4f613'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('search_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('deleted', sa.Boolean(), nullable=False),
+        sa.Column('created_on', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('search_outbox')
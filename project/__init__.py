@@ -1,6 +1,4 @@
 from flask import Flask, render_template
-from flask_bcrypt import Bcrypt
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_mail import Mail
 from flask_assets import Environment
@@ -9,11 +7,12 @@ from flask_jsglue import JSGlue
 from flask_moment import Moment
 from flask_ckeditor import CKEditor
 from flask_msearch import Search
+from project.cache import Cache
+from project.database import RoutingSQLAlchemy
 
 #create the application object
 app = Flask(__name__)
 
-bcrypt = Bcrypt(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_message_category = "info"
@@ -25,10 +24,16 @@ jsglue = JSGlue(app)
 import os
 app.config.from_object(os.environ['APP_SETTINGS'])
 
-# create the SQLAlchemy object
-db = SQLAlchemy(app)
+# create the SQLAlchemy object (pool settings, statement timeout and read replicas, see project/database.py)
+db = RoutingSQLAlchemy(app)
 mail = Mail(app)
 
+#Cache (in-process LRU or shared redis, see CACHE_TYPE)
+cache = Cache(app)
+
+#per request SQL/template timings, Server-Timing and the slow request log
+import project.instrumentation
+
 #flask-moment
 moment = Moment(app)
 
@@ -39,11 +44,7 @@ ckeditor = CKEditor(app)
 #Flask-msearch
 search = Search()
 search.init_app(app)
-""" if you already have posts in your db, use the following code to index them
-#importing the db model
-from project.models import BlogPost
-#create searchable index of the model
-search.create_index(BlogPost)"""
+#if you already have posts in your db, run `python manage.py reindex` to index them
 
 #Blueprints
 from project.users.views import users_blueprint
@@ -58,12 +59,22 @@ app.register_blueprint(blog_blueprint)
 #Flask-Login
 #defining login view
 from project.models import User
+#denormalized counter hooks
+import project.counters
+#full-text index hooks, post changes are queued for the search indexer
+import project.searchindex
+#{% cache %} template fragments and their invalidation hooks
+import project.fragments
+#cached logged in user, see SESSION_USER_CACHE_TIMEOUT
+from project.sessionuser import session_user
+#last seen times, written in batches
+import project.activity
 
 login_manager.login_view = "users.login"
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.filter(User.id == int(user_id)).first()
+    return session_user(int(user_id))
     
 ########################
 #### error handlers ####
@@ -82,6 +93,15 @@ def page_not_found(error):
 def request_entity_too_large(error):
     return render_template('errors/413.html'), 413
     
+#Rate limited or password hashing queue full, with a Retry-After when known
+@app.errorhandler(429)
+def too_many_requests(error):
+    response = app.make_response((render_template('errors/429.html', error=error), 429))
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
+
 @app.errorhandler(500)
 def server_error_page(error):
     return render_template("errors/500.html"), 500    
@@ -0,0 +1,151 @@
+import atexit
+import datetime
+import logging
+import os
+import threading
+from flask import _request_ctx_stack
+from sqlalchemy import and_, bindparam, or_, text
+from project import app, db
+from project.models import User
+
+logger = logging.getLogger(__name__)
+
+users = User.__table__
+
+#Last-seen times are kept in memory per worker and written in one statement
+#every ACTIVITY_FLUSH_INTERVAL seconds, the latest time per user wins.
+#The database is at most one interval (plus the flush itself) behind.
+class ActivityTracker(object):
+    def __init__(self, app=app):
+        self.app = app
+        self.flush_interval = app.config['ACTIVITY_FLUSH_INTERVAL']
+        self.online_window = datetime.timedelta(seconds=app.config['ACTIVITY_ONLINE_WINDOW'])
+        self.batch_size = app.config['ACTIVITY_FLUSH_BATCH_SIZE']
+        self._lock = threading.Lock()
+        #not flushed yet, user id -> last seen
+        self._pending = {}
+        #seen by this worker within the online window, for online counts
+        self._seen = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def touch(self, user_id, when=None):
+        when = when or datetime.datetime.now()
+        self._ensure_flusher()
+        with self._lock:
+            self._pending[user_id] = max(when, self._pending.get(user_id, when))
+            self._seen[user_id] = max(when, self._seen.get(user_id, when))
+
+    #Users seen by this worker within the online window
+    def online_ids(self, now=None):
+        cutoff = (now or datetime.datetime.now()) - self.online_window
+        with self._lock:
+            return set(user_id for user_id, seen in self._seen.items() if seen >= cutoff)
+
+    #Users seen by any worker: this worker's memory plus what the others have flushed
+    def online_count(self, session=None, now=None):
+        now = now or datetime.datetime.now()
+        session = session or db.session
+        flushed = session.query(User.id).filter(User.last_seen >= now - self.online_window)
+        return len(self.online_ids(now) | set(user_id for user_id, in flushed))
+
+    #Write the pending times, returns the number of users written
+    def flush(self, session=None):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            cutoff = datetime.datetime.now() - self.online_window
+            self._seen = dict((user_id, seen) for user_id, seen in self._seen.items() if seen >= cutoff)
+        if not pending:
+            return 0
+        own_session = session is None
+        session = session or db.create_session({})()
+        try:
+            items = sorted(pending.items())
+            for start in range(0, len(items), self.batch_size):
+                write_last_seen(session.connection(), items[start:start + self.batch_size])
+            session.commit()
+        except Exception:
+            session.rollback()
+            #keep them for the next flush unless newer times came in meanwhile
+            with self._lock:
+                for user_id, seen in pending.items():
+                    self._pending[user_id] = max(seen, self._pending.get(user_id, seen))
+            raise
+        finally:
+            if own_session:
+                session.close()
+        return len(pending)
+
+    #Forget unflushed and online times
+    def clear(self):
+        with self._lock:
+            self._pending = {}
+            self._seen = {}
+
+    def _run(self):
+        with self.app.app_context():
+            while not self._stop.wait(self.flush_interval):
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception('Flushing last seen times failed')
+
+    #One flusher thread per (forked) worker process, none when the interval is 0
+    def _ensure_flusher(self):
+        if self._pid == os.getpid() or self.flush_interval <= 0:
+            return
+        with _start_lock:
+            if self._pid != os.getpid():
+                #the parent's pending times are the parent's to write
+                self._lock = threading.Lock()
+                self._pending = {}
+                self._seen = {}
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._run, name='activity-flusher')
+                self._thread.daemon = True
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        with self.app.app_context():
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing last seen times failed')
+
+_start_lock = threading.Lock()
+
+#UPDATE users ... FROM (VALUES ...) on Postgres, one executemany UPDATE elsewhere.
+#A time older than the stored one (another worker flushed later) is not written.
+def write_last_seen(connection, items):
+    if connection.dialect.name == 'postgresql':
+        rows = ', '.join('(CAST(:id_{0} AS INTEGER), CAST(:seen_{0} AS TIMESTAMP))'.format(i) for i in range(len(items)))
+        params = {}
+        for i, (user_id, seen) in enumerate(items):
+            params['id_{}'.format(i)] = user_id
+            params['seen_{}'.format(i)] = seen
+        connection.execute(text(
+            'UPDATE users SET last_seen = v.seen FROM (VALUES {}) AS v(id, seen) '
+            'WHERE users.id = v.id AND (users.last_seen IS NULL OR users.last_seen < v.seen)'.format(rows)), params)
+    else:
+        connection.execute(users.update().where(and_(
+            users.c.id == bindparam('user_id'),
+            or_(users.c.last_seen.is_(None), users.c.last_seen < bindparam('seen'))))
+            .values(last_seen=bindparam('seen')),
+            [{'user_id': user_id, 'seen': seen} for user_id, seen in items])
+
+tracker = ActivityTracker()
+atexit.register(tracker.stop, 5)
+
+#Only requests that loaded the logged in user anyway count, reading current_user here
+#would load the session user for static files and signed uploads too
+@app.after_request
+def track_activity(response):
+    user = getattr(_request_ctx_stack.top, 'user', None)
+    if user is not None and user.is_authenticated:
+        tracker.touch(user.id)
+    return response
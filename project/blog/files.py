@@ -0,0 +1,44 @@
+import mimetypes
+import os
+import re
+from flask import abort, send_from_directory, url_for
+from werkzeug.security import safe_join
+from werkzeug.urls import url_quote
+from project import app
+from project.images import pending_original
+from project.token import upload_signature
+
+#Content-hashed upload names never change content: <hash>-<width>.<ext>, <hash>.<ext>
+HASHED_NAME = re.compile(r'^[0-9a-f]{16}(-\d+)?\.\w+$')
+
+#Signed /files/ url, embedded in posts so readers don't need a login check per image
+def signed_upload_url(filename):
+    return url_for('blog.uploaded_files', filename=filename, sig=upload_signature(filename))
+
+#Send an editor upload with caching headers, or hand it to the front proxy.
+#`public` uploads (signed urls) may be stored by shared caches.
+def send_upload(filename, public=False):
+    directory = app.config['CK_UPLOAD_PATH']
+    path = safe_join(directory, filename)
+    if path is None:
+        abort(404)
+    immutable = HASHED_NAME.match(filename) is not None
+    if not os.path.isfile(path):
+        #variants are still being made, serve the original meanwhile
+        original = pending_original(directory, filename)
+        if original is None:
+            abort(404)
+        filename, immutable = original, False
+    prefix = app.config['FILES_X_ACCEL_PREFIX']
+    if prefix:
+        response = app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + url_quote(filename)
+    else:
+        #conditional: ETag/Last-Modified, 304s and Range requests, X-Sendfile with USE_X_SENDFILE
+        response = send_from_directory(directory, filename, conditional=True)
+    if immutable:
+        response.headers['Cache-Control'] = '{}, max-age={}, immutable'.format(
+            'public' if public else 'private', app.config['FILES_CACHE_TIMEOUT'])
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,38 @@
+from sqlalchemy import orm
+from project import app
+from project.models import BlogPost, Comments
+
+#Loader strategies that can be set in BLOG_LOADER_STRATEGIES
+LOADER_STRATEGIES = {
+    'joined': 'joinedload',
+    'selectin': 'selectinload',
+    'subquery': 'subqueryload',
+    'lazy': 'lazyload',
+}
+
+#Strategy per relationship, from app.config['BLOG_LOADER_STRATEGIES']
+def loader_name(relationship):
+    strategy = app.config['BLOG_LOADER_STRATEGIES'].get(relationship)
+    try:
+        return LOADER_STRATEGIES[strategy]
+    except KeyError:
+        raise ValueError('Unknown loader strategy "{}" for {}'.format(strategy, relationship))
+
+#Load the author of a post (blog index, search results)
+def post_list_options():
+    return [getattr(orm, loader_name('post_author'))(BlogPost.author)]
+
+#Load the author of a post (post detail), comments are paged separately
+def post_detail_options():
+    return post_list_options()
+
+#Load the author of each comment when querying Comments directly
+def comment_options():
+    return [getattr(orm, loader_name('comment_author'))(Comments.comment_author)]
+
+#Profile page only links to recent posts/comments, skip the heavy columns
+def profile_post_options():
+    return [orm.load_only(BlogPost.title, BlogPost.slug, BlogPost.timestamp)]
+
+def profile_comment_options():
+    return [orm.load_only(Comments.comment_content, Comments.comment_post_title, Comments.timestamp)]
@@ -0,0 +1,22 @@
+from collections import namedtuple
+from sqlalchemy import desc
+from project import app, db, cache
+from project.models import BlogPost
+from project.events import changes
+
+RECENT_POSTS_KEY = 'blog:recent_posts'
+
+#Plain tuples so the cached list can be shared across sessions and pickled
+RecentPost = namedtuple('RecentPost', ['title', 'slug'])
+
+def load_recent_posts():
+    rows = db.session.query(BlogPost.title, BlogPost.slug).order_by(desc(BlogPost.timestamp)).limit(5).all()
+    return [RecentPost(title, slug) for title, slug in rows]
+
+#Sidebar "Recent Posts", served from the cache until a BlogPost change is committed
+def recent_posts():
+    return cache.get_or_set(RECENT_POSTS_KEY, load_recent_posts, app.config['RECENT_POSTS_CACHE_TIMEOUT'])
+
+@changes.on_commit(BlogPost)
+def posts_changed(changed):
+    cache.delete(RECENT_POSTS_KEY)
@@ -1,19 +1,28 @@
 from flask import flash, redirect, render_template, request, \
-    url_for, Blueprint, abort, make_response,jsonify, send_from_directory
+    url_for, Blueprint, abort, make_response,jsonify, send_from_directory, g
 from flask_login import login_required, current_user
 from .form import  SearchForm, CommentForm, CKEditorForm
 from project import db,app
-from project.models import User, BlogPost, Comments
+from project.models import BlogPost, Comments
+from project.blog import queries, sidebar
+from project.pagination import keyset_paginate, encode_cursor, estimated_row_count, InvalidCursor
 import datetime
-from project.decorators import check_confirmed, admin_required
-from sqlalchemy import desc
+from project.decorators import check_confirmed, admin_required, signature_or_login_required
+from project.ratelimit import rate_limited
+from project.database import replica_reads
+from project.follows import following_ids
+from sqlalchemy import desc, or_
 from slugify import slugify
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
 import os
-import random
 from flask_ckeditor import upload_success, upload_fail
-from PIL import Image 
+from project.images import process_image, content_digest, variant_name, original_name, default_width, image_widths, VARIANT_NAME
+from project.uploads import record_upload, list_uploads
+from project.fulltext import search_posts
+from project.searchindex import indexing_lag
+from project.suggest import suggestions
+from project.blog.files import send_upload, signed_upload_url
 
 blog_blueprint = Blueprint(
     'blog', __name__ ,
@@ -21,7 +30,7 @@ blog_blueprint = Blueprint(
 ) 
 
 def global_map():
-    recent_posts= db.session.query(BlogPost).order_by(desc(BlogPost.timestamp)).limit(5).all()
+    recent_posts = sidebar.recent_posts()
     form = SearchForm()
     map = {
          'recent_posts': recent_posts,
@@ -31,12 +40,35 @@ def global_map():
 
 #The Blog/Private Part Of The Site     
 @blog_blueprint.route('/blog')
-@blog_blueprint.route('/blog/<int:page>')
+@replica_reads()
 @login_required
 @check_confirmed
-def home(page=1):
-    posts = db.session.query(BlogPost).order_by(desc(BlogPost.timestamp)).paginate(page,5, True)
+def home():
+    query = db.session.query(BlogPost).options(*queries.post_list_options())
+    try:
+        posts = keyset_paginate(query, BlogPost.timestamp, BlogPost.id, app.config['BLOG_POSTS_PER_PAGE'],
+                                after=request.args.get('after'), before=request.args.get('before'))
+    except InvalidCursor:
+        abort(404)
+    if app.config['BLOG_SHOW_POST_COUNT']:
+        posts.total = estimated_row_count(BlogPost, app.config['POST_COUNT_CACHE_TIMEOUT'])
     return render_template("blog.html", posts=posts, **global_map())
+
+#Old numbered pages, redirect to the cursor of that page. Not permanently, the
+#posts on a page change as new ones are added.
+@blog_blueprint.route('/blog/<int:page>')
+@replica_reads()
+@login_required
+@check_confirmed
+def home_page(page):
+    offset = (page - 1) * app.config['BLOG_POSTS_PER_PAGE'] - 1
+    if offset < 0:
+        return redirect(url_for('blog.home'))
+    last = db.session.query(BlogPost.timestamp, BlogPost.id) \
+        .order_by(desc(BlogPost.timestamp), desc(BlogPost.id)).offset(offset).first()
+    if last is None:
+        abort(404)
+    return redirect(url_for('blog.home', after=encode_cursor(*last)))
     
 #Add Blog Post Page
 @blog_blueprint.route('/blog/add_blog_post',  methods=['GET', 'POST'])
@@ -47,12 +79,11 @@ def add_post():
     form = CKEditorForm()
     if form.validate_on_submit():
         try:
-            user = User.query.filter_by(name=current_user.name).first()
             post = BlogPost(
                 title = form.title.data, 
                 content = form.content.data,
                 slug = slugify(form.title.data),
-                author_id = user.id, 
+                author_id = current_user.id, 
                 timestamp = datetime.datetime.utcnow()
             )
             db.session.add(post)
@@ -65,42 +96,78 @@ def add_post():
     
 #Link to individual Blog Posts    
 @blog_blueprint.route('/blog/<slug>/')
+@replica_reads()
 @login_required
 @check_confirmed
 def post_detail(slug):
     try:
-        post = db.session.query(BlogPost).filter_by(slug=slug).one()
+        post = db.session.query(BlogPost).options(*queries.post_detail_options()).filter_by(slug=slug).one()
     except NoResultFound :
         abort(404)
-    return render_template('blog_post_detail.html', post=post, **global_map())
+    comment_page = comments_page(post.id, per_page=app.config['COMMENTS_PER_PAGE'])
+    return render_template('blog_post_detail.html', post=post, comment_page=comment_page, **global_map())
     
 #Search Blog Posts
-@blog_blueprint.route('/blog/search', methods=['POST'])
+#GET /blog/search?q=<query>&page=<n> can be bookmarked and shared, the sidebar form is a plain GET
+#form. POST is kept for old pages.
+@blog_blueprint.route('/blog/search', methods=['GET', 'POST'])
+@replica_reads()
 @login_required
 @check_confirmed
 def search():
-    form = SearchForm()
-    query = form.search.data
-    if form.validate_on_submit():
-        posts = BlogPost.query.msearch(query).all()
-        return render_template("search_results.html", query=query, posts=posts, **global_map())
-    else:
+    if request.method == 'POST':
+        form = SearchForm()
+        if form.validate_on_submit():
+            return redirect(url_for('blog.search', q=form.search.data), 303)
+        return redirect(url_for('blog.home'))
+    query = request.args.get('q', '').strip()
+    if not query:
         return redirect(url_for('blog.home'))
+    page = max(1, request.args.get('page', 1, type=int))
+    results = search_posts(query, page, app.config['SEARCH_RESULTS_PER_PAGE'], queries.post_list_options())
+    #without the SearchForm of global_map, its per session CSRF token would change the ETag
+    response = make_response(render_template("search_results.html", query=query, results=results,
+                                             recent_posts=sidebar.recent_posts()))
+    #the page shows who is logged in, so only the browser may keep it
+    response.cache_control.private = True
+    response.cache_control.max_age = app.config['SEARCH_PAGE_MAX_AGE']
+    response.add_etag()
+    return response.make_conditional(request)
+
+#Title suggestions for the search box, ?q=<what is typed so far>
+@blog_blueprint.route('/blog/search/suggest')
+@login_required
+@check_confirmed
+def search_suggest():
+    matches = suggestions(request.args.get('q', ''), app.config['SEARCH_SUGGEST_LIMIT'])
+    response = jsonify([{'title': title, 'url': url_for('blog.post_detail', slug=slug)} for title, slug in matches])
+    response.cache_control.private = True
+    response.cache_control.max_age = app.config['SEARCH_PAGE_MAX_AGE']
+    return response
+        
+#Search indexing lag, for monitoring
+@blog_blueprint.route('/blog/search/status')
+@login_required
+@check_confirmed
+@admin_required
+def search_status():
+    queued, age = indexing_lag()
+    return jsonify({'queued': queued, 'oldest_seconds': age})
         
 #Add Comment
 @blog_blueprint.route('/blog/<slug>/add_comment', methods=['POST'])
 @login_required
 @check_confirmed
+@rate_limited('comment')
 def add_comment(slug):
     form = CommentForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(name=current_user.name).first()
         post = db.session.query(BlogPost).filter_by(slug=slug).one()
         comment = Comments(
                 comment_content = form.comment.data,
                 post_id = post.id, 
                 comment_post_title = post.slug,
-                comment_user_id = user.id,
+                comment_user_id = current_user.id,
                 timestamp = datetime.datetime.utcnow()
             )
         db.session.add(comment)
@@ -122,15 +189,70 @@ def delete_comment(slug, comment_id):
     flash('Comment Deleted.','info')
     return redirect(url_for('blog.post_detail', slug=slug))
     
+#One page of a post's comments, oldest first
+def comments_page(post_id, per_page, after=None):
+    query = Comments.query.options(*queries.comment_options()).filter(Comments.post_id == post_id)
+    return keyset_paginate(query, Comments.timestamp, Comments.id, per_page, after=after, descending=False)
+
+def comments_response(slug, fmt):
+    post_id = db.session.query(BlogPost.id).filter_by(slug=slug).scalar()
+    if post_id is None:
+        abort(404)
+    try:
+        per_page = int(request.values.get('limit', app.config['COMMENTS_PER_PAGE']))
+    except ValueError:
+        per_page = app.config['COMMENTS_PER_PAGE']
+    per_page = max(1, min(per_page, app.config['COMMENTS_MAX_PAGE_SIZE']))
+    try:
+        page = comments_page(post_id, per_page, after=request.values.get('after'))
+    except InvalidCursor:
+        abort(404)
+    if fmt == 'json':
+        #whether the viewer follows each author, one query for the page
+        followed = following_ids(current_user.id, set(comment.comment_user_id for comment in page.items))
+        return jsonify({
+            'comments': [{
+                'id': comment.id,
+                'content': comment.comment_content,
+                'timestamp': comment.timestamp.isoformat(),
+                'author': comment.comment_author.name if comment.comment_author else None,
+                'author_image_url': comment.comment_author.image_url if comment.comment_author else None,
+                'author_followed': comment.comment_user_id in followed,
+            } for comment in page.items],
+            'next': page.next_cursor,
+        })
+    return jsonify({'data': render_template('comments.html', comments=page.items, slug=slug), 'next': page.next_cursor})
+
+#Comments API, ?after=<cursor>&limit=<n>&format=html|json
+@blog_blueprint.route('/blog/<slug>/comments')
+@replica_reads()
+@login_required
+@check_confirmed
+def comments(slug):
+    return comments_response(slug, request.args.get('format', 'json'))
+
 ## Load more comments
 @blog_blueprint.route('/<slug>/load_comments', methods=["POST"])
+@replica_reads(methods=None)
 @login_required
 @check_confirmed
 def load_comments(slug):
-    post = db.session.query(BlogPost).filter_by(slug=slug).one()
-    return jsonify({'data' : render_template('comments.html',  post=post)})    
+    return comments_response(slug, 'html')
    
     
+#Delete posts and all of their comments in the current transaction.
+#Comments go in one DELETE, the posts through the session so the post
+#counters, the search index and the recent posts cache see the delete.
+def delete_posts(posts):
+    if not posts:
+        return
+    ids = [post.id for post in posts]
+    slugs = [post.slug for post in posts]
+    Comments.query.filter(or_(Comments.post_id.in_(ids), Comments.comment_post_title.in_(slugs))) \
+        .delete(synchronize_session=False)
+    for post in posts:
+        db.session.delete(post)
+
 #Delete Blog Post & comments
 @blog_blueprint.route('/blog/delete/<slug>/', methods=['POST'])
 @login_required
@@ -138,29 +260,35 @@ def load_comments(slug):
 @admin_required
 def delete_post(slug):
     post= db.session.query(BlogPost).filter_by(slug=slug).one()
-    for comment in post.comments:
-        db.session.delete(comment)
-    db.session.delete(post)
+    delete_posts([post])
     db.session.commit()
     flash('Post Deleted.', 'info')
     return redirect(url_for('blog.home'))
 
+#Delete several posts & comments in one transaction, form field "slug" repeated per post
+@blog_blueprint.route('/blog/delete_posts', methods=['POST'])
+@login_required
+@check_confirmed
+@admin_required
+def delete_many_posts():
+    slugs = request.form.getlist('slug')
+    posts = db.session.query(BlogPost).filter(BlogPost.slug.in_(slugs)).all() if slugs else []
+    delete_posts(posts)
+    db.session.commit()
+    flash('{} Posts Deleted.'.format(len(posts)), 'info')
+    return redirect(url_for('blog.home'))
+
 
 
 #Flask-Ckeditor
+#Signed urls are served without loading the user, unsigned ones need a confirmed login
 @blog_blueprint.route('/files/<path:filename>')
-@login_required
-@check_confirmed
+@signature_or_login_required
 def uploaded_files(filename):
-    path = app.config['CK_UPLOAD_PATH']
-    return send_from_directory(path, filename)
+    return send_upload(filename, public=g.get('signed_request', False))
     
-#
-def gen_rnd_filename():
-    filename_prefix = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-    return '%s%s' % (filename_prefix, str(random.randrange(1000, 10000)))
 
-    
+#Uploads are named by content hash, the same image uploaded twice is stored once
 @blog_blueprint.route('/blog/upload', methods=['POST'])
 @login_required
 @check_confirmed
@@ -170,11 +298,9 @@ def upload():
     if request.method == 'POST' and 'upload' in request.files:
         f = request.files.get('upload')
         fname, fext = os.path.splitext(f.filename)
-        rnd_name = '%s%s' % (gen_rnd_filename(), fext)
-        filepath = os.path.join(app.config['CK_UPLOAD_PATH'],rnd_name)
-        dirname = os.path.dirname(filepath)
-        extension = f.filename.split('.')[1].lower()
-        if extension not in ['jpg', 'gif', 'png', 'jpeg','svg']:
+        fext = fext.lower()
+        dirname = app.config['CK_UPLOAD_PATH']
+        if fext not in ('.jpg', '.jpeg', '.png', '.gif', '.svg'):
             return upload_fail(message='Images only. Filetype not allowed.')
         if not os.path.exists(dirname):
             try:    
@@ -184,18 +310,24 @@ def upload():
         elif not os.access(dirname,os.W_OK):
             error = "can't write to directory."
         if not error: 
-            if fext == ".gif" or fext == '.GIF':
-                f.save(filepath)
-                url = url_for('blog.uploaded_files', filename=rnd_name)
-            else:     
-                f.save(filepath)
-                # compress the image
-                img = Image.open(f)
-                size = (700,700)
-                img.thumbnail(size,Image.ANTIALIAS)
-                img.save(filepath,quality=85,optimize=True)
-                url = url_for('blog.uploaded_files', filename=rnd_name)
-        return upload_success(url=url)# return upload_success call
+            data = f.read()
+            digest = content_digest(data)
+            #gifs and svgs are served as uploaded
+            if fext in ('.gif', '.svg'):
+                name = digest + fext
+            else:
+                name = variant_name(digest, default_width('upload'), 'jpeg')
+            url = signed_upload_url(name)
+            if not os.path.exists(os.path.join(dirname, name)):
+                source = os.path.join(dirname, name if fext in ('.gif', '.svg') else original_name(digest, fext))
+                with open(source, 'wb') as out:
+                    out.write(data)
+                record_upload(name, source, digest, current_user.id)
+                if fext not in ('.gif', '.svg'):
+                    process_image('upload', current_user.id, source, dirname, digest,
+                                  url_for('blog.uploaded_files', filename=''))
+            return upload_success(url=url)# return upload_success call
+        return upload_fail(message=error)
         
 
 # Flask-Ckeditor browse files on server
@@ -204,10 +336,26 @@ def upload():
 @check_confirmed
 @admin_required
 def list_files():
-    #Endpoint to list files on the server.
+    #Endpoint to list files on the server, one page of the upload index per request.
+    #?after=<cursor>&per_page=<n>&q=<name>&uploader=<user>&type=<mimetype>, the next page is in the Link header.
+    per_page = request.args.get('per_page', app.config['FILES_PER_PAGE'], type=int)
+    per_page = max(1, min(per_page, app.config['FILES_MAX_PAGE_SIZE']))
+    q, uploader, mimetype = (request.args.get(arg) or None for arg in ('q', 'uploader', 'type'))
+    try:
+        rows, next_cursor = list_uploads(per_page, request.args.get('after'), q=q, uploader=uploader, mimetype=mimetype,
+                                         timeout=app.config['FILES_LIST_CACHE_TIMEOUT'])
+    except InvalidCursor:
+        abort(404)
     files = []
-    for filename in os.listdir(app.config['CK_UPLOAD_PATH']):
-        path = os.path.join(app.config['CK_UPLOAD_PATH'], filename)
-        if os.path.isfile(path):
-            files.append({  "image"  :  "/files/" + filename  })
-    return jsonify(files)
\ No newline at end of file
+    for row in rows:
+        entry = {"image": signed_upload_url(row['filename']), "folder": row['created_on'][:7],
+                 "size": row['size'], "width": row['width'], "height": row['height'], "uploader": row['uploader']}
+        if VARIANT_NAME.match(row['filename']):
+            entry["thumb"] = signed_upload_url(variant_name(row['digest'], min(image_widths('upload')), 'jpeg'))
+        files.append(entry)
+    response = jsonify(files)
+    if next_cursor:
+        response.headers['Link'] = '<{}>; rel="next"'.format(
+            url_for('blog.list_files', after=next_cursor, per_page=per_page, q=q, uploader=uploader, type=mimetype))
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
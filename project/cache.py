@@ -0,0 +1,163 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+
+#In-process cache, evicts the least recently used entry once max_entries is reached
+class LRUCache(object):
+    def __init__(self, max_entries=1024, default_timeout=300):
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._entries[key]
+            except KeyError:
+                return None
+            if expires is not None and expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        expires = time.time() + timeout if timeout else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+#Shared cache for multiple workers, `client` is anything that speaks the
+#redis-py get/setex/delete/scan_iter API (redis.StrictRedis or a local stand-in)
+class RedisCache(object):
+    def __init__(self, client, key_prefix='flaskapp:', default_timeout=300):
+        self.client = client
+        self.key_prefix = key_prefix
+        self.default_timeout = default_timeout
+
+    def get(self, key):
+        value = self.client.get(self.key_prefix + key)
+        if value is None:
+            return None
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if timeout:
+            self.client.setex(self.key_prefix + key, timeout, value)
+        else:
+            self.client.set(self.key_prefix + key, value)
+
+    def delete(self, key):
+        self.client.delete(self.key_prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.key_prefix + '*'):
+            self.client.delete(key)
+
+#Never stores anything, used to switch caching off
+class NullCache(object):
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+#Configured by <config_prefix>_TYPE, _DEFAULT_TIMEOUT, _LRU_MAX_ENTRIES, _REDIS_URL and _KEY_PREFIX
+class Cache(object):
+    def __init__(self, app=None, config_prefix='CACHE'):
+        self.backend = NullCache()
+        self.config_prefix = config_prefix
+        self._sessions = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        prefix = self.config_prefix + '_'
+        app.config.setdefault(prefix + 'TYPE', 'lru')
+        app.config.setdefault(prefix + 'DEFAULT_TIMEOUT', 300)
+        app.config.setdefault(prefix + 'LRU_MAX_ENTRIES', 1024)
+        app.config.setdefault(prefix + 'REDIS_URL', app.config.get('CACHE_REDIS_URL'))
+        app.config.setdefault(prefix + 'KEY_PREFIX', 'flaskapp:')
+        self.backend = self.make_backend(dict((key[len(prefix):], value) for key, value in app.config.items()
+                                              if key.startswith(prefix)))
+
+    def make_backend(self, config):
+        cache_type = config['TYPE']
+        if cache_type == 'lru':
+            return LRUCache(config['LRU_MAX_ENTRIES'], config['DEFAULT_TIMEOUT'])
+        if cache_type == 'redis':
+            #only needed when the redis backend is configured
+            import redis
+            client = redis.StrictRedis.from_url(config['REDIS_URL'])
+            return RedisCache(client, config['KEY_PREFIX'], config['DEFAULT_TIMEOUT'])
+        if cache_type == 'null':
+            return NullCache()
+        raise ValueError('Unknown {}_TYPE "{}"'.format(self.config_prefix, cache_type))
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, timeout=None):
+        return self.backend.set(key, value, timeout)
+
+    def delete(self, key):
+        return self.backend.delete(key)
+
+    def clear(self):
+        return self.backend.clear()
+
+    #Return the cached value for `key`, computing and storing it on a miss
+    def get_or_set(self, key, func, timeout=None):
+        value = self.get(key)
+        if value is None:
+            value = func()
+            self.set(key, value, timeout)
+        return value
+
+    #Queue keys for deletion on commit, for writes that bypass the flush (bulk UPDATE/DELETE)
+    def mark_changed(self, session, *keys):
+        self._listen_for_commit(session)
+        session.info.setdefault(self._info_key, set()).update(keys)
+
+    @property
+    def _info_key(self):
+        return '{}_invalidate'.format(self.config_prefix.lower())
+
+    def _listen_for_commit(self, session):
+        if session in self._sessions:
+            return
+        self._sessions.append(session)
+
+        def after_commit(session):
+            for key in session.info.pop(self._info_key, ()):
+                self.delete(key)
+
+        def after_rollback(session):
+            session.info.pop(self._info_key, None)
+
+        event.listen(session, 'after_commit', after_commit)
+        event.listen(session, 'after_rollback', after_rollback)
@@ -0,0 +1,39 @@
+from sqlalchemy import case, func, select
+from project import db
+from project.models import BlogPost, Comments, User, followers
+from project.events import changes
+
+posts = BlogPost.__table__
+comments = Comments.__table__
+users = User.__table__
+
+#Comment/post counters are bumped with an UPDATE in the same transaction as the insert/delete
+@changes.on_flush(Comments, ops=('insert', 'delete'))
+def comment_counted(connection, change):
+    connection.execute(posts.update().where(posts.c.id == change.values['post_id'])
+                       .values(comment_count=posts.c.comment_count + (1 if change.op == 'insert' else -1)))
+
+@changes.on_flush(BlogPost, ops=('insert', 'delete'))
+def post_counted(connection, change):
+    connection.execute(users.update().where(users.c.id == change.values['author_id'])
+                       .values(post_count=users.c.post_count + (1 if change.op == 'insert' else -1)))
+
+#Follows are written straight to the followers table (project/follows.py), both
+#counters move in one UPDATE, `step` is 1 or -1
+def follow_counted(connection, follower_id, followed_id, step):
+    connection.execute(users.update().where(users.c.id.in_([follower_id, followed_id])).values(
+        following_count=users.c.following_count + case([(users.c.id == follower_id, step)], else_=0),
+        follower_count=users.c.follower_count + case([(users.c.id == followed_id, step)], else_=0)))
+
+#Recompute every counter from the source tables, repairs drift
+def recount_all():
+    def count(table, condition):
+        return select([func.count()]).select_from(table).where(condition).as_scalar()
+
+    db.session.execute(posts.update().values(
+        comment_count=count(comments, comments.c.post_id == posts.c.id)))
+    db.session.execute(users.update().values(
+        post_count=count(posts, posts.c.author_id == users.c.id),
+        follower_count=count(followers, followers.c.followed_id == users.c.id),
+        following_count=count(followers, followers.c.follower_id == users.c.id)))
+    db.session.commit()
@@ -0,0 +1,211 @@
+import logging
+import random
+import threading
+import time
+from functools import wraps
+from flask import _request_ctx_stack, request
+import sqlalchemy
+from sqlalchemy import event, orm, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import Pool
+from sqlalchemy.sql.expression import TextClause, UpdateBase
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+
+logger = logging.getLogger(__name__)
+
+#flask session key: when this user last wrote to the primary
+LAST_WRITE_KEY = '_db_write'
+
+#Replication lag in seconds per dialect, databases without a query here
+#(the sqlite stand-ins) only get a reachability check
+LAG_QUERIES = {
+    'postgresql': "SELECT CASE WHEN NOT pg_is_in_recovery() "
+                  "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                  "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END",
+}
+
+def replica_lag(engine):
+    with engine.connect() as connection:
+        query = LAG_QUERIES.get(engine.dialect.name)
+        if query is None:
+            connection.execute(text('SELECT 1'))
+            return 0.0
+        return float(connection.execute(text(query)).scalar() or 0)
+
+#The replicas of SQLALCHEMY_REPLICA_URIS with their last measured lag, engines are
+#rebuilt when the list changes. A replica that is unreachable or more than
+#DB_REPLICA_MAX_LAG seconds behind is left out until the next check.
+class ReplicaSet(object):
+    def __init__(self, db, app):
+        self.db = db
+        self.app = app
+        self._lock = threading.Lock()
+        self._engines = []
+        self._connected_for = ()
+        #engine -> (lag or None when unreachable, checked at)
+        self._lag = {}
+
+    def engines(self):
+        uris = tuple(self.app.config['SQLALCHEMY_REPLICA_URIS'] or ())
+        with self._lock:
+            if uris != self._connected_for:
+                for engine in self._engines:
+                    engine.dispose()
+                self._engines = [self.db.create_engine_for(self.app, uri) for uri in uris]
+                self._lag = {}
+                self._connected_for = uris
+            return self._engines
+
+    def lag(self, engine, now=None):
+        now = now or time.time()
+        lag, checked = self._lag.get(engine, (None, 0))
+        if now - checked >= self.app.config['DB_REPLICA_LAG_CHECK_INTERVAL']:
+            try:
+                lag = replica_lag(engine)
+            except Exception:
+                logger.warning('Replica %s is unreachable', engine.url.__to_string__(hide_password=True), exc_info=True)
+                lag = None
+            self._lag[engine] = (lag, now)
+        return lag
+
+    #A replica to read from, None when all of them are down or too far behind
+    def pick(self):
+        now = time.time()
+        max_lag = self.app.config['DB_REPLICA_MAX_LAG']
+        usable = []
+        for engine in self.engines():
+            lag = self.lag(engine, now)
+            if lag is not None and lag <= max_lag:
+                usable.append(engine)
+        return random.choice(usable) if usable else None
+
+    #(url, lag in seconds or None when unreachable) per replica
+    def status(self):
+        return [(engine.url.__to_string__(hide_password=True), self.lag(engine)) for engine in self.engines()]
+
+    def dispose(self):
+        with self._lock:
+            for engine in self._engines:
+                engine.dispose()
+
+#Sends the reads of views marked with replica_reads to a replica and everything
+#else to the primary. Once a request wrote, it and the next DB_REPLICA_MAX_LAG
+#seconds of that user's requests (kept in the session cookie) read from the
+#primary, so users see their own writes.
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._reads_from_replica(clause):
+            engine = self.db.replicas(self.app).pick()
+            if engine is not None:
+                return engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+    def _reads_from_replica(self, clause):
+        ctx = _request_ctx_stack.top
+        if ctx is None or not getattr(ctx, 'db_replica', False) or getattr(ctx, 'db_wrote', False):
+            return False
+        if self._flushing or isinstance(clause, (UpdateBase, TextClause)) \
+                or getattr(clause, '_for_update_arg', None) is not None:
+            return False
+        last_write = ctx.session.get(LAST_WRITE_KEY)
+        return last_write is None or time.time() - last_write > self.app.config['DB_REPLICA_MAX_LAG']
+
+#Reads of this request and of the user's next requests go to the primary, called on
+#every flush and by writes that bypass it (core statements)
+def remember_write():
+    ctx = _request_ctx_stack.top
+    if ctx is not None and ctx.app.config['SQLALCHEMY_REPLICA_URIS']:
+        ctx.db_wrote = True
+        ctx.session[LAST_WRITE_KEY] = time.time()
+
+def _remember_write(session, flush_context):
+    remember_write()
+
+#Statements run for a request are cancelled after DB_STATEMENT_TIMEOUT_MS:
+#Postgres through statement_timeout for the transaction, sqlite by interrupting
+#the statement from its progress handler.
+def _statement_timeout(session, transaction, connection):
+    timeout = session.app.config['DB_STATEMENT_TIMEOUT_MS']
+    if not timeout or _request_ctx_stack.top is None:
+        return
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SET LOCAL statement_timeout = {:d}'.format(int(timeout))))
+    elif connection.dialect.name == 'sqlite':
+        info = connection.info
+        info['statement_timeout'] = timeout / 1000.0
+        connection.connection.set_progress_handler(
+            lambda: time.time() > info.get('statement_deadline', float('inf')), 1000)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _statement_deadline(conn, cursor, statement, parameters, context, executemany):
+    timeout = conn.info.get('statement_timeout')
+    if timeout:
+        conn.info['statement_deadline'] = time.time() + timeout
+
+#connections go back to the pool (or the single connection of an in memory database
+#is released) without the limit
+@event.listens_for(Pool, 'reset')
+def _clear_statement_timeout(dbapi_connection, connection_record):
+    if connection_record is not None and connection_record.info.pop('statement_timeout', None):
+        connection_record.info.pop('statement_deadline', None)
+        dbapi_connection.set_progress_handler(None, 0)
+
+#Flask-SQLAlchemy with the pool settings applied to every engine, read replicas
+#and the routing session
+class RoutingSQLAlchemy(SQLAlchemy):
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_POOL_PRE_PING', True)
+        app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+        app.config.setdefault('DB_REPLICA_MAX_LAG', 5)
+        app.config.setdefault('DB_REPLICA_LAG_CHECK_INTERVAL', 5)
+        app.config.setdefault('DB_STATEMENT_TIMEOUT_MS', 0)
+        super(RoutingSQLAlchemy, self).init_app(app)
+        app.extensions['db_replicas'] = ReplicaSet(self, app)
+
+    def create_session(self, options):
+        factory = orm.sessionmaker(class_=RoutingSession, db=self, **options)
+        #on the factory, listeners of RoutingSession don't reach its sessions
+        event.listen(factory, 'after_flush', _remember_write)
+        event.listen(factory, 'after_begin', _statement_timeout)
+        return factory
+
+    def apply_driver_hacks(self, app, info, options):
+        if info.drivername.startswith('sqlite'):
+            #sqlite gets a static (in memory) or no pool, the sizes don't apply
+            for key in ('pool_size', 'max_overflow', 'pool_timeout'):
+                options.pop(key, None)
+        super(RoutingSQLAlchemy, self).apply_driver_hacks(app, info, options)
+        options['pool_pre_ping'] = app.config['SQLALCHEMY_POOL_PRE_PING']
+
+    def create_engine_for(self, app, uri):
+        info = make_url(uri)
+        options = {'convert_unicode': True}
+        self.apply_pool_defaults(app, options)
+        self.apply_driver_hacks(app, info, options)
+        return sqlalchemy.create_engine(info, **options)
+
+    def replicas(self, app=None):
+        return self.get_app(app).extensions['db_replicas']
+
+    #Close the pooled connections of the primary and the replicas, e.g. after a fork
+    def dispose_engines(self, app=None):
+        app = self.get_app(app)
+        self.get_engine(app).dispose()
+        self.replicas(app).dispose()
+
+#Let the queries of a read only view go to a replica (for `methods`, None: all)
+def replica_reads(methods=('GET', 'HEAD')):
+    def decorator(func):
+        @wraps(func)
+        def decorated_function(*args, **kwargs):
+            if methods is None or request.method in methods:
+                _request_ctx_stack.top.db_replica = True
+            return func(*args, **kwargs)
+
+        return decorated_function
+    return decorator
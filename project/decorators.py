@@ -1,17 +1,8 @@
 from functools import wraps
-from threading import Thread
-from flask import flash, redirect, url_for
-from flask_login import current_user
+from flask import flash, redirect, url_for, request, g
+from flask_login import current_user, login_required
+from project.token import check_upload_signature
 
-#function for threading 
-def async(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        thr = Thread(target=func, args=args, kwargs=kwargs)
-        thr.start()
-        
-    return wrapper
-    
 #check if user.confirmed=true
 def check_confirmed(func):
     @wraps(func)
@@ -31,4 +22,19 @@ def admin_required(func):
             return redirect(url_for('blog.home'))
         return func(*args, **kwargs) 
     
-    return decorated_function
\ No newline at end of file
+    return decorated_function
+    
+
+#serve requests carrying a valid ?sig= for `filename` without loading the user,
+#everyone else has to be logged in and confirmed
+def signature_or_login_required(func):
+    protected = login_required(check_confirmed(func))
+    @wraps(func)
+    def decorated_function(*args, **kwargs):
+        signature = request.args.get('sig')
+        if signature and check_upload_signature(kwargs['filename'], signature):
+            g.signed_request = True
+            return func(*args, **kwargs)
+        return protected(*args, **kwargs)
+    
+    return decorated_function
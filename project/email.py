@@ -1,18 +1,17 @@
-from threading import Thread
-from flask_mail import Message
-from project import app, mail
-from project.decorators import async
+from project import app, db
+from project.models import QueuedEmail
 import os
-@async
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
 
+#Queue the message in the caller's transaction, a mail worker (python manage.py mail_worker)
+#sends it once the caller commits. Nothing is sent when the caller rolls back.
 def send_email(to, subject, template):
-    msg = Message(
+    db.session.add(QueuedEmail(
+        to,
         subject,
-        recipients=[to],
-        html=template,
-        sender=(os.environ['APP_EMAIL_SENDER_NAME'],os.environ['APP_EMAIL_SENDER_ADDRESS'] )
-    )
-    send_async_email(app, msg)
+        template,
+        sender_name=os.environ['APP_EMAIL_SENDER_NAME'],
+        sender_address=os.environ['APP_EMAIL_SENDER_ADDRESS']
+    ))
+    if app.config['MAIL_QUEUE_IN_PROCESS']:
+        from project.mailqueue import ensure_worker
+        ensure_worker()
@@ -0,0 +1,100 @@
+import logging
+from collections import namedtuple
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from project import db
+from project.models import BlogPost, Comments, User, Upload
+
+logger = logging.getLogger(__name__)
+
+#One inserted, updated or deleted row of a watched model. `values` are the column
+#values loaded at flush time (they stay readable after the commit expired the
+#instance), `fields` the columns an update changed.
+Change = namedtuple('Change', ['model', 'op', 'id', 'values', 'fields'])
+
+OPS = ('insert', 'update', 'delete')
+
+#Model changes for the code that has to follow them (counters, search index,
+#caches), instead of Flask-SQLAlchemy tracking every object of every session.
+#
+#   @changes.on_flush(Comments, ops=('insert',))
+#   def comment_added(connection, change): ...  #in the flush, same transaction
+#
+#   @changes.on_commit(BlogPost)
+#   def posts_committed(changed): ...           #once per commit of db.session, the list of changes
+#
+#Only the watched models are recorded, writes that bypass the ORM (bulk
+#UPDATE/DELETE, core statements) are not seen.
+class ChangeBus(object):
+    def __init__(self, session, models=()):
+        self.session = session
+        self._models = set()
+        self._flush_handlers = []
+        self._commit_handlers = []
+        for model in models:
+            self.watch(model)
+        event.listen(session, 'after_commit', self._committed)
+        event.listen(session, 'after_rollback', self._rolled_back)
+
+    def watch(self, model):
+        if model in self._models:
+            return
+        self._models.add(model)
+        for op in OPS:
+            event.listen(model, 'after_' + op, self._recorder(op))
+
+    def on_flush(self, *models, ops=None):
+        return self._subscribe(self._flush_handlers, models, ops)
+
+    def on_commit(self, *models, ops=None):
+        return self._subscribe(self._commit_handlers, models, ops)
+
+    def unsubscribe(self, func):
+        self._flush_handlers = [handler for handler in self._flush_handlers if handler[2] != func]
+        self._commit_handlers = [handler for handler in self._commit_handlers if handler[2] != func]
+
+    def _subscribe(self, handlers, models, ops):
+        unwatched = [model.__name__ for model in models if model not in self._models]
+        if unwatched:
+            raise ValueError('Changes of {} are not recorded'.format(', '.join(unwatched)))
+
+        def decorator(func):
+            handlers.append((tuple(models), tuple(ops or OPS), func))
+            return func
+        return decorator
+
+    def _recorder(self, op):
+        def record(mapper, connection, target):
+            state = db.inspect(target)
+            columns = mapper.column_attrs
+            fields = frozenset(attr.key for attr in columns if state.attrs[attr.key].history.has_changes()) \
+                if op == 'update' else frozenset()
+            identity = mapper.primary_key_from_instance(target)
+            change = Change(mapper.class_, op, identity[0] if len(identity) == 1 else tuple(identity),
+                            dict((attr.key, state.dict[attr.key]) for attr in columns if attr.key in state.dict),
+                            fields)
+            for models, ops, func in self._flush_handlers:
+                if issubclass(change.model, models) and op in ops:
+                    func(connection, change)
+            session = object_session(target)
+            if session is not None:
+                session.info.setdefault('model_changes', []).append(change)
+        return record
+
+    def _committed(self, session):
+        changed = session.info.pop('model_changes', None)
+        if not changed:
+            return
+        for models, ops, func in self._commit_handlers:
+            matching = [change for change in changed if issubclass(change.model, models) and change.op in ops]
+            if matching:
+                #the data is committed, a failing subscriber must not turn that into an error
+                try:
+                    func(matching)
+                except Exception:
+                    logger.exception('Change subscriber %s failed', func.__name__)
+
+    def _rolled_back(self, session):
+        session.info.pop('model_changes', None)
+
+changes = ChangeBus(db.session, [BlogPost, Comments, User, Upload])
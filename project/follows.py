@@ -0,0 +1,51 @@
+from sqlalchemy import and_, exists, literal, select
+from sqlalchemy.dialects import postgresql
+from project import db
+from project.models import followers
+from project.counters import follow_counted
+from project.database import remember_write
+
+def _pair(follower_id, followed_id):
+    return and_(followers.c.follower_id == follower_id, followers.c.followed_id == followed_id)
+
+#One primary key lookup, stops at the first row
+def is_following(follower_id, followed_id):
+    return db.session.query(exists().where(_pair(follower_id, followed_id))).scalar()
+
+#Which of `user_ids` the user follows, in one query, e.g. for the authors on a page
+def following_ids(follower_id, user_ids):
+    user_ids = set(user_id for user_id in user_ids if user_id is not None)
+    if not user_ids:
+        return set()
+    return set(user_id for user_id, in db.session.query(followers.c.followed_id).filter(
+        followers.c.follower_id == follower_id, followers.c.followed_id.in_(user_ids)))
+
+#INSERT that skips an existing pair instead of failing on the primary key
+def _insert_new(dialect, follower_id, followed_id):
+    values = {'follower_id': follower_id, 'followed_id': followed_id}
+    if dialect == 'postgresql':
+        return postgresql.insert(followers).values(**values).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return followers.insert().prefix_with('OR IGNORE').values(**values)
+    if dialect == 'mysql':
+        return followers.insert().prefix_with('IGNORE').values(**values)
+    return followers.insert().from_select(['follower_id', 'followed_id'], select(
+        [literal(follower_id), literal(followed_id)]).where(~exists().where(_pair(follower_id, followed_id))))
+
+#Follow/unfollow in the current transaction without reading first, repeating them
+#changes nothing. Returns whether a row was added/removed, the counters only move then.
+def follow(follower_id, followed_id):
+    remember_write()
+    connection = db.session.connection()
+    added = connection.execute(_insert_new(connection.dialect.name, follower_id, followed_id)).rowcount == 1
+    if added:
+        follow_counted(connection, follower_id, followed_id, 1)
+    return added
+
+def unfollow(follower_id, followed_id):
+    remember_write()
+    connection = db.session.connection()
+    removed = connection.execute(followers.delete().where(_pair(follower_id, followed_id))).rowcount == 1
+    if removed:
+        follow_counted(connection, follower_id, followed_id, -1)
+    return removed
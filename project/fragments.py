@@ -0,0 +1,68 @@
+import uuid
+from jinja2 import nodes, Markup
+from jinja2.ext import Extension
+from project import app, db
+from project.cache import Cache
+from project.models import BlogPost, Comments, User
+from project.events import changes
+
+#Rendered template fragments, in their own size-bounded store (FRAGMENT_CACHE_*)
+fragments = Cache(app, config_prefix='FRAGMENT_CACHE')
+
+#A fragment key part is versioned when it is a model instance (its table and id)
+#or a tuple like ('comments', post.id), anything else goes into the key as is
+def _version_key(part):
+    if isinstance(part, db.Model):
+        return 'version:{}:{}'.format(part.__tablename__, part.id)
+    if isinstance(part, tuple):
+        return 'version:' + ':'.join(str(item) for item in part)
+
+def fragment_key(name, parts):
+    key = ['fragment', name]
+    for part in parts:
+        version_key = _version_key(part)
+        if version_key is None:
+            key.append(str(part))
+        else:
+            version = fragments.get_or_set(version_key, lambda: uuid.uuid4().hex[:8], 0)
+            key.append('{}={}'.format(version_key[len('version:'):], version))
+    return ':'.join(key)
+
+#A new version for `parts`
+def invalidate(*parts):
+    for part in parts:
+        fragments.delete(_version_key(part))
+
+#{% cache 'post_body', post %}...{% endcache %}
+class FragmentCacheExtension(Extension):
+    tags = set(['cache'])
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [args[0], nodes.List(args[1:])]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render(self, name, parts, caller):
+        key = fragment_key(name, parts)
+        return Markup(fragments.get_or_set(key, lambda: str(caller())))
+
+app.jinja_env.add_extension(FragmentCacheExtension)
+
+#Fragments get new versions once the changes are committed
+@changes.on_commit(BlogPost, ops=('update', 'delete'))
+def posts_changed(changed):
+    invalidate(*set(('posts', change.id) for change in changed))
+
+@changes.on_commit(Comments)
+def comments_changed(changed):
+    invalidate(*set(('comments', change.values.get('post_id')) for change in changed))
+
+#Comment blocks show the author's name and picture
+@changes.on_commit(User, ops=('update',))
+def users_changed(changed):
+    if any(change.fields & set(['name', 'image_url']) for change in changed):
+        invalidate(('users',))
@@ -0,0 +1,333 @@
+import hashlib
+import re
+import uuid
+from collections import namedtuple
+from html.parser import HTMLParser
+from jinja2 import Markup, escape
+from sqlalchemy import event, select, text
+from sqlalchemy.engine.url import make_url
+from project import app, db, search, cache
+from project.models import BlogPost
+
+#Highlight markers, private use characters that can't clash with the escaped text around them
+MARK_START = '\ue000'
+MARK_END = '\ue001'
+
+#Post content is CKEditor HTML, only its text is indexed
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style') and self._skip:
+            self._skip -= 1
+        elif tag in ('p', 'div', 'br', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'tr'):
+            self.parts.append(' ')
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+def strip_html(html):
+    parser = _TextExtractor()
+    parser.feed(html or '')
+    parser.close()
+    return ' '.join(''.join(parser.parts).split())
+
+#Escape highlighted text from the index and turn the markers into <mark>
+def marked(value):
+    value = str(escape(value or ''))
+    return Markup(value.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower(), re.UNICODE)
+
+#title and snippet are Markup with the matched terms in <mark>
+SearchHit = namedtuple('SearchHit', 'post_id title snippet rank')
+
+class SearchResults(object):
+    def __init__(self, hits, total, page, per_page):
+        self.hits = hits
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+        self.posts = {}
+
+    @property
+    def has_next(self):
+        return self.page * self.per_page < self.total
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    #(hit, post) pairs in rank order, once load_posts() ran
+    def __iter__(self):
+        for hit in self.hits:
+            if hit.post_id in self.posts:
+                yield hit, self.posts[hit.post_id]
+
+    def load_posts(self, options=()):
+        ids = [hit.post_id for hit in self.hits]
+        if ids:
+            self.posts = dict((post.id, post) for post in
+                              BlogPost.query.options(*options).filter(BlogPost.id.in_(ids)))
+        return self
+
+class PostgresBackend(object):
+    name = 'postgresql'
+
+    def __init__(self, language='english'):
+        self.language = language
+
+    def create(self, connection):
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS post_search ('
+            'post_id INTEGER PRIMARY KEY REFERENCES posts (id) ON DELETE CASCADE, '
+            'title TEXT NOT NULL, body TEXT NOT NULL, document TSVECTOR NOT NULL)'))
+        connection.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_post_search_document ON post_search USING GIN (document)'))
+
+    def drop(self, connection):
+        connection.execute(text('DROP TABLE IF EXISTS post_search'))
+
+    #Upsert, the title is weighted A and the body B
+    def index(self, connection, documents):
+        params = [{'id': id, 'title': title, 'body': body, 'language': self.language}
+                  for id, title, body in documents]
+        if params:
+            connection.execute(text(
+                "INSERT INTO post_search (post_id, title, body, document) VALUES (:id, :title, :body, "
+                "setweight(to_tsvector(CAST(:language AS regconfig), :title), 'A') || "
+                "setweight(to_tsvector(CAST(:language AS regconfig), :body), 'B')) "
+                "ON CONFLICT (post_id) DO UPDATE SET title = EXCLUDED.title, body = EXCLUDED.body, "
+                "document = EXCLUDED.document"), params)
+
+    def remove(self, connection, post_ids):
+        if post_ids:
+            connection.execute(text('DELETE FROM post_search WHERE post_id = :id'),
+                               [{'id': id} for id in post_ids])
+
+    #Rows of deleted posts, the foreign key normally removes them already
+    def remove_missing(self, connection):
+        connection.execute(text('DELETE FROM post_search WHERE post_id NOT IN (SELECT id FROM posts)'))
+
+    #Rank every match, but only build headlines for the rows on the page
+    def search(self, connection, query, page, per_page):
+        options = 'StartSel={}, StopSel={}, HighlightAll=TRUE'.format(MARK_START, MARK_END)
+        snippet_options = 'StartSel={}, StopSel={}, MaxFragments=2, MaxWords=30, MinWords=10'.format(MARK_START, MARK_END)
+        rows = connection.execute(text(
+            'SELECT hit.post_id, hit.rank, hit.total, '
+            'ts_headline(CAST(:language AS regconfig), hit.title, hit.query, :options), '
+            'ts_headline(CAST(:language AS regconfig), hit.body, hit.query, :snippet_options) '
+            'FROM (SELECT s.post_id, s.title, s.body, q.query, ts_rank_cd(s.document, q.query) AS rank, '
+            'count(*) OVER () AS total '
+            'FROM post_search s, plainto_tsquery(CAST(:language AS regconfig), :query) AS q(query) '
+            'WHERE s.document @@ q.query ORDER BY rank DESC, s.post_id DESC LIMIT :limit OFFSET :offset) AS hit '
+            'ORDER BY hit.rank DESC, hit.post_id DESC'),
+            {'language': self.language, 'query': query, 'options': options, 'snippet_options': snippet_options,
+             'limit': per_page, 'offset': (page - 1) * per_page}).fetchall()
+        hits = [SearchHit(row[0], marked(row[3]), marked(row[4]), row[1]) for row in rows]
+        return SearchResults(hits, rows[0][2] if rows else 0, page, per_page)
+
+#FTS5 virtual table, rowid is the post id
+class SQLiteBackend(object):
+    name = 'sqlite'
+
+    def create(self, connection):
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS post_search USING fts5(title, body, tokenize='porter unicode61')"))
+
+    def drop(self, connection):
+        connection.execute(text('DROP TABLE IF EXISTS post_search'))
+
+    def index(self, connection, documents):
+        params = [{'id': id, 'title': title, 'body': body} for id, title, body in documents]
+        if params:
+            connection.execute(text('INSERT OR REPLACE INTO post_search (rowid, title, body) VALUES (:id, :title, :body)'),
+                               params)
+
+    def remove(self, connection, post_ids):
+        if post_ids:
+            connection.execute(text('DELETE FROM post_search WHERE rowid = :id'), [{'id': id} for id in post_ids])
+
+    def remove_missing(self, connection):
+        connection.execute(text('DELETE FROM post_search WHERE rowid NOT IN (SELECT id FROM posts)'))
+
+    #bm25 with the title weighted 10:1 over the body, lower is better
+    def search(self, connection, query, page, per_page):
+        terms = search_terms(query)
+        if not terms:
+            return SearchResults([], 0, page, per_page)
+        match = ' '.join('"{}"'.format(term) for term in terms)
+        rows = connection.execute(text(
+            'SELECT rowid, bm25(post_search, 10.0, 1.0) AS rank, '
+            'highlight(post_search, 0, :start, :end), snippet(post_search, 1, :start, :end, :ellipsis, 32) '
+            'FROM post_search WHERE post_search MATCH :match ORDER BY rank, rowid DESC LIMIT :limit OFFSET :offset'),
+            {'match': match, 'start': MARK_START, 'end': MARK_END, 'ellipsis': '…',
+             'limit': per_page, 'offset': (page - 1) * per_page}).fetchall()
+        #auxiliary functions can't be used with window functions, count separately
+        total = connection.execute(text('SELECT count(*) FROM post_search WHERE post_search MATCH :match'),
+                                   {'match': match}).scalar()
+        hits = [SearchHit(row[0], marked(row[2]), marked(row[3]), -row[1]) for row in rows]
+        return SearchResults(hits, total, page, per_page)
+
+#flask-msearch's whoosh index on local disk, for databases without full-text search
+class WhooshBackend(object):
+    name = 'whoosh'
+
+    def create(self, connection):
+        pass
+
+    def drop(self, connection):
+        pass
+
+    def index(self, connection, documents):
+        index = search._index(BlogPost)
+        for id, title, body in documents:
+            index.update(id=str(id), title=title, content=body)
+        index.commit()
+
+    def remove(self, connection, post_ids):
+        index = search._index(BlogPost)
+        for id in post_ids:
+            index.delete(fieldname='id', text=str(id))
+        index.commit()
+
+    def remove_missing(self, connection):
+        #msearch has no public way to list the indexed ids
+        with search._index(BlogPost)._client.searcher() as searcher:
+            indexed = set(int(fields['id']) for fields in searcher.all_stored_fields())
+        missing = indexed - set(id for id, in connection.execute(select([BlogPost.id])))
+        if missing:
+            self.remove(connection, missing)
+
+    def search(self, connection, query, page, per_page):
+        terms = search_terms(query)
+        ids = [int(hit['id']) for hit in search.msearch(BlogPost, query)] if terms else []
+        page_ids = ids[(page - 1) * per_page:page * per_page]
+        rows = dict((row.id, row) for row in connection.execute(
+            BlogPost.__table__.select().where(BlogPost.id.in_(page_ids)))) if page_ids else {}
+        hits = [SearchHit(id, highlight(rows[id].title, terms), highlight(excerpt(strip_html(rows[id].content), terms), terms),
+                          len(ids) - i) for i, id in enumerate(page_ids) if id in rows]
+        return SearchResults(hits, len(ids), page, per_page)
+
+#~`length` characters of `body` around the first matched term
+def excerpt(body, terms, length=200):
+    lower = body.lower()
+    positions = [lower.find(term) for term in terms if lower.find(term) >= 0]
+    start = max(0, min(positions) - length // 4) if positions else 0
+    return ('…' if start else '') + body[start:start + length] + ('…' if start + length < len(body) else '')
+
+def highlight(value, terms):
+    if terms:
+        pattern = re.compile('({})'.format('|'.join(re.escape(term) for term in terms)), re.IGNORECASE)
+        value = pattern.sub(MARK_START + r'\1' + MARK_END, value)
+    return marked(value)
+
+BACKENDS = {
+    'postgresql': PostgresBackend,
+    'sqlite': SQLiteBackend,
+    'whoosh': WhooshBackend,
+}
+
+#SEARCH_BACKEND, or the database's own full-text search (whoosh for anything else)
+def backend_name(config):
+    name = config.get('SEARCH_BACKEND')
+    if name:
+        return name
+    dialect = make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+    return dialect if dialect in ('postgresql', 'sqlite') else 'whoosh'
+
+_backend = None
+
+def backend():
+    global _backend
+    if _backend is None:
+        name = backend_name(app.config)
+        if name not in BACKENDS:
+            raise ValueError('Unknown SEARCH_BACKEND "{}"'.format(name))
+        _backend = PostgresBackend(app.config['SEARCH_LANGUAGE']) if name == 'postgresql' else BACKENDS[name]()
+    return _backend
+
+def document(post):
+    return post.id, post.title, strip_html(post.content)
+
+#Lowercased terms, so "Flask  Blog" and "flask blog" share a cache entry
+def normalize_query(query):
+    return ' '.join(search_terms(query))
+
+#Dropped whenever the index changes, every cached result page embeds it
+SEARCH_VERSION_KEY = 'search:version'
+
+def search_version():
+    return cache.get_or_set(SEARCH_VERSION_KEY, lambda: uuid.uuid4().hex[:12], 0)
+
+def _changes_key(version):
+    return 'search:changes:{}'.format(version)
+
+#Start a new version, returns (old, new). `changes` (what changed since the old version)
+#is stored for the new version before it is switched to, for `timeout` seconds.
+def bump_search_version(changes=None, timeout=None):
+    old = cache.get(SEARCH_VERSION_KEY)
+    new = uuid.uuid4().hex[:12]
+    if changes is not None:
+        cache.set(_changes_key(new), (old, changes), timeout)
+    cache.set(SEARCH_VERSION_KEY, new, 0)
+    return old, new
+
+#(previous version, changes) for `version`, None when it was a full rebuild or has expired
+def version_changes(version):
+    return cache.get(_changes_key(version))
+
+#Ranked, highlighted page of posts matching `query`. The hits of a page (ids, rank and
+#highlights) are cached per normalized query until the index changes.
+def search_posts(query, page=1, per_page=10, options=()):
+    query = normalize_query(query)
+    if not query:
+        return SearchResults([], 0, page, per_page)
+    key = 'search:{}:{}:{}:{}'.format(search_version(), page, per_page,
+                                      hashlib.sha1(query.encode('utf-8')).hexdigest())
+
+    def run():
+        results = backend().search(db.session.connection(), query, page, per_page)
+        return results.hits, results.total
+
+    hits, total = cache.get_or_set(key, run, app.config['SEARCH_CACHE_TIMEOUT'])
+    return SearchResults(hits, total, page, per_page).load_posts(options)
+
+#Rebuild the whole index in batches of `batch_size` posts, returns the number indexed.
+#The batches are upserted over the live index and deleted posts are removed at the end,
+#searches keep finding every post while it runs (or after it died halfway).
+def reindex(batch_size=500):
+    engine = backend()
+    count = 0
+    last_id = 0
+    while True:
+        posts = BlogPost.query.filter(BlogPost.id > last_id).order_by(BlogPost.id).limit(batch_size).all()
+        if not posts:
+            break
+        engine.index(db.session.connection(), [document(post) for post in posts])
+        db.session.commit()
+        count += len(posts)
+        last_id = posts[-1].id
+        db.session.expunge_all()
+    engine.remove_missing(db.session.connection())
+    db.session.commit()
+    bump_search_version()
+    return count
+
+#The index table is created and dropped along with the models (create_all/drop_all)
+@event.listens_for(db.metadata, 'after_create')
+def _create_index(target, connection, **kw):
+    backend().create(connection)
+
+@event.listens_for(db.metadata, 'before_drop')
+def _drop_index(target, connection, **kw):
+    backend().drop(connection)
@@ -0,0 +1,180 @@
+import datetime
+import hashlib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from jinja2 import Markup, escape
+from PIL import Image
+from project import app, db
+from project.models import ImageJob, User
+from project.uploads import refresh_upload
+
+logger = logging.getLogger(__name__)
+
+#File extension and mime type per output format
+FORMAT_EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp', 'avif': 'avif'}
+FORMAT_TYPES = {'jpeg': 'image/jpeg', 'webp': 'image/webp', 'avif': 'image/avif'}
+
+#Variants are named <content hash>-<width>.<ext>
+VARIANT_NAME = re.compile(r'^(?P<digest>[0-9a-f]{16})-(?P<width>\d+)\.(?P<ext>jpg|webp|avif)$')
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+def variant_name(digest, width, fmt):
+    return '{}-{}.{}'.format(digest, width, FORMAT_EXTENSIONS[fmt])
+
+#Name the untouched upload is kept under until (and after) its variants exist
+def original_name(digest, fext):
+    return '{}.orig{}'.format(digest, fext.lower())
+
+#Configured formats this Pillow build can write, jpeg always last as the <img> fallback
+def image_formats():
+    Image.init()
+    formats = [fmt for fmt in app.config['IMAGE_FORMATS'] if fmt.upper() in Image.SAVE]
+    if 'jpeg' in formats:
+        formats.remove('jpeg')
+    return formats + ['jpeg']
+
+def image_widths(kind):
+    return sorted(app.config['IMAGE_VARIANTS'][kind]['widths'])
+
+def default_width(kind):
+    return app.config['IMAGE_VARIANTS'][kind]['default']
+
+#Runs in the process pool: write every width/format of `source` into `directory`.
+#Files that already exist are the same content (hashed name) and are skipped.
+def make_variants(source, directory, digest, widths, formats, quality):
+    img = Image.open(source)
+    img.load()
+    if img.mode not in ('RGB', 'RGBA', 'L'):
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    written = []
+    for width in widths:
+        variant = img.copy()
+        #bound the width only, never upscale
+        variant.thumbnail((width, width * 100), Image.ANTIALIAS)
+        for fmt in formats:
+            target = os.path.join(directory, variant_name(digest, width, fmt))
+            if os.path.exists(target):
+                continue
+            out = variant
+            if fmt == 'jpeg' and out.mode not in ('RGB', 'L'):
+                out = out.convert('RGB')
+            options = {'quality': quality[fmt]}
+            if fmt == 'jpeg':
+                options.update(optimize=True, progressive=True)
+            tmp = '{}.tmp'.format(target)
+            out.save(tmp, format=fmt.upper(), **options)
+            os.replace(tmp, target)
+            written.append(target)
+    return written
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+#One pool per (forked) worker process
+def executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(max_workers=app.config['IMAGE_WORKERS'])
+            _executor_pid = os.getpid()
+    return _executor
+
+#Record the outcome of a job and point the user at the processed picture, or back at
+#the previous one when it failed. The change bus drops the cached comment blocks and
+#session user on commit.
+def finish_job(session, job_id, error=None):
+    job = session.query(ImageJob).get(job_id)
+    job.finished_on = datetime.datetime.utcnow()
+    if error is not None:
+        job.status = 'failed'
+        job.error = str(error)[:500]
+        logger.error('Image job %s failed: %s', job_id, error)
+        if job.kind == 'profile':
+            user = session.query(User).get(job.user_id)
+            #unless the user has uploaded another picture since
+            if user.image_url == source_url(job):
+                user.image_url = job.previous_url
+    else:
+        job.status = 'done'
+        if job.kind == 'profile':
+            session.query(User).get(job.user_id).image_url = job.target_url
+    session.commit()
+    if error is None and job.kind == 'upload':
+        refresh_upload(session, job.target_path)
+
+#Where the untouched original is served while the job runs
+def source_url(job):
+    return job.target_url.rsplit('/', 1)[0] + '/' + os.path.basename(job.source_path)
+
+#Pool callback, may run on the request thread if the job is already done, so use a session
+#of its own (from the factory of db.session, which the change bus listens on)
+def _job_done(job_id, future):
+    with app.app_context():
+        session = db.session.session_factory()
+        try:
+            finish_job(session, job_id, future.exception())
+        finally:
+            session.close()
+
+#Queue the variants of an already saved original, returns the ImageJob.
+#The job's target is the default variant, which is what image_url/the editor point at,
+#`previous_url` the profile picture to go back to if the job fails.
+def process_image(kind, user_id, source_path, directory, digest, url_base, previous_url=None):
+    name = variant_name(digest, default_width(kind), 'jpeg')
+    job = ImageJob(kind, user_id, source_path, os.path.join(directory, name), url_base.rstrip('/') + '/' + name,
+                   previous_url)
+    db.session.add(job)
+    db.session.commit()
+    args = (source_path, directory, digest, image_widths(kind), image_formats(), app.config['IMAGE_QUALITY'])
+    if app.config['IMAGE_PROCESSING_SYNC']:
+        try:
+            make_variants(*args)
+        except Exception as error:
+            finish_job(db.session, job.id, error)
+        else:
+            finish_job(db.session, job.id)
+        return job
+    future = executor().submit(make_variants, *args)
+    job_id = job.id
+    future.add_done_callback(lambda future: _job_done(job_id, future))
+    return job
+
+#The untouched original for a variant that has not been written yet, or None
+def pending_original(directory, filename):
+    match = VARIANT_NAME.match(filename)
+    if match is None:
+        return None
+    prefix = match.group('digest') + '.orig'
+    for name in os.listdir(directory):
+        if name.startswith(prefix):
+            return name
+
+#Only one entry per image in the editor's file browser: the default variant, gifs and svgs
+def is_listed_upload(filename):
+    match = VARIANT_NAME.match(filename)
+    if match is not None:
+        return int(match.group('width')) == default_width('upload') and match.group('ext') == 'jpg'
+    return '.orig' not in filename and not filename.endswith('.tmp')
+
+def srcset(url, kind, fmt='jpeg'):
+    base, name = url.rsplit('/', 1)
+    digest = VARIANT_NAME.match(name).group('digest')
+    return ', '.join('{}/{} {}w'.format(base, variant_name(digest, width, fmt), width)
+                     for width in image_widths(kind))
+
+#<picture> with a srcset per format for a variant url, a plain <img> for anything else
+@app.template_global()
+def responsive_image(url, kind, sizes='100vw', alt='', class_=''):
+    img = '<img src="{}" alt="{}" class="{}"'.format(escape(url), escape(alt), escape(class_))
+    if not VARIANT_NAME.match(url.rsplit('/', 1)[-1]):
+        return Markup(img + '/>')
+    sources = ['<source type="{}" srcset="{}" sizes="{}">'.format(FORMAT_TYPES[fmt], escape(srcset(url, kind, fmt)), escape(sizes))
+               for fmt in image_formats() if fmt != 'jpeg']
+    img += ' srcset="{}" sizes="{}"/>'.format(escape(srcset(url, kind)), escape(sizes))
+    return Markup('<picture>{}{}</picture>'.format(''.join(sources), img))
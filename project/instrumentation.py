@@ -0,0 +1,147 @@
+import cProfile
+import datetime
+import logging
+import os
+import random
+import time
+from flask import _request_ctx_stack, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from project import app
+
+logger = logging.getLogger(__name__)
+
+#What one request spent, kept on its request context
+class RequestStats(object):
+    __slots__ = ('start', 'sql_count', 'sql_time', 'statements', 'template_time', 'bytes_sent', '_templates',
+                 'profiler')
+
+    def __init__(self):
+        self.start = time.time()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        #(seconds, statement), only the slowest PERF_SLOW_LOG_STATEMENTS are logged
+        self.statements = []
+        self.template_time = 0.0
+        #body size, for streamed responses counted as it is sent
+        self.bytes_sent = 0
+        self._templates = []
+        self.profiler = None
+
+def current_stats():
+    ctx = _request_ctx_stack.top
+    return getattr(ctx, 'perf', None) if ctx is not None else None
+
+#Every engine (and every thread): only statements run for a request are counted
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('perf_query_start', []).append(time.time())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.time() - conn.info['perf_query_start'].pop()
+    stats = current_stats()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.sql_time += elapsed
+        stats.statements.append((elapsed, statement))
+
+@event.listens_for(Engine, 'handle_error')
+def _execute_failed(context):
+    if context.connection is not None and context.connection.info.get('perf_query_start'):
+        context.connection.info['perf_query_start'].pop()
+
+#render_template() calls, included templates are part of the one including them
+@before_render_template.connect_via(app)
+def _template_started(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None:
+        stats._templates.append(time.time())
+
+@template_rendered.connect_via(app)
+def _template_done(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None and stats._templates:
+        started = stats._templates.pop()
+        #nested renders are already counted by the outer one
+        if not stats._templates:
+            stats.template_time += time.time() - started
+
+def _profiled(endpoint):
+    return endpoint in app.config['PERF_PROFILE_ENDPOINTS'] and \
+        random.random() < app.config['PERF_PROFILE_SAMPLE_RATE']
+
+@app.before_request
+def start_request_stats():
+    if not app.config['PERF_INSTRUMENTATION']:
+        return
+    stats = RequestStats()
+    if _profiled(request.endpoint):
+        stats.profiler = cProfile.Profile()
+        stats.profiler.enable()
+    _request_ctx_stack.top.perf = stats
+
+def _save_profile(profiler, endpoint):
+    directory = app.config['PERF_PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    name = '{}-{}-{}.prof'.format(endpoint, datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S%f'), os.getpid())
+    profiler.dump_stats(os.path.join(directory, name))
+
+def _log_slow_request(stats, total, method, path, endpoint, status):
+    slowest = sorted(stats.statements, key=lambda item: item[0], reverse=True)[:app.config['PERF_SLOW_LOG_STATEMENTS']]
+    logger.warning('Slow request %s %s (%s) %d: %.1f ms, %d queries in %.1f ms, templates %.1f ms, %d bytes%s',
+                   method, path, endpoint, status, total * 1000,
+                   stats.sql_count, stats.sql_time * 1000, stats.template_time * 1000, stats.bytes_sent,
+                   ''.join('\n  {:.1f} ms: {}'.format(elapsed * 1000, ' '.join(statement.split()))
+                           for elapsed, statement in slowest))
+
+#Passes the body of a streamed response through, counting its bytes
+def _counted(iterable, stats, charset):
+    try:
+        for chunk in iterable:
+            stats.bytes_sent += len(chunk.encode(charset) if isinstance(chunk, str) else chunk)
+            yield chunk
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+@app.after_request
+def finish_request_stats(response):
+    stats = current_stats()
+    if stats is None:
+        return response
+    _request_ctx_stack.top.perf = None
+    total = time.time() - stats.start
+    if stats.profiler is not None:
+        stats.profiler.disable()
+        _save_profile(stats.profiler, request.endpoint)
+    streamed = response.content_length is None
+    if not streamed:
+        stats.bytes_sent = response.content_length
+    if app.config['PERF_SERVER_TIMING']:
+        response.headers.add('Server-Timing', 'db;dur={:.1f};desc="{} queries"'.format(stats.sql_time * 1000, stats.sql_count))
+        response.headers.add('Server-Timing', 'tpl;dur={:.1f}'.format(stats.template_time * 1000))
+        response.headers.add('Server-Timing', 'app;dur={:.1f}'.format(total * 1000))
+        #the size of a streamed body is only known after the headers went out
+        if not streamed:
+            response.headers.add('Server-Timing', 'size;desc="{} bytes"'.format(stats.bytes_sent))
+    args = (request.method, request.path, request.endpoint, response.status_code)
+
+    def finished():
+        elapsed = time.time() - stats.start
+        if elapsed * 1000 >= app.config['PERF_SLOW_REQUEST_MS']:
+            _log_slow_request(stats, elapsed, *args)
+    if streamed:
+        #sending the body counts too, the request is logged once it is closed
+        response.response = _counted(response.response, stats, response.charset)
+        response.call_on_close(finished)
+    else:
+        finished()
+    return response
+
+#PERF_SLOW_LOG_PATH gets the slow requests in a file of their own
+if app.config.get('PERF_SLOW_LOG_PATH'):
+    _handler = logging.FileHandler(app.config['PERF_SLOW_LOG_PATH'])
+    _handler.setFormatter(logging.Formatter('%(asctime)s [%(process)d] %(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.WARNING)
@@ -0,0 +1,139 @@
+import datetime
+import logging
+import threading
+import time
+from flask_mail import Message
+from sqlalchemy import func
+from project import app, db, mail as flask_mail
+from project.models import QueuedEmail
+
+logger = logging.getLogger(__name__)
+
+#Sends queued mail in batches, one SMTP connection per batch.
+#A claimed message is leased by pushing next_attempt_at forward, so mail
+#claimed by a worker that dies is picked up again once the lease expires.
+class MailWorker(object):
+    def __init__(self, app=app, mail=flask_mail):
+        self.app = app
+        self.mail = mail
+        config = app.config
+        self.workers = config['MAIL_QUEUE_WORKERS']
+        self.batch_size = config['MAIL_QUEUE_BATCH_SIZE']
+        self.max_attempts = config['MAIL_QUEUE_MAX_ATTEMPTS']
+        self.retry_delay = config['MAIL_QUEUE_RETRY_DELAY']
+        self.lease = config['MAIL_QUEUE_LEASE']
+        self.poll_interval = config['MAIL_QUEUE_POLL_INTERVAL']
+        self._claim_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def claim_batch(self):
+        now = datetime.datetime.utcnow()
+        with self._claim_lock:
+            query = QueuedEmail.query.filter(QueuedEmail.status == 'pending',
+                                             QueuedEmail.next_attempt_at <= now) \
+                .order_by(QueuedEmail.id).limit(self.batch_size)
+            if db.engine.dialect.name == 'postgresql':
+                query = query.with_for_update(skip_locked=True)
+            batch = query.all()
+            for queued in batch:
+                queued.next_attempt_at = now + datetime.timedelta(seconds=self.lease)
+            db.session.commit()
+        return batch
+
+    def message(self, queued):
+        sender = None
+        if queued.sender_address:
+            sender = (queued.sender_name, queued.sender_address)
+        return Message(queued.subject, recipients=[queued.recipient], html=queued.html, sender=sender)
+
+    def failed(self, queued, error):
+        queued.attempts += 1
+        queued.last_error = str(error)[:500]
+        if queued.attempts >= self.max_attempts:
+            queued.status = 'failed'
+            logger.error('Giving up on %r: %s', queued, error)
+        else:
+            delay = self.retry_delay * 2 ** (queued.attempts - 1)
+            queued.next_attempt_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
+            logger.warning('Retrying %r in %ss: %s', queued, delay, error)
+
+    #Claim and send one batch, returns the number of messages claimed
+    def process_batch(self):
+        batch = self.claim_batch()
+        if not batch:
+            return 0
+        done = []
+        try:
+            with self.mail.connect() as connection:
+                for queued in batch:
+                    try:
+                        connection.send(self.message(queued))
+                    except Exception as error:
+                        self.failed(queued, error)
+                    else:
+                        queued.status = 'sent'
+                        queued.sent_on = datetime.datetime.utcnow()
+                    done.append(queued)
+        except Exception as error:
+            #lost the SMTP connection, retry everything that was not tried yet
+            for queued in batch:
+                if queued not in done:
+                    self.failed(queued, error)
+        db.session.commit()
+        return len(batch)
+
+    def _run(self):
+        with self.app.app_context():
+            while not self._stop.is_set():
+                try:
+                    claimed = self.process_batch()
+                except Exception:
+                    logger.exception('Mail worker batch failed')
+                    db.session.rollback()
+                    claimed = 0
+                finally:
+                    db.session.remove()
+                if not claimed:
+                    self._stop.wait(self.poll_interval)
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name='mail-worker-{}'.format(i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    #Run the pool in the foreground until interrupted
+    def run(self):
+        self.start()
+        try:
+            while any(thread.is_alive() for thread in self._threads):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+#Counts per status and the age of the oldest pending message
+def queue_status():
+    counts = dict(db.session.query(QueuedEmail.status, func.count(QueuedEmail.id))
+                  .group_by(QueuedEmail.status).all())
+    oldest = db.session.query(func.min(QueuedEmail.created_on)) \
+        .filter(QueuedEmail.status == 'pending').scalar()
+    return counts, oldest
+
+_worker = None
+_worker_lock = threading.Lock()
+
+#Start the worker pool inside this process (MAIL_QUEUE_IN_PROCESS), once per process
+def ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = MailWorker()
+            _worker.start()
+    return _worker
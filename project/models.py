@@ -1,4 +1,5 @@
-from project import db, bcrypt
+from project import db
+from project.passwords import hash_password
 import datetime
 from sqlalchemy import ForeignKey, UniqueConstraint
 from sqlalchemy.orm import relationship
@@ -14,9 +15,11 @@ class BlogPost(db.Model):
     content = db.Column(db.Text, nullable=False)
     slug = db.Column(db.String, unique=True, index=True)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-    timestamp = db.Column(db.DateTime, nullable=True, index=True)
-    comments = db.relationship('Comments', backref='postid', foreign_keys="[Comments.post_id]")
-    comments_post_title = db.relationship('Comments', backref="posttitle",foreign_keys="[Comments.comment_post_title]", lazy="dynamic")
+    timestamp = db.Column(db.DateTime, nullable=False, index=True)
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    #comments are removed with a bulk DELETE / ON DELETE CASCADE, don't load them to delete a post
+    comments = db.relationship('Comments', backref='postid', foreign_keys="[Comments.post_id]", passive_deletes=True)
+    comments_post_title = db.relationship('Comments', backref="posttitle",foreign_keys="[Comments.comment_post_title]", lazy="dynamic", passive_deletes=True)
     
 
     def __init__(self, title, content, slug, author_id, timestamp):
@@ -32,12 +35,16 @@ class BlogPost(db.Model):
 class Comments(db.Model): 
     
     __tablename__ = "comments"
+    #keyset pagination of a post's comments
+    __table_args__ = (
+        db.Index('ix_comments_post_id_timestamp_id', 'post_id', 'timestamp', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     comment_content = db.Column(db.String)
-    timestamp = db.Column(db.DateTime)
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'))
-    comment_post_title = db.Column(db.String, db.ForeignKey('posts.slug'))
+    timestamp = db.Column(db.DateTime, nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'))
+    comment_post_title = db.Column(db.String, db.ForeignKey('posts.slug', ondelete='CASCADE'))
     comment_user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     
     
@@ -52,10 +59,12 @@ class Comments(db.Model):
         return '<comment {}'.format(self.comment_content)
  
 
+#The primary key answers whom a user follows, the index who follows a user
 followers = db.Table(
     'followers',
-    db.Column('follower_id', db.Integer, db.ForeignKey('users.id')),
-    db.Column('followed_id', db.Integer, db.ForeignKey('users.id'))
+    db.Column('follower_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
+    db.Column('followed_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
+    db.Index('ix_followers_followed_id_follower_id', 'followed_id', 'follower_id')
 )
 
 class User(db.Model):
@@ -74,20 +83,24 @@ class User(db.Model):
     image_url = db.Column(db.String, default=None, nullable=True)
     admin = db.Column(db.Boolean, nullable=False, default=False)
     role = db.Column(db.String, default=None, nullable=True)
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    follower_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    following_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     posts = db.relationship('BlogPost', backref='author', lazy='dynamic')
     comments = db.relationship('Comments', backref='comment_author', lazy='dynamic')
+    #for reading, follows are written by project/follows.py
     followed = db.relationship('User', 
                                 secondary=followers, 
                                 primaryjoin=(followers.c.follower_id == id), 
                                 secondaryjoin=(followers.c.followed_id == id),
-                                backref=db.backref('followers', lazy='dynamic'),
-                                lazy='dynamic')
+                                backref=db.backref('followers', lazy='dynamic', viewonly=True),
+                                lazy='dynamic', viewonly=True)
     
 
     def __init__(self, name, email, password, confirmed, role, admin, confirmed_on=None, about=None, last_seen=None, image_url=None ):
         self.name = name
         self.email = email
-        self.password = bcrypt.generate_password_hash(password).decode('utf-8') 
+        self.password = hash_password(password)
         self.registered_on= datetime.datetime.now()
         self.confirmed = confirmed
         self.confirmed_on = confirmed_on
@@ -112,15 +125,128 @@ class User(db.Model):
     def __repr__(self):
         return '{}'.format(self.name)
 
+    #Whether the row was added/removed, in the current transaction
     def follow(self, user):
-        if not self.is_following(user):
-            self.followed.append(user)
-            return self
+        from project.follows import follow
+        return follow(self.id, user.id)
 
     def unfollow(self, user):
-        if self.is_following(user):
-            self.followed.remove(user)
-            return self
+        from project.follows import unfollow
+        return unfollow(self.id, user.id)
 
     def is_following(self, user):
-        return self.followed.filter(followers.c.followed_id == user.id).count() > 0
\ No newline at end of file
+        from project.follows import is_following
+        return is_following(self.id, user.id)
+
+class QueuedEmail(db.Model):
+    
+    __tablename__ = "mail_queue"
+    #the worker polls for pending mail that is due
+    __table_args__ = (
+        db.Index('ix_mail_queue_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String, nullable=False)
+    subject = db.Column(db.String, nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    sender_name = db.Column(db.String, nullable=True)
+    sender_address = db.Column(db.String, nullable=True)
+    status = db.Column(db.String, nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False)
+    last_error = db.Column(db.String, nullable=True)
+    created_on = db.Column(db.DateTime, nullable=False)
+    sent_on = db.Column(db.DateTime, nullable=True)
+    
+    def __init__(self, recipient, subject, html, sender_name=None, sender_address=None):
+        self.recipient = recipient
+        self.subject = subject
+        self.html = html
+        self.sender_name = sender_name
+        self.sender_address = sender_address
+        self.status = 'pending'
+        self.attempts = 0
+        self.created_on = datetime.datetime.utcnow()
+        self.next_attempt_at = self.created_on
+    
+    def __repr__(self):
+        return '<mail {} to {}>'.format(self.subject, self.recipient)
+
+
+class ImageJob(db.Model):
+    
+    __tablename__ = "image_jobs"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    source_path = db.Column(db.String, nullable=False)
+    target_path = db.Column(db.String, nullable=False)
+    target_url = db.Column(db.String, nullable=False)
+    #profile pictures: the user's picture before the upload, put back if the job fails
+    previous_url = db.Column(db.String, nullable=True)
+    status = db.Column(db.String, nullable=False, default='pending')
+    error = db.Column(db.String, nullable=True)
+    created_on = db.Column(db.DateTime, nullable=False)
+    finished_on = db.Column(db.DateTime, nullable=True)
+    
+    def __init__(self, kind, user_id, source_path, target_path, target_url, previous_url=None):
+        self.kind = kind
+        self.user_id = user_id
+        self.source_path = source_path
+        self.target_path = target_path
+        self.target_url = target_url
+        self.previous_url = previous_url
+        self.status = 'pending'
+        self.created_on = datetime.datetime.utcnow()
+    
+    def __repr__(self):
+        return '<image job {} {}>'.format(self.id, self.status)
+
+class Upload(db.Model):
+    
+    __tablename__ = "uploads"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String, nullable=False, unique=True)
+    digest = db.Column(db.String(16), nullable=False, index=True)
+    mimetype = db.Column(db.String, nullable=True)
+    size = db.Column(db.Integer, nullable=False)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    uploader_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
+    created_on = db.Column(db.DateTime, nullable=False)
+    
+    uploader = db.relationship('User')
+    
+    __table_args__ = (
+        db.Index('ix_uploads_created_on_id', 'created_on', 'id'),
+    )
+    
+    def __init__(self, filename, digest, mimetype, size, width=None, height=None, uploader_id=None, created_on=None):
+        self.filename = filename
+        self.digest = digest
+        self.mimetype = mimetype
+        self.size = size
+        self.width = width
+        self.height = height
+        self.uploader_id = uploader_id
+        self.created_on = created_on or datetime.datetime.utcnow()
+    
+    def __repr__(self):
+        return '<upload {}>'.format(self.filename)
+
+
+class SearchOutbox(db.Model):
+    
+    __tablename__ = "search_outbox"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    #no foreign key, deletes are queued too
+    post_id = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    created_on = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return '<search outbox {} post {}>'.format(self.id, self.post_id)
@@ -0,0 +1,93 @@
+import base64
+import binascii
+import datetime
+from sqlalchemy import and_, or_, func, text
+from project import db, cache
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+class InvalidCursor(ValueError):
+    pass
+
+#A cursor is the (timestamp, id) of a row, base64 encoded for the URL
+def encode_cursor(timestamp, id):
+    delta = timestamp - EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    raw = '{}:{}'.format(micros, id).encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        micros, id = raw.split(':')
+        return EPOCH + datetime.timedelta(microseconds=int(micros)), int(id)
+    except (binascii.Error, UnicodeError, ValueError, OverflowError):
+        raise InvalidCursor(cursor)
+
+class KeysetPage(object):
+    def __init__(self, items, has_next, has_prev, timestamp_attr, id_attr, total=None):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.total = total
+        self._timestamp_attr = timestamp_attr
+        self._id_attr = id_attr
+
+    def _cursor(self, item):
+        return encode_cursor(getattr(item, self._timestamp_attr), getattr(item, self._id_attr))
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.items:
+            return self._cursor(self.items[-1])
+
+    @property
+    def prev_cursor(self):
+        if self.has_prev and self.items:
+            return self._cursor(self.items[0])
+
+def _beyond(timestamp_column, id_column, cursor, descending):
+    timestamp, id = decode_cursor(cursor)
+    if descending:
+        return and_(timestamp_column <= timestamp,
+                    or_(timestamp_column < timestamp, id_column < id))
+    return and_(timestamp_column >= timestamp,
+                or_(timestamp_column > timestamp, id_column > id))
+
+#Paginate `query` on (timestamp, id) without OFFSET, reading one extra row to detect a next page.
+#The timestamp column has to be NOT NULL, NULLs would fall out of the comparisons.
+#`after` walks forward in the sort order, `before` walks back.
+def keyset_paginate(query, timestamp_column, id_column, per_page, after=None, before=None, descending=True):
+    if before:
+        query = query.filter(_beyond(timestamp_column, id_column, before, not descending))
+        reverse = True
+    else:
+        if after:
+            query = query.filter(_beyond(timestamp_column, id_column, after, descending))
+        reverse = False
+    if descending != reverse:
+        query = query.order_by(timestamp_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(timestamp_column.asc(), id_column.asc())
+    items = query.limit(per_page + 1).all()
+    more = len(items) > per_page
+    items = items[:per_page]
+    if reverse:
+        items.reverse()
+        return KeysetPage(items, True, more, timestamp_column.key, id_column.key)
+    return KeysetPage(items, more, bool(after), timestamp_column.key, id_column.key)
+
+#Row count from the planner statistics on Postgres (exact COUNT elsewhere), cached for `timeout` seconds
+def estimated_row_count(model, timeout=600):
+    key = 'count:{}'.format(model.__tablename__)
+
+    def count():
+        if db.engine.dialect.name == 'postgresql':
+            estimate = db.session.execute(
+                text('SELECT reltuples::bigint FROM pg_class WHERE relname = :table'),
+                {'table': model.__tablename__}).scalar()
+            if estimate is not None and estimate > 0:
+                return estimate
+        return db.session.query(func.count(model.id)).scalar()
+
+    return cache.get_or_set(key, count, timeout)
@@ -0,0 +1,74 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+import bcrypt
+from werkzeug.exceptions import TooManyRequests
+from project import app
+
+#bcrypt runs in a process pool of PASSWORD_HASH_WORKERS, so a burst of logins
+#can't take every request thread. At most PASSWORD_HASH_MAX_PENDING hashes are
+#queued or running per worker, past that the request gets a 429 right away.
+class HashingBusy(TooManyRequests):
+    description = 'Too many sign-ins at once, please try again in a moment.'
+
+    def __init__(self, retry_after=None):
+        super(HashingBusy, self).__init__()
+        self.retry_after = retry_after
+
+#Pool functions, bytes in and out
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+def _check(pw_hash, password):
+    try:
+        return bcrypt.checkpw(password, pw_hash)
+    except ValueError:
+        #not a bcrypt hash
+        return False
+
+_executor = None
+_executor_pid = None
+_slots = None
+_executor_lock = threading.Lock()
+
+#One pool per (forked) worker process
+def executor():
+    global _executor, _executor_pid, _slots
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'])
+            _slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_MAX_PENDING'])
+            _executor_pid = os.getpid()
+    return _executor, _slots
+
+def _run(func, *args):
+    if app.config['PASSWORD_HASH_SYNC']:
+        return func(*args)
+    pool, slots = executor()
+    if not slots.acquire(False):
+        raise HashingBusy(app.config['PASSWORD_HASH_RETRY_AFTER'])
+    try:
+        future = pool.submit(func, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda future: slots.release())
+    try:
+        return future.result(app.config['PASSWORD_HASH_TIMEOUT'])
+    except TimeoutError:
+        raise HashingBusy(app.config['PASSWORD_HASH_RETRY_AFTER'])
+
+#A hash at the configured cost (BCRYPT_LOG_ROUNDS)
+def hash_password(password, rounds=None):
+    rounds = rounds or app.config['BCRYPT_LOG_ROUNDS']
+    return _run(_hash, password.encode('utf-8'), rounds).decode('utf-8')
+
+def check_password(pw_hash, password):
+    return _run(_check, pw_hash.encode('utf-8'), password.encode('utf-8'))
+
+#Hashes made at another cost than the configured one, rehashed at the next login
+def needs_rehash(pw_hash):
+    try:
+        return int(pw_hash.split('$')[2]) != app.config['BCRYPT_LOG_ROUNDS']
+    except (IndexError, ValueError):
+        return True
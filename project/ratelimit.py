@@ -0,0 +1,171 @@
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from flask import request
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+from project import app
+
+logger = logging.getLogger(__name__)
+
+class RateLimited(TooManyRequests):
+    description = 'Too many attempts, please wait a moment and try again.'
+
+    def __init__(self, retry_after=None):
+        super(RateLimited, self).__init__()
+        self.retry_after = retry_after
+
+#Per worker counters, expired windows are purged every `purge_every` hits
+class MemoryStorage(object):
+    def __init__(self, purge_every=1000):
+        self.purge_every = purge_every
+        self._counts = {}
+        self._hits = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            expires, count = self._counts.get(key, (0, 0))
+            return count if expires > time.time() else 0
+
+    def incr(self, key, expires_in):
+        now = time.time()
+        with self._lock:
+            expires, count = self._counts.get(key, (0, 0))
+            if expires <= now:
+                expires, count = now + expires_in, 0
+            self._counts[key] = (expires, count + 1)
+            self._hits += 1
+            if self._hits % self.purge_every == 0:
+                self._counts = dict((key, value) for key, value in self._counts.items() if value[0] > now)
+            return count + 1
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+#Counters shared by every worker, `client` speaks the redis-py get/incr/expire/scan_iter API
+class RedisStorage(object):
+    def __init__(self, client, key_prefix='flaskapp:ratelimit:'):
+        self.client = client
+        self.key_prefix = key_prefix
+
+    def get(self, key):
+        return int(self.client.get(self.key_prefix + key) or 0)
+
+    def incr(self, key, expires_in):
+        count = self.client.incr(self.key_prefix + key)
+        if count == 1:
+            self.client.expire(self.key_prefix + key, int(math.ceil(expires_in)))
+        return count
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.key_prefix + '*'):
+            self.client.delete(key)
+
+#Whose requests a limit counts
+def _identity(kind):
+    if kind == 'user' and current_user.is_authenticated:
+        return 'user:{}'.format(current_user.id)
+    if kind == 'email':
+        email = request.form.get('email', '').strip().lower()
+        return 'email:{}'.format(email) if email else None
+    return 'ip:{}'.format(request.remote_addr)
+
+#Sliding window counters: the hits of the current fixed window plus the previous
+#window's, weighted by how much of it still overlaps the last `period` seconds.
+#Every hit counts, also refused ones, so a client has to back off to get through.
+#Policies are RATELIMIT_POLICIES[name], a list of (limit, period in seconds, identity)
+#with identity 'ip', 'user' (falls back to ip) or 'email' (the posted address).
+class RateLimiter(object):
+    def __init__(self, app=None):
+        self.storage = MemoryStorage()
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_STORAGE', 'memory')
+        app.config.setdefault('RATELIMIT_REDIS_URL', app.config.get('CACHE_REDIS_URL'))
+        app.config.setdefault('RATELIMIT_KEY_PREFIX', 'flaskapp:ratelimit:')
+        app.config.setdefault('RATELIMIT_POLICIES', {})
+        self.app = app
+        self.storage = self.make_storage(app.config)
+
+    def make_storage(self, config):
+        if config['RATELIMIT_STORAGE'] == 'memory':
+            return MemoryStorage()
+        if config['RATELIMIT_STORAGE'] == 'redis':
+            #only needed when the redis storage is configured
+            import redis
+            return RedisStorage(redis.StrictRedis.from_url(config['RATELIMIT_REDIS_URL']),
+                                config['RATELIMIT_KEY_PREFIX'])
+        raise ValueError('Unknown RATELIMIT_STORAGE "{}"'.format(config['RATELIMIT_STORAGE']))
+
+    #Count a hit on `key`, returns None if it is within `limit`, else the seconds to wait
+    def hit(self, key, limit, period, now=None):
+        now = now or time.time()
+        start = now - now % period
+        previous = self.storage.get('{}:{}'.format(key, int(start - period)))
+        current = self.storage.incr('{}:{}'.format(key, int(start)), 2 * period)
+        elapsed = now - start
+        weight = (period - elapsed) / float(period)
+        if previous * weight + current <= limit:
+            return None
+        #until one more hit would fit
+        if current >= limit:
+            #this window alone is full, wait for it to end and fade out enough
+            wait = period - elapsed + period * (1 - float(limit - 1) / current)
+        else:
+            wait = period * (1 - float(limit - current - 1) / previous) - elapsed
+        return max(1, int(math.ceil(wait)))
+
+    #Check every limit of policy `name`, raises RateLimited with the longest wait
+    def check(self, name):
+        if not self.app.config['RATELIMIT_ENABLED']:
+            return
+        waits = []
+        for limit, period, kind in self.app.config['RATELIMIT_POLICIES'].get(name, ()):
+            identity = _identity(kind)
+            if identity is None:
+                continue
+            wait = self.hit('{}:{}:{}'.format(name, period, identity), limit, period)
+            if wait is not None:
+                waits.append(wait)
+        self._count(name, 'limited' if waits else 'allowed')
+        if waits:
+            logger.warning('Rate limit %s hit by %s', name, request.remote_addr)
+            raise RateLimited(max(waits))
+
+    def _count(self, name, outcome):
+        with self._stats_lock:
+            self.stats['{}.{}'.format(name, outcome)] += 1
+
+    #Allowed/limited requests per policy in this worker since it started
+    def counters(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def clear(self):
+        self.storage.clear()
+        with self._stats_lock:
+            self.stats.clear()
+
+limiter = RateLimiter(app)
+
+#Apply policy `name` to the requests using one of `methods` (all of them when None)
+def rate_limited(name, methods=('POST',)):
+    def decorator(func):
+        @wraps(func)
+        def decorated_function(*args, **kwargs):
+            if methods is None or request.method in methods:
+                limiter.check(name)
+            return func(*args, **kwargs)
+
+        return decorated_function
+    return decorator
@@ -0,0 +1,155 @@
+import datetime
+import logging
+import threading
+import time
+from sqlalchemy import func, text
+from project import app, db
+from project.models import BlogPost, SearchOutbox
+from project.fulltext import backend, document
+from project.suggest import posts_indexed
+from project.events import changes
+
+logger = logging.getLogger(__name__)
+
+outbox = SearchOutbox.__table__
+
+#Postgres advisory lock key held by the indexer that is writing
+INDEXER_LOCK_KEY = 726371
+
+INDEXED_FIELDS = frozenset(['title', 'content'])
+
+def is_indexed(change):
+    return change.op != 'update' or bool(change.fields & INDEXED_FIELDS)
+
+#Post changes are queued in the outbox in the same transaction as the post,
+#so an index update can't be lost even if the indexer is down or crashes
+@changes.on_flush(BlogPost)
+def enqueue(connection, change):
+    if is_indexed(change):
+        connection.execute(outbox.insert().values(post_id=change.id, deleted=change.op == 'delete',
+                                                  created_on=datetime.datetime.utcnow()))
+
+#Drains the outbox into the search index in batches. There is one writer:
+#one thread per process, and on Postgres an advisory lock across processes.
+#Outbox rows are deleted in the transaction that writes the index (or after
+#the whoosh commit), a batch interrupted by a crash is simply indexed again.
+class SearchIndexer(object):
+    def __init__(self, app=app):
+        self.app = app
+        self.batch_size = app.config['SEARCH_INDEX_BATCH_SIZE']
+        self.poll_interval = app.config['SEARCH_INDEX_POLL_INTERVAL']
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    #Index one batch, returns the number of outbox rows handled
+    def process_batch(self, session=None):
+        session = session or db.session
+        connection = session.connection()
+        if connection.dialect.name == 'postgresql' and not connection.execute(
+                text('SELECT pg_try_advisory_xact_lock(:key)'), {'key': INDEXER_LOCK_KEY}).scalar():
+            session.rollback()
+            return 0
+        rows = session.query(SearchOutbox.id, SearchOutbox.post_id, SearchOutbox.deleted) \
+            .order_by(SearchOutbox.id).limit(self.batch_size).all()
+        if not rows:
+            session.rollback()
+            return 0
+        #the last change of a post wins
+        latest = {}
+        for id, post_id, deleted in rows:
+            latest[post_id] = deleted
+        live = [post_id for post_id, deleted in latest.items() if not deleted]
+        posts = session.query(BlogPost).filter(BlogPost.id.in_(live)).all() if live else []
+        found = set(post.id for post in posts)
+        removed = [post_id for post_id in latest if post_id not in found]
+        titles = [(post.id, post.title, post.slug) for post in posts]
+        engine = backend()
+        engine.index(connection, [document(post) for post in posts])
+        engine.remove(connection, removed)
+        session.query(SearchOutbox).filter(SearchOutbox.id.in_([row[0] for row in rows])) \
+            .delete(synchronize_session=False)
+        session.commit()
+        posts_indexed(titles, removed)
+        return len(rows)
+
+    #Index until the outbox is empty
+    def drain(self, session=None):
+        total = 0
+        while True:
+            handled = self.process_batch(session)
+            total += handled
+            if handled < self.batch_size:
+                return total
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        with self.app.app_context():
+            while not self._stop.is_set():
+                try:
+                    handled = self.process_batch()
+                except Exception:
+                    logger.exception('Search indexer batch failed')
+                    db.session.rollback()
+                    handled = 0
+                finally:
+                    db.session.remove()
+                if not handled:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='search-indexer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    #Run in the foreground until interrupted
+    def run(self):
+        self.start()
+        try:
+            while self._thread.is_alive():
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+#Indexing lag: queued changes and the age in seconds of the oldest one
+def indexing_lag(session=None):
+    session = session or db.session
+    count, oldest = session.query(func.count(SearchOutbox.id), func.min(SearchOutbox.created_on)).one()
+    age = (datetime.datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+    return count, age
+
+_indexer = None
+_indexer_lock = threading.Lock()
+
+#Start the indexer inside this process (SEARCH_INDEX_IN_PROCESS), once per process
+def ensure_indexer():
+    global _indexer
+    with _indexer_lock:
+        if _indexer is None:
+            _indexer = SearchIndexer()
+            _indexer.start()
+    return _indexer
+
+#SEARCH_INDEX_SYNC indexes right after the commit on a session of its own (tests),
+#SEARCH_INDEX_IN_PROCESS wakes the in-process indexer
+@changes.on_commit(BlogPost)
+def _outbox_committed(changed):
+    if not any(is_indexed(change) for change in changed):
+        return
+    if app.config['SEARCH_INDEX_SYNC']:
+        indexer_session = db.create_session({})()
+        try:
+            SearchIndexer().drain(indexer_session)
+        finally:
+            indexer_session.close()
+    elif app.config['SEARCH_INDEX_IN_PROCESS']:
+        ensure_indexer().wake()
@@ -0,0 +1,74 @@
+from flask import _request_ctx_stack
+from project import app, cache
+from project.models import User
+from project.follows import is_following
+from project.events import changes
+
+#What a request needs to know about the logged in user, kept instead of the ORM instance
+#so it can be cached across requests. Write views load the User row by id when they change it.
+class SessionUser(object):
+    __slots__ = ('id', 'name', 'email', 'confirmed', 'admin', 'role', 'image_url')
+
+    def __init__(self, id, name, email, confirmed, admin, role, image_url):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.confirmed = confirmed
+        self.admin = admin
+        self.role = role
+        self.image_url = image_url
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.name, user.email, user.confirmed, user.admin, user.role, user.image_url)
+
+    def is_authenticated(self):
+        return True
+
+    def is_active(self):
+        return True
+
+    def is_anonymous(self):
+        return False
+
+    def get_id(self):
+        return str(self.id)
+
+    def is_following(self, user):
+        return is_following(self.id, user.id)
+
+    def __repr__(self):
+        return '{}'.format(self.name)
+
+def _cache_key(user_id):
+    return 'session_user:{}'.format(user_id)
+
+def _load(user_id):
+    user = User.query.get(user_id)
+    return SessionUser.from_user(user) if user is not None else None
+
+#The user for `user_id`: once per request, from the cache for up to SESSION_USER_CACHE_TIMEOUT
+def session_user(user_id):
+    #on the request context rather than g, which lives as long as the app context
+    ctx = _request_ctx_stack.top
+    loaded = {}
+    if ctx is not None:
+        if not hasattr(ctx, 'session_users'):
+            ctx.session_users = {}
+        loaded = ctx.session_users
+    if user_id not in loaded:
+        key = _cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = _load(user_id)
+            if user is not None:
+                cache.set(key, user, app.config['SESSION_USER_CACHE_TIMEOUT'])
+        loaded[user_id] = user
+    return loaded[user_id]
+
+#Profile, password and confirmation changes all go through the User row,
+#the cached copy goes once they are committed
+@changes.on_commit(User, ops=('update', 'delete'))
+def users_changed(changed):
+    for change in changed:
+        cache.delete(_cache_key(change.id))
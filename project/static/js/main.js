@@ -96,15 +96,36 @@ if (document.querySelector('.load-more')) {
     $.ajax({
       url: Flask.url_for('blog.load_comments', {slug: slug}),
       type : "POST",
+      data : {after: $('.load-more').data('next')},
       success: function(resp){
         $('.comments-container').append(resp.data);
-        $('.load-more').remove().delay( 300 );
+        if (resp.next) {
+          $('.load-more').data('next', resp.next);
+        } else {
+          $('.load-more').remove().delay( 300 );
+        }
         flask_moment_render_all();  
       }
     });
   });
 }
 
+/* Profile Settings */
+// Swap in the resized profile picture once the image job is done
+if (document.querySelector('[data-image-job]')) {
+  var imageJobPicture = document.querySelector('[data-image-job]');
+  var pollImageJob = function(){
+    $.getJSON(imageJobPicture.getAttribute('data-image-job'), function(resp){
+      if (resp.status === 'done') {
+        imageJobPicture.src = resp.url;
+      } else if (resp.status === 'pending') {
+        setTimeout(pollImageJob, 1000);
+      }
+    });
+  };
+  setTimeout(pollImageJob, 1000);
+}
+
 /* BLog Admin */
 // Delete Posts
 if (document.querySelector('.delete-post')) {
@@ -114,4 +135,33 @@ deletePostBtn.addEventListener('click',function(){
   document.querySelector('.delete-msg').innerHTML = 'Are you sure you want to delete this post?';
   document.querySelector('.delete-form').outerHTML = `<form class='delete-form' method='post' action=${postDeleteURL}>` + `<button class='btn btn-danger yes-btn'>` + "Yes" + `</button>` + `</form>`;
 }); 
-}
\ No newline at end of file
+}
+
+/* Blog search */
+// Suggest post titles while typing, picking one opens the post
+if (document.querySelector('#search-suggestions')) {
+  var searchInput = document.querySelector('#search'),
+    searchSuggestions = document.querySelector('#search-suggestions'),
+    suggestedPosts = {},
+    suggestTimer = null;
+  searchInput.addEventListener('input', function(){
+    if (suggestedPosts[searchInput.value]) {
+      window.location = suggestedPosts[searchInput.value];
+      return;
+    }
+    clearTimeout(suggestTimer);
+    suggestTimer = setTimeout(function(){
+      if (searchInput.value.trim().length < 2) { return; }
+      $.getJSON(Flask.url_for('blog.search_suggest'), {q: searchInput.value}, function(resp){
+        searchSuggestions.innerHTML = '';
+        suggestedPosts = {};
+        resp.forEach(function(post){
+          var option = document.createElement('option');
+          option.value = post.title;
+          searchSuggestions.appendChild(option);
+          suggestedPosts[post.title] = post.url;
+        });
+      });
+    }, 150);
+  });
+}
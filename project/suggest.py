@@ -0,0 +1,110 @@
+import bisect
+import threading
+from project import app, db
+from project.models import BlogPost
+from project.fulltext import search_terms, search_version, bump_search_version, version_changes
+
+#Prefix index over the words of post titles: a sorted list of (word, post id),
+#a prefix is the range bisect finds for it
+class PrefixIndex(object):
+    def __init__(self):
+        self.version = None
+        self._words = []
+        self._posts = {}
+        self._lock = threading.Lock()
+
+    def load(self, posts, version):
+        words = []
+        titles = {}
+        for id, title, slug in posts:
+            titles[id] = (title, slug)
+            words.extend((word, id) for word in set(search_terms(title)))
+        words.sort()
+        with self._lock:
+            self._words = words
+            self._posts = titles
+            self.version = version
+
+    def _remove(self, id):
+        title, slug = self._posts.pop(id, (None, None))
+        for word in set(search_terms(title or '')):
+            i = bisect.bisect_left(self._words, (word, id))
+            if i < len(self._words) and self._words[i] == (word, id):
+                del self._words[i]
+
+    #Apply changed (id, title, slug) posts and removed ids, when the index is at `old_version`
+    def update(self, posts, removed, old_version, new_version):
+        with self._lock:
+            if self.version is None or self.version != old_version:
+                return False
+            for id in removed:
+                self._remove(id)
+            for id, title, slug in posts:
+                self._remove(id)
+                self._posts[id] = (title, slug)
+                for word in set(search_terms(title)):
+                    bisect.insort(self._words, (word, id))
+            self.version = new_version
+            return True
+
+    #Newest posts whose title has a word starting with the last term and contains the others
+    def complete(self, prefix, limit=8):
+        terms = search_terms(prefix)
+        if not terms:
+            return []
+        last, others = terms[-1], set(terms[:-1])
+        with self._lock:
+            ids = set()
+            i = bisect.bisect_left(self._words, (last,))
+            while i < len(self._words) and self._words[i][0].startswith(last):
+                ids.add(self._words[i][1])
+                i += 1
+            matches = []
+            for id in sorted(ids, reverse=True):
+                title, slug = self._posts[id]
+                if others <= set(search_terms(title)):
+                    matches.append((title, slug))
+                    if len(matches) == limit:
+                        break
+            return matches
+
+_index = PrefixIndex()
+
+#Post ids changed between the index's version and `version`, following the changes the
+#indexer stored per version. None when the chain is broken (a reindex, expired entries)
+#or too long, the index is then reloaded.
+def _changed_since(version):
+    ids = set()
+    for _ in range(app.config['SEARCH_SUGGEST_MAX_CATCH_UP']):
+        if version == _index.version:
+            return ids
+        changes = version_changes(version)
+        if changes is None:
+            return None
+        version, changed = changes
+        ids.update(changed)
+    return None
+
+#Suggestions for what is being typed. When another process indexed posts, only the posts
+#changed since are read again, everything only at the start or after a reindex.
+def suggestions(prefix, limit=8):
+    version = search_version()
+    if _index.version != version:
+        old = _index.version
+        ids = _changed_since(version) if old is not None else None
+        if ids is None:
+            _index.load(db.session.query(BlogPost.id, BlogPost.title, BlogPost.slug), version)
+        else:
+            posts = db.session.query(BlogPost.id, BlogPost.title, BlogPost.slug) \
+                .filter(BlogPost.id.in_(ids)).all() if ids else []
+            found = set(post[0] for post in posts)
+            _index.update(posts, [id for id in ids if id not in found], old, version)
+    return _index.complete(prefix, limit)
+
+#Called by the search indexer once a batch of (id, title, slug) posts and removed ids
+#is indexed: invalidate cached results, record the changed ids for the other processes
+#and update this process' prefix index in place
+def posts_indexed(posts, removed):
+    old, new = bump_search_version([post[0] for post in posts] + list(removed),
+                                   app.config['SEARCH_SUGGEST_CHANGES_TIMEOUT'])
+    _index.update(posts, removed, old, new)
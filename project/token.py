@@ -1,4 +1,4 @@
-from itsdangerous import URLSafeTimedSerializer
+from itsdangerous import URLSafeTimedSerializer, Signer
 
 from project import app
 
@@ -35,5 +35,13 @@ def reset_token(token, expiration=3600):
             )
     except:
         return False
-    return email    
-    
\ No newline at end of file
+    return email
+
+#uploaded file signature, lets /files/ skip the login check
+def upload_signature(filename):
+    signer = Signer(app.config['SECRET_KEY'], salt='uploads')
+    return signer.get_signature(filename).decode('ascii')
+
+def check_upload_signature(filename, signature):
+    signer = Signer(app.config['SECRET_KEY'], salt='uploads')
+    return signer.verify_signature(filename.encode('utf-8'), signature.encode('ascii', 'ignore'))
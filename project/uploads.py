@@ -0,0 +1,101 @@
+import datetime
+import hashlib
+import mimetypes
+import os
+import re
+import uuid
+from PIL import Image
+from project import db, cache
+from project.models import Upload, User
+from project.pagination import keyset_paginate
+from project.events import changes
+
+#Bumped (deleted) whenever the index changes, every cached listing embeds it
+UPLOADS_VERSION_KEY = 'uploads:version'
+
+HASH_PREFIX = re.compile(r'^([0-9a-f]{16})[-.]')
+
+@changes.on_commit(Upload)
+def uploads_changed(changed):
+    cache.delete(UPLOADS_VERSION_KEY)
+
+#size, width, height and mimetype of a stored file, dimensions are None for non images (svg)
+def describe_file(path):
+    mimetype = mimetypes.guess_type(path)[0]
+    try:
+        #only reads the header
+        with Image.open(path) as img:
+            width, height = img.size
+    except (IOError, SyntaxError):
+        width = height = None
+    return os.path.getsize(path), width, height, mimetype
+
+#Add `filename` to the index, described by `path` (the original while variants are pending)
+def record_upload(filename, path, digest, uploader_id=None):
+    if Upload.query.filter_by(filename=filename).first() is not None:
+        return None
+    size, width, height, mimetype = describe_file(path)
+    upload = Upload(filename, digest, mimetypes.guess_type(filename)[0] or mimetype, size, width, height, uploader_id)
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+#Describe the written file once an image job is done, `session` is the job's own session
+def refresh_upload(session, path):
+    size, width, height, mimetype = describe_file(path)
+    updated = session.query(Upload).filter_by(filename=os.path.basename(path)).update(
+        {'size': size, 'width': width, 'height': height})
+    session.commit()
+    if updated:
+        cache.delete(UPLOADS_VERSION_KEY)
+
+def _version():
+    return cache.get_or_set(UPLOADS_VERSION_KEY, lambda: uuid.uuid4().hex[:12], 0)
+
+#One page of the index, newest first. Filters: filename substring, uploader name, mimetype.
+#Returns (rows, next cursor), cached until the index changes.
+def list_uploads(per_page, after=None, q=None, uploader=None, mimetype=None, timeout=None):
+    key = 'uploads:list:{}:{}:{}:{}:{}:{}'.format(_version(), per_page, after, q, uploader, mimetype)
+
+    def page():
+        query = Upload.query.options(db.joinedload(Upload.uploader).load_only(User.name))
+        if q:
+            query = query.filter(Upload.filename.contains(q))
+        if uploader:
+            query = query.join(Upload.uploader).filter(User.name == uploader)
+        if mimetype:
+            query = query.filter(Upload.mimetype == mimetype)
+        result = keyset_paginate(query, Upload.created_on, Upload.id, per_page, after=after)
+        rows = [{'filename': upload.filename, 'digest': upload.digest, 'mimetype': upload.mimetype,
+                 'size': upload.size, 'width': upload.width, 'height': upload.height,
+                 'uploader': upload.uploader.name if upload.uploader else None,
+                 'created_on': upload.created_on.isoformat()} for upload in result.items]
+        return rows, result.next_cursor
+
+    return cache.get_or_set(key, page, timeout)
+
+def _file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            sha.update(chunk)
+    return sha.hexdigest()[:16]
+
+#Backfill the index from the files in `directory` that `listed(filename)` accepts.
+#Hashed names carry their digest, anything else is hashed. Returns the number of new rows.
+def index_directory(directory, listed, batch_size=500):
+    known = set(name for name, in db.session.query(Upload.filename))
+    added = 0
+    for entry in os.scandir(directory):
+        if not entry.is_file() or entry.name in known or not listed(entry.name):
+            continue
+        match = HASH_PREFIX.match(entry.name)
+        digest = match.group(1) if match else _file_digest(entry.path)
+        size, width, height, mimetype = describe_file(entry.path)
+        created_on = datetime.datetime.utcfromtimestamp(entry.stat().st_mtime)
+        db.session.add(Upload(entry.name, digest, mimetype, size, width, height, created_on=created_on))
+        added += 1
+        if added % batch_size == 0:
+            db.session.commit()
+    db.session.commit()
+    return added
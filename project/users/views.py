@@ -1,18 +1,23 @@
 from flask import flash, redirect, render_template, request, \
-    url_for, Blueprint
+    url_for, Blueprint, abort, jsonify
 from flask_login import login_user, login_required, logout_user, current_user
 from .form import LoginForm, RegisterForm, ChangePasswordForm, EmailForm, PasswordForm, ProfileInfoForm, UploadForm
 from project import db, app
-from project.models import User, bcrypt, BlogPost, Comments
+from project.models import User, BlogPost, Comments, ImageJob
+from project.passwords import hash_password, check_password, needs_rehash
+from project.images import process_image, content_digest, variant_name, original_name, default_width
+from project.blog import queries
 from project.token import generate_confirmation_token, confirm_token, generate_reset_token, reset_token
 import datetime
 from project.email import send_email
-from project.decorators import check_confirmed
+from project.activity import tracker
+from project.decorators import check_confirmed, admin_required
+from project.ratelimit import limiter, rate_limited
+from project.database import replica_reads
+from project.follows import follow as follow_user, unfollow as unfollow_user
 from sqlalchemy import desc
 from sqlalchemy.exc import IntegrityError, DataError
-from werkzeug.utils import secure_filename    
 import os
-from PIL import Image
 
 
 users_blueprint = Blueprint(
@@ -21,6 +26,7 @@ users_blueprint = Blueprint(
 ) 
 #User Login
 @users_blueprint.route('/login', methods=['GET', 'POST'])
+@rate_limited('login')
 def login():
     error = None
     form = LoginForm(request.form)
@@ -29,11 +35,13 @@ def login():
     if request.method == 'POST':   
         if form.validate_on_submit(): 
             user = User.query.filter_by(email=request.form['email']).first()
-            if user is not None and bcrypt.check_password_hash(
-                user.password, request.form['password']):
+            if user is not None and check_password(user.password, request.form['password']):
+                #hashed at an older cost
+                if needs_rehash(user.password):
+                    user.password = hash_password(request.form['password'])
+                    db.session.commit()
                 login_user(user)
-                user.last_seen = datetime.datetime.now()
-                db.session.commit()
+                tracker.touch(user.id)
                 return redirect(url_for('blog.home'))
             else:
                 error = flash('There was a problem with your login.','danger')
@@ -49,6 +57,7 @@ def logout():
     
 #User Account Registration    
 @users_blueprint.route('/register', methods=['GET', 'POST'])
+@rate_limited('register')
 def register():
     if current_user.is_authenticated:
         return redirect (url_for('users.unconfirmed'))
@@ -66,13 +75,14 @@ def register():
                 role="user"
             )
             db.session.add(user)
-            db.session.commit()
             
             token = generate_confirmation_token(user.email)
             confirm_url = url_for('users.confirm_email', token=token, _external=True)
             html = render_template('emails/email_activation.html', confirm_url=confirm_url)
             subject = "Please confirm your account"
             send_email(user.email, subject, html)
+            #the user and the confirmation email are saved together
+            db.session.commit()
     
             login_user(user)
             return redirect(url_for('blog.home'))
@@ -89,8 +99,8 @@ def confirm_email(token):
         flash('Account already confirmed.', 'success')
         return redirect(url_for('blog.home'))
     email = confirm_token(token)
-    user = User.query.filter_by(email=current_user.email).first_or_404()
-    if user.email == email:
+    if current_user.email == email:
+        user = User.query.get_or_404(current_user.id)
         user.confirmed = True
         user.confirmed_on = datetime.datetime.now()
         db.session.add(user)
@@ -103,12 +113,14 @@ def confirm_email(token):
 #Resend User Account Confirmation Email Link
 @users_blueprint.route('/resend')
 @login_required
+@rate_limited('resend_confirmation', methods=None)
 def resend_confirmation():
     token = generate_confirmation_token(current_user.email)
     confirm_url = url_for('users.confirm_email', token=token, _external=True)
     html = render_template('emails/email_activation.html', confirm_url=confirm_url)
     subject = "Please confirm your account"
     send_email(current_user.email, subject, html)
+    db.session.commit()
     return redirect(url_for('users.unconfirmed')) 
     
 #Unconfirmed User Account Page    
@@ -125,12 +137,13 @@ def unconfirmed():
 #################
 #User Profile Page
 @users_blueprint.route('/profile/<username>')
+@replica_reads()
 @login_required
 @check_confirmed
 def profile(username):
     user = User.query.filter_by(name=username).first_or_404()
-    posts = BlogPost.query.filter_by(author_id=user.id).order_by(desc(BlogPost.timestamp)).limit(5).all()
-    comments = Comments.query.filter_by(comment_user_id=user.id).order_by(desc(Comments.timestamp)).limit(5).all()
+    posts = BlogPost.query.options(*queries.profile_post_options()).filter_by(author_id=user.id).order_by(desc(BlogPost.timestamp)).limit(5).all()
+    comments = Comments.query.options(*queries.profile_comment_options()).filter_by(comment_user_id=user.id).order_by(desc(Comments.timestamp)).limit(5).all()
     return render_template('profile.html' , user=user, posts=posts, comments=comments)
 
 #User Profile Settings Page   
@@ -140,7 +153,8 @@ def profile(username):
 def profile_settings():
     profile_info_form = ProfileInfoForm(request.form)
     profile_picture_form = UploadForm() 
-    return render_template('profile_settings.html', profile_info_form=profile_info_form, profile_picture_form=profile_picture_form)  
+    image_job = ImageJob.query.filter_by(user_id=current_user.id, kind='profile', status='pending').order_by(desc(ImageJob.id)).first()
+    return render_template('profile_settings.html', profile_info_form=profile_info_form, profile_picture_form=profile_picture_form, image_job=image_job)  
     
 #User Profile Change/Update Settings
 @users_blueprint.route('/update_settings', methods=['POST'])
@@ -151,7 +165,7 @@ def update_settings():
     profile_picture_form = UploadForm() 
     try :
         if profile_info_form.validate_on_submit():
-            user = User.query.filter_by(email=current_user.email).first()
+            user = User.query.get(current_user.id)
             if user:
                 user.about = profile_info_form.about_user.data
                 user.email = profile_info_form.email.data
@@ -174,17 +188,9 @@ def allowed_file(filename):
     return '.' in filename and \
         filename.rsplit('.',1)[1].lower() in app.config['ALLOWED_EXTENSIONS'] 
         
-#Optimize images with Pillow
-def compress_image(filename,filepath,fext):
-    #Open the saved image
-    img = Image.open(filename)
-    #Resize the image
-    size = (350, 350)
-    img.thumbnail(size,Image.ANTIALIAS)
-    #Compress the image
-    img.save('{}{}'.format(filepath,fext),quality=65,optimize=True)
-
 #User File Upload Profile Picture   
+#The original is stored as is and shown right away, the resized variants
+#are made in the image process pool and swapped in when they are ready.
 @users_blueprint.route('/upload', methods=['POST']) 
 @login_required
 @check_confirmed
@@ -193,70 +199,71 @@ def add_profilepicture():
     profile_picture_form = UploadForm()
     if request.method == 'POST' and 'picture' in request.files:
         if profile_picture_form.validate_on_submit():
-            user = User.query.filter_by(name=current_user.name).first()
+            user = User.query.get(current_user.id)
             f = request.files.get('picture')
             #splitting the filename and the extension
             file_name,fext = os.path.splitext(f.filename)
-            #changing filename to profile-picture
-            #file_name = secure_filename('profile-picture' "%s" % (fext))
-            file_name = secure_filename('profile-picture')
-            #Creating a path 
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'],str(user),file_name)
-            #Turning it into a dir
-            dirname = os.path.dirname(filepath)
             # if the file extension is not allowed flash error
             if not allowed_file(f.filename):
                 flash('Images only. Filetype not allowed.', 'danger')
                 return redirect(url_for('users.profile_settings'))
-            # if the directory does not exist    
-            elif not os.path.exists(dirname):
-                try:    
-                    # create the dir
+            fext = fext.lower()
+            dirname = os.path.join(app.config['UPLOAD_FOLDER'],str(user))
+            if not os.path.exists(dirname):
+                try:
                     os.makedirs(dirname)
-                    # save the file
-                    if fext == '.png' or fext == '.JPG' or fext == '.PNG':
-                        fext = '.jpg'
-                        f.save('{}{}'.format(filepath,fext))
-                        file_name = secure_filename('profile-picture.jpg')
-                        user.image_url = os.path.join(app.config['UPLOADS_URL'],str(user),file_name)
-                        db.session.add(user)
-                        db.session.commit()
-                        compress_image(f,filepath,fext)
-                        flash('Profile picture added.','success')
-                    else : 
-                        f.save('{}{}'.format(filepath,fext))
-                        user.image_url = os.path.join(app.config['UPLOADS_URL'],str(user),file_name+fext)
-                        db.session.add(user)
-                        db.session.commit()
-                        compress_image(f,filepath,fext)
-                        flash('Profile picture added.','success')
-                    return redirect(url_for('users.profile_settings'))    
-                except:
+                except OSError:
                     flash("can't create directory.",'danger')
                     return redirect(url_for('users.profile_settings'))
             elif not os.access(dirname,os.W_OK):
                 flash("can't write to directory.",'danger')
                 return redirect(url_for('users.profile_settings'))
-            elif fext == '.png' or fext == '.JPG' or fext == '.PNG':
-                fext = '.jpg'
-                f.save('{}{}'.format(filepath,fext))
-                file_name = secure_filename('profile-picture.jpg')
-                user.image_url = os.path.join(app.config['UPLOADS_URL'],str(user),file_name)
-                db.session.add(user)
+            data = f.read()
+            digest = content_digest(data)
+            url_base = os.path.join(app.config['UPLOADS_URL'],str(user))
+            default_name = variant_name(digest, default_width('profile'), 'jpeg')
+            if os.path.exists(os.path.join(dirname, default_name)):
+                #same picture as before, the variants are already there
+                user.image_url = os.path.join(url_base, default_name)
                 db.session.commit()
-                compress_image(f,filepath,fext)
-                flash('Profile picture added.','success')
-                return redirect(url_for('users.profile_settings')) 
-            else : 
-                f.save('{}{}'.format(filepath,fext))
-                user.image_url = os.path.join(app.config['UPLOADS_URL'],str(user),file_name+fext)
-                db.session.add(user)
+            else:
+                source = os.path.join(dirname, original_name(digest, fext))
+                with open(source, 'wb') as out:
+                    out.write(data)
+                previous_url = user.image_url
+                user.image_url = os.path.join(url_base, original_name(digest, fext))
                 db.session.commit()
-                compress_image(f,filepath,fext)
-                flash('Profile picture added.','success')
+                process_image('profile', user.id, source, dirname, digest, url_base, previous_url)
+            flash('Profile picture added.','success')
             return redirect(url_for('users.profile_settings'))
     return render_template('profile_settings.html', profile_info_form=profile_info_form, profile_picture_form=profile_picture_form) 
 
+#Image processing status, polled by the UI after an upload
+@users_blueprint.route('/upload/status/<int:job_id>')
+@login_required
+@check_confirmed
+def image_status(job_id):
+    job = ImageJob.query.get_or_404(job_id)
+    if job.user_id != current_user.id and not current_user.admin:
+        abort(403)
+    return jsonify({'status': job.status, 'url': job.target_url if job.status == 'done' else None})
+
+#Users seen in the last ACTIVITY_ONLINE_WINDOW seconds, for monitoring
+@users_blueprint.route('/users/online')
+@login_required
+@check_confirmed
+@admin_required
+def online_users():
+    return jsonify({'online': tracker.online_count()})
+
+#Allowed/limited requests per rate limit policy in this worker
+@users_blueprint.route('/users/ratelimits')
+@login_required
+@check_confirmed
+@admin_required
+def rate_limit_status():
+    return jsonify(limiter.counters())
+
 #Profile Password Change 
 @users_blueprint.route('/change_password', methods=['GET', 'POST'])
 @login_required
@@ -264,11 +271,9 @@ def add_profilepicture():
 def change_password():
     form = ChangePasswordForm(request.form)
     if form.validate_on_submit():
-        user = User.query.filter_by(email=current_user.email).first()
+        user = User.query.get(current_user.id)
         if user:
-            #.decode('utf-8') fixed bcrypt invalid salt error in Python 3
-            #https://github.com/maxcountryman/flask-bcrypt/issues/36
-            user.password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+            user.password = hash_password(form.password.data)
             db.session.commit()
             flash('Password successfully changed.','success')
             return redirect(url_for('users.change_password'))
@@ -279,6 +284,7 @@ def change_password():
    
 #User Password Reset via Email    
 @users_blueprint.route('/reset', methods=["GET", "POST"])
+@rate_limited('reset')
 def reset():
     form = EmailForm()
     if form.validate_on_submit():
@@ -294,6 +300,7 @@ def reset():
             html = render_template('emails/email_password_reset.html', password_reset_url=password_reset_url)
             subject = "Password Reset Requested"
             send_email(user.email, subject, html)
+            db.session.commit()
             flash('Please check your email for a password reset link.', 'success')
         else:
             flash('Your email address must be confirmed before attempting a password reset.', 'danger')
@@ -317,9 +324,7 @@ def reset_with_token(token):
         except:
             flash('Invalid email address', 'danger')
             return redirect(url_for('users.login'))
-        #.decode('utf-8') fixed bcrypt invalid salt error in Python 3
-        #https://github.com/maxcountryman/flask-bcrypt/issues/36
-        user.password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        user.password = hash_password(form.password.data)
         db.session.add(user)
         db.session.commit()
         flash('Password sucessfully changed', 'success')
@@ -335,12 +340,9 @@ def reset_with_token(token):
 @check_confirmed
 def follow(username):
     user = User.query.filter_by(name=username).first_or_404()
-    if user == current_user:
+    if user.id == current_user.id:
         return redirect(url_for('users.profile', username=username))
-    u = current_user.follow(user)
-    if u is None:
-        return redirect(url_for('users.profile', username=username))
-    db.session.add(u)
+    follow_user(current_user.id, user.id)
     db.session.commit()
     return redirect(url_for('users.profile', username=username))
 
@@ -349,11 +351,8 @@ def follow(username):
 @check_confirmed
 def unfollow(username):
     user = User.query.filter_by(name=username).first_or_404()
-    if user == current_user:
-        return redirect(url_for('users.profile', username=username))
-    u = current_user.unfollow(user)
-    if u is None:
+    if user.id == current_user.id:
         return redirect(url_for('users.profile', username=username))
-    db.session.add(u)
+    unfollow_user(current_user.id, user.id)
     db.session.commit()
     return redirect(url_for('users.profile', username=username))
\ No newline at end of file
@@ -1,13 +1,48 @@
 import unittest
 import datetime
+import os
+import shutil
+import tempfile
+import runpy
+import multiprocessing
+from unittest import mock
+from concurrent.futures import Future
+from contextlib import contextmanager
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
 from flask_testing import TestCase
+from flask import Response, _request_ctx_stack
 from flask_login import current_user
-from project import app, db
-from project.models import User, BlogPost, Comments
+from project import app, db, cache
+from project.cache import LRUCache, RedisCache
+from project.blog import sidebar
+from project.pagination import encode_cursor
+from project.counters import recount_all
+from project.mailqueue import MailWorker
+from project.images import content_digest, responsive_image, is_listed_upload, _job_done
+from project.uploads import index_directory
+from project.fulltext import search_posts, reindex, backend
+from project.searchindex import SearchIndexer, indexing_lag
+from project.suggest import PrefixIndex, suggestions
+from project.fragments import fragments, fragment_key
+from project.sessionuser import session_user
+from project.activity import tracker
+from project.ratelimit import limiter, RateLimiter, RedisStorage
+from project.database import LAST_WRITE_KEY
+from project.instrumentation import RequestStats, finish_request_stats
+from project.events import changes
+from project.follows import follow, unfollow, following_ids
+from benchmarks.datagen import generate
+from benchmarks import micro
+from project.passwords import hash_password, check_password, needs_rehash, executor as password_executor
+from project import mail
+from project.email import send_email
+from project.models import User, BlogPost, Comments, QueuedEmail, ImageJob
 from project.users.form import RegisterForm, ChangePasswordForm, UploadForm
 from project.blog.form import CommentForm, SearchForm,CKEditorForm
-from project.token import generate_confirmation_token, confirm_token
+from project.token import generate_confirmation_token, confirm_token, upload_signature
 from io import BytesIO
+from PIL import Image
 
 class BaseTestCase(TestCase):
     """A base test case."""
@@ -26,6 +61,10 @@ class BaseTestCase(TestCase):
     def tearDown(self):
         db.session.remove()
         db.drop_all()
+        cache.clear()
+        fragments.clear()
+        tracker.clear()
+        limiter.clear()
         
     ###Helper methods### 
     def login(self):
@@ -37,9 +76,43 @@ class BaseTestCase(TestCase):
     def add_post(self):
        db.session.add(BlogPost("Test post", "This is a test. Only a test.", timestamp=datetime.datetime.utcnow(),author_id=1, slug="test")) 
        db.session.commit()
+    
+    #Fail if the block runs more than `count` SQL statements
+    @contextmanager
+    def assertMaxQueries(self, count):
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertLessEqual(len(statements), count, 
+            '{} queries executed, expected at most {}:\n{}'.format(len(statements), count, '\n'.join(statements)))
 
 
         
+#Local stand-in for a redis client
+class FakeRedis(object):
+    def __init__(self):
+        self.data = {}
+    def get(self, key):
+        return self.data.get(key)
+    def set(self, key, value):
+        self.data[key] = value
+    def setex(self, key, timeout, value):
+        self.data[key] = value
+    def delete(self, key):
+        self.data.pop(key, None)
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+    def expire(self, key, timeout):
+        pass
+    def scan_iter(self, match):
+        return [key for key in list(self.data) if key.startswith(match.rstrip('*'))]
+        
 class FlaskTestCase(BaseTestCase):
     #Test if flask was set up correctly
     def test_index(self):
@@ -60,8 +133,85 @@ class UserViewsTests(BaseTestCase):
             self.assertTrue(current_user.name == 'admin')
             self.assertTrue(current_user.email == "admin@test.com")
             self.assertTrue(current_user.is_active())
-            self.assertTrue(current_user.is_authenticated()) 
-    
+            self.assertTrue(current_user.is_authenticated())
+
+    #Test the logged in user is cached between requests and dropped when the profile changes
+    def test_session_user_cache(self):
+        self.login()
+        self.client.get('/profile_settings')
+        with self.assertMaxQueries(2) as statements:
+            self.client.get('/profile_settings')
+        self.assertFalse([s for s in statements if 'FROM users' in s])
+        self.client.post('/update_settings', data=dict(name='administrator', email='admin@test.com', about_user='hi'))
+        response = self.client.get('/profile_settings')
+        self.assertIn(b'value="administrator"', response.data)
+
+    #Test last seen times stay in memory until flushed, in one statement, newest time wins
+    def test_activity_tracker(self):
+        self.login()
+        self.assertIsNone(User.query.get(1).last_seen)
+        self.assertEqual(tracker.online_count(), 1)
+        later = datetime.datetime.now() + datetime.timedelta(minutes=1)
+        tracker.touch(2, later)
+        tracker.touch(2, later - datetime.timedelta(seconds=30))
+        with self.assertMaxQueries(3) as statements:
+            self.assertEqual(tracker.flush(), 2)
+        self.assertEqual(len([s for s in statements if s.startswith('UPDATE users')]), 1)
+        db.session.expire_all()
+        self.assertIsNotNone(User.query.get(1).last_seen)
+        self.assertEqual(User.query.get(2).last_seen, later)
+        self.assertEqual(tracker.flush(), 0)
+        response = self.client.get('/users/online')
+        self.assertEqual(response.get_json(), {'online': 2})
+
+    #Test a password hashed at another cost is rehashed at login
+    def test_login_rehashes_password(self):
+        user = User.query.get(1)
+        user.password = hash_password('administrator', rounds=5)
+        db.session.commit()
+        self.assertTrue(needs_rehash(user.password))
+        self.login()
+        db.session.expire_all()
+        password = User.query.get(1).password
+        self.assertFalse(needs_rehash(password))
+        self.assertTrue(check_password(password, 'administrator'))
+
+    #Test logins get a 429 right away once the hashing queue is full
+    def test_login_hashing_queue_full(self):
+        app.config['PASSWORD_HASH_SYNC'] = False
+        self.addCleanup(app.config.__setitem__, 'PASSWORD_HASH_SYNC', True)
+        slots = password_executor()[1]
+        for _ in range(app.config['PASSWORD_HASH_MAX_PENDING']):
+            slots.acquire()
+            self.addCleanup(slots.release)
+        response = self.client.post('/login', data=dict(email="admin@test.com", password="administrator"))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], str(app.config['PASSWORD_HASH_RETRY_AFTER']))
+
+    #Test repeated logins for one address get a 429 with a Retry-After
+    def test_login_rate_limit(self):
+        for _ in range(5):
+            response = self.client.post('/login', data=dict(email="admin@test.com", password="wrong"))
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post('/login', data=dict(email="admin@test.com", password="administrator"))
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response.headers['Retry-After']), 0)
+        #other addresses from the same client still get through
+        response = self.client.post('/login', data=dict(email="jane@test.com", password="123456"))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(limiter.counters(), {'login.allowed': 6, 'login.limited': 1})
+
+    #Test the sliding window weighs in the previous window and shares counters through redis
+    def test_rate_limiter_window(self):
+        window = RateLimiter()
+        window.storage = RedisStorage(FakeRedis())
+        for second in range(3):
+            self.assertIsNone(window.hit('k', 3, 60, now=600 + second))
+        self.assertEqual(window.hit('k', 3, 60, now=610), 80)
+        #4 hits in 600-660, half of them still count at 690
+        self.assertIsNone(window.hit('k', 3, 60, now=690))
+        self.assertEqual(window.hit('k', 3, 60, now=691), 29)
+
     #Test login behaves correctly given the incorrect credentials / Ensure invalid email format throws error
     def test_incorrect_login(self):
         response =self.client.post(
@@ -129,24 +279,53 @@ class UserViewsTests(BaseTestCase):
         db.session.add(u1)
         db.session.add(u2)
         db.session.commit()
-        assert u1.unfollow(u2) is None
-        u = u1.follow(u2)
-        db.session.add(u)
+        assert not u1.unfollow(u2)
+        assert u1.follow(u2)
         db.session.commit()
-        assert u1.follow(u2) is None
+        assert not u1.follow(u2)
         assert u1.is_following(u2)
         assert u1.followed.count() == 1
         assert u1.followed.first().name == 'susan'
         assert u2.followers.count() == 1
         assert u2.followers.first().name == 'john'
-        u = u1.unfollow(u2)
-        assert u is not None
-        db.session.add(u)
+        assert u1.unfollow(u2)
         db.session.commit()
         assert not u1.is_following(u2)
         assert u1.followed.count() == 0
         assert u2.followers.count() == 0
 
+    #Test follower counters follow follow/unfollow
+    def test_follow_counters(self):
+        u1 = User('john', 'john@test.com','testing123', admin=True, role="admin", confirmed=True)
+        u2 = User('susan','susan@test.com','testing123', admin=True, role="admin", confirmed=True)
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        u1.follow(u2)
+        db.session.commit()
+        self.assertEqual((u1.following_count, u2.follower_count), (1, 1))
+        u1.unfollow(u2)
+        db.session.commit()
+        self.assertEqual((u1.following_count, u2.follower_count), (0, 0))
+
+    #Test follows written to the table are idempotent and keep the counters right
+    def test_follow_idempotent(self):
+        u1 = User('john', 'john@test.com','testing123', admin=True, role="admin", confirmed=True)
+        u2 = User('susan','susan@test.com','testing123', admin=True, role="admin", confirmed=True)
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        self.assertTrue(follow(u1.id, u2.id))
+        self.assertFalse(follow(u1.id, u2.id))
+        db.session.commit()
+        self.assertTrue(u1.is_following(u2))
+        self.assertEqual((u1.following_count, u2.follower_count), (1, 1))
+        self.assertEqual(following_ids(u1.id, [u1.id, u2.id, None]), {u2.id})
+        self.assertEqual(following_ids(u2.id, [u1.id]), set())
+        self.assertTrue(unfollow(u1.id, u2.id))
+        self.assertFalse(unfollow(u1.id, u2.id))
+        db.session.commit()
+        self.assertFalse(u1.is_following(u2))
+        self.assertEqual((u1.following_count, u2.follower_count), (0, 0))
+        
     #User Upload image test
     def test_image_upload(self):
         self.login()
@@ -159,6 +338,78 @@ class UserViewsTests(BaseTestCase):
                                     follow_redirects=True)
         self.assertEqual(response.status,"200 OK")
         
+    #Test a profile picture is turned into variants and swapped in by an image job
+    def test_profile_picture_processing(self):
+        self.login()
+        self.addCleanup(app.config.__setitem__, 'UPLOAD_FOLDER', app.config['UPLOAD_FOLDER'])
+        app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, app.config['UPLOAD_FOLDER'])
+        with open(app.config['TEST_IMG_PATH'],'rb') as img:
+            data = img.read()
+        response = self.client.post('/upload', content_type='multipart/form-data',
+                                    data={'picture': (BytesIO(data), 'img1.jpg')}, follow_redirects=True)
+        self.assertIn(b'Profile picture added.', response.data)
+        job = ImageJob.query.one()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(User.query.get(1).image_url, job.target_url)
+        digest = content_digest(data)
+        self.assertTrue(job.target_url.endswith('/{}-350.jpg'.format(digest)))
+        for width in (48, 96, 350):
+            for ext in ('jpg', 'webp'):
+                variant = Image.open(os.path.join(os.path.dirname(job.target_path), '{}-{}.{}'.format(digest, width, ext)))
+                self.assertLessEqual(variant.size[0], width)
+        status = self.client.get('/upload/status/{}'.format(job.id)).get_json()
+        self.assertEqual(status, {'status': 'done', 'url': job.target_url})
+        #the same picture again reuses the variants
+        self.client.post('/upload', content_type='multipart/form-data',
+                         data={'picture': (BytesIO(data), 'again.jpg')}, follow_redirects=True)
+        self.assertEqual(ImageJob.query.count(), 1)
+        
+    #Test a failed resize puts the previous picture back instead of leaving the original
+    def test_profile_picture_failed_job(self):
+        self.login()
+        self.addCleanup(app.config.__setitem__, 'UPLOAD_FOLDER', app.config['UPLOAD_FOLDER'])
+        app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, app.config['UPLOAD_FOLDER'])
+        User.query.get(1).image_url = '/uploads/1/old-350.jpg'
+        db.session.commit()
+        with open(app.config['TEST_IMG_PATH'],'rb') as img:
+            data = img.read()
+        with mock.patch('project.images.make_variants', side_effect=IOError('cannot identify image file')):
+            self.client.post('/upload', content_type='multipart/form-data',
+                             data={'picture': (BytesIO(data), 'img1.jpg')}, follow_redirects=True)
+        job = ImageJob.query.one()
+        self.assertEqual((job.status, job.previous_url), ('failed', '/uploads/1/old-350.jpg'))
+        self.assertEqual(User.query.get(1).image_url, '/uploads/1/old-350.jpg')
+        with app.test_request_context():
+            self.assertEqual(session_user(1).image_url, '/uploads/1/old-350.jpg')
+        
+    #Test a job finished from the pool (own session) swaps the picture into the cached user and comment blocks
+    def test_image_job_done_in_own_session(self):
+        job = ImageJob('profile', 1, '/tmp/a.orig.jpg', '/tmp/a-350.jpg', '/uploads/1/a-350.jpg')
+        db.session.add(job)
+        db.session.commit()
+        self.assertIsNone(session_user(1).image_url)
+        version = fragment_key('comments', [('users',)])
+        future = Future()
+        future.set_result([])
+        _job_done(job.id, future)
+        with app.test_request_context():
+            self.assertEqual(session_user(1).image_url, '/uploads/1/a-350.jpg')
+        self.assertNotEqual(fragment_key('comments', [('users',)]), version)
+        
+    #Test a variant url renders as a <picture> with a srcset per format
+    def test_responsive_image(self):
+        url = '/uploads/1/0123456789abcdef-350.jpg'
+        with app.test_request_context():
+            html = responsive_image(url, 'profile', sizes='75px')
+            plain = responsive_image('/uploads/1/profile-picture.jpg', 'profile')
+        self.assertIn('<source type="image/webp" srcset="/uploads/1/0123456789abcdef-48.webp 48w, '
+                      '/uploads/1/0123456789abcdef-96.webp 96w, /uploads/1/0123456789abcdef-350.webp 350w"', html)
+        self.assertIn('<img src="{}"'.format(url), html)
+        self.assertIn('/uploads/1/0123456789abcdef-48.jpg 48w', html)
+        self.assertEqual(plain, '<img src="/uploads/1/profile-picture.jpg" alt="" class=""/>')
+        
     ###TEST ROUTE REQUIRES LOGIN###
     
     #Test confirm/<token> route requires logged in user.
@@ -266,6 +517,77 @@ class UserViewsTests(BaseTestCase):
         form = ChangePasswordForm(password='123456789123456789123456789', confirm='123456789123456789123456789')
         self.assertFalse(form.validate())
         
+#Mail stand-in whose SMTP connection always fails
+class UnreachableMail(object):
+    def connect(self):
+        raise IOError('connection refused')
+        
+class MailQueueTests(BaseTestCase):
+    #Test registering queues the activation email and the worker sends it
+    def test_registration_mail_is_queued_and_sent(self):
+        self.client.post('/register', data=dict(username="rhonda", email="rhonda@test.com", password="123456", confirm="123456"))
+        queued = QueuedEmail.query.one()
+        self.assertEqual((queued.recipient, queued.status), ('rhonda@test.com', 'pending'))
+        with mail.record_messages() as outbox:
+            self.assertEqual(MailWorker().process_batch(), 1)
+        self.assertEqual(len(outbox), 1)
+        self.assertEqual(outbox[0].subject, 'Please confirm your account')
+        self.assertEqual(QueuedEmail.query.one().status, 'sent')
+        
+    #Test a registration that fails on a duplicate email queues nothing
+    def test_mail_is_queued_with_the_callers_transaction(self):
+        self.client.post('/register', data=dict(username="jane2", email="jane@test.com", password="123456", confirm="123456"))
+        self.assertEqual(QueuedEmail.query.count(), 0)
+        send_email('jane@test.com', 'subject', '<p>body</p>')
+        db.session.rollback()
+        self.assertEqual(QueuedEmail.query.count(), 0)
+        
+    #Test failed sends are retried later and given up after MAIL_QUEUE_MAX_ATTEMPTS
+    def test_failed_mail_is_retried(self):
+        db.session.add(QueuedEmail('jane@test.com', 'subject', '<p>body</p>'))
+        db.session.commit()
+        worker = MailWorker(mail=UnreachableMail())
+        worker.process_batch()
+        queued = QueuedEmail.query.one()
+        self.assertEqual((queued.status, queued.attempts), ('pending', 1))
+        self.assertGreater(queued.next_attempt_at, datetime.datetime.utcnow())
+        self.assertEqual(worker.process_batch(), 0)
+        worker.max_attempts = 2
+        queued.next_attempt_at = datetime.datetime.utcnow()
+        db.session.commit()
+        worker.process_batch()
+        self.assertEqual(QueuedEmail.query.one().status, 'failed')
+        
+class CacheTests(BaseTestCase):
+    #Test the LRU cache evicts the least recently used entry
+    def test_lru_eviction(self):
+        lru = LRUCache(max_entries=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('c'), 3)
+        
+    #Test the redis backend round trips values through a redis-compatible client
+    def test_redis_backend(self):
+        redis_cache = RedisCache(FakeRedis())
+        redis_cache.set('recent', [sidebar.RecentPost('Test post', 'test')])
+        self.assertEqual(redis_cache.get('recent')[0].slug, 'test')
+        redis_cache.clear()
+        self.assertIsNone(redis_cache.get('recent'))
+        
+    #Test recent posts are served from the cache and refreshed when a post is committed
+    def test_recent_posts_cached(self):
+        self.add_post()
+        self.assertEqual([p.slug for p in sidebar.recent_posts()], ['test'])
+        with self.assertMaxQueries(0):
+            sidebar.recent_posts()
+        db.session.add(BlogPost("Newer post", "content", timestamp=datetime.datetime.utcnow(), author_id=1, slug="newer"))
+        db.session.commit()
+        self.assertEqual([p.slug for p in sidebar.recent_posts()], ['newer', 'test'])
+        
 #######################        
 ### BLOG VIEW TESTS ###
 #######################
@@ -283,6 +605,126 @@ class BlogViewsTests(BaseTestCase):
         response = self.client.get('/blog/test/')
         self.assertTrue(b'This is a test comment' in response.data)
     
+    #Test the blog index does not query the author of every post
+    def test_blog_index_query_count(self):
+        for i in range(5):
+            db.session.add(BlogPost("Post {}".format(i), "content", timestamp=datetime.datetime.utcnow(), author_id=(i % 3) + 1, slug="post-{}".format(i)))
+        db.session.commit()
+        self.login()
+        with self.assertMaxQueries(4):
+            response = self.client.get('/blog')
+        self.assertIn(b'jane', response.data)
+    
+    #Test requests report their SQL and template time, slow ones are logged with their statements
+    def test_request_instrumentation(self):
+        self.add_post()
+        self.login()
+        response = self.client.get('/blog')
+        timings = response.headers.getlist('Server-Timing')
+        self.assertRegex(timings[0], r'^db;dur=[0-9.]+;desc="\d+ queries"$')
+        self.assertEqual([timing.split(';')[0] for timing in timings], ['db', 'tpl', 'app', 'size'])
+        self.assertEqual(timings[3], 'size;desc="{} bytes"'.format(len(response.data)))
+        app.config['PERF_SLOW_REQUEST_MS'] = 0
+        self.addCleanup(app.config.__setitem__, 'PERF_SLOW_REQUEST_MS', 500)
+        with self.assertLogs('project.instrumentation', 'WARNING') as logs:
+            self.client.get('/blog')
+        self.assertIn('Slow request GET /blog (blog.home) 200', logs.output[0])
+        self.assertIn('FROM posts', logs.output[0])
+        #a streamed body is counted as it is sent and logged when the response is closed
+        with app.test_request_context('/stream'):
+            _request_ctx_stack.top.perf = RequestStats()
+            response = finish_request_stats(Response(iter(['ab', 'cd\u00e9'])))
+            with self.assertLogs('project.instrumentation', 'WARNING') as logs:
+                self.assertEqual(b''.join(response.iter_encoded()), 'abcd\u00e9'.encode('utf-8'))
+                response.close()
+        self.assertIn(' 6 bytes', logs.output[0])
+
+    #Test the sampling profiler dumps a profile for the flagged endpoint only
+    def test_request_profiler(self):
+        self.login()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for key, value in (('PERF_PROFILE_DIR', directory), ('PERF_PROFILE_ENDPOINTS', ['blog.home']), ('PERF_PROFILE_SAMPLE_RATE', 1)):
+            self.addCleanup(app.config.__setitem__, key, app.config[key])
+            app.config[key] = value
+        self.client.get('/blog')
+        self.client.get('/profile_settings')
+        profiles = os.listdir(directory)
+        self.assertEqual(len(profiles), 1)
+        self.assertTrue(profiles[0].startswith('blog.home-'))
+
+    #Test the post page does not query the author of every comment
+    def test_post_detail_query_count(self):
+        self.add_post()
+        for user_id in (1, 2, 3):
+            db.session.add(Comments('comment by {}'.format(user_id), timestamp=datetime.datetime.utcnow(), post_id=1, comment_user_id=user_id, comment_post_title="test"))
+        db.session.commit()
+        self.login()
+        with self.assertMaxQueries(4):
+            response = self.client.get('/blog/test/')
+        self.assertIn(b'peter', response.data)
+        
+    #Test the comments API pages through comments with a cursor
+    def test_comments_api_pagination(self):
+        self.add_post()
+        start = datetime.datetime(2020, 1, 1)
+        for i in range(7):
+            db.session.add(Comments('paged comment {}'.format(i), timestamp=start + datetime.timedelta(minutes=i), post_id=1, comment_user_id=3, comment_post_title="test"))
+        db.session.commit()
+        self.login()
+        first = self.client.get('/blog/test/comments?limit=5').get_json()
+        self.assertEqual(len(first['comments']), 5)
+        self.assertEqual(first['comments'][0]['author'], 'peter')
+        second = self.client.get('/blog/test/comments?limit=5&after=' + first['next']).get_json()
+        self.assertEqual([c['content'] for c in second['comments']], ['paged comment 5', 'paged comment 6', 'This is a test comment'])
+        self.assertIsNone(second['next'])
+        response = self.client.post('/test/load_comments', data=dict(after=first['next'])).get_json()
+        self.assertIn('paged comment 6', response['data'])
+        self.assertEqual(self.client.get('/blog/missing/comments').status_code, 404)
+
+    #Test following an author twice from the view counts once and shows in the comments API
+    def test_follow_view_and_comment_authors(self):
+        self.add_post()
+        db.session.add(Comments('peter comment', timestamp=datetime.datetime.utcnow(), post_id=1, comment_user_id=3, comment_post_title="test"))
+        db.session.commit()
+        self.login()
+        comments = self.client.get('/blog/test/comments').get_json()['comments']
+        self.assertFalse(any(c['author_followed'] for c in comments))
+        self.client.get('/follow/peter')
+        self.client.get('/follow/peter')
+        peter = User.query.filter_by(name='peter').first()
+        self.assertEqual(peter.follower_count, 1)
+        comments = self.client.get('/blog/test/comments').get_json()['comments']
+        self.assertEqual(dict((c['author'], c['author_followed']) for c in comments), {'peter': True, 'admin': False})
+        
+    #Test the blog index pages through posts with cursors
+    def test_blog_keyset_pagination(self):
+        start = datetime.datetime(2020, 1, 1)
+        for i in range(7):
+            db.session.add(BlogPost("Paged post {}".format(i), "content", timestamp=start + datetime.timedelta(minutes=i), author_id=1, slug="paged-{}".format(i)))
+        db.session.commit()
+        self.login()
+        response = self.client.get('/blog')
+        self.assertIn(b'/blog/paged-6/" class="blog-post-link"', response.data)
+        self.assertNotIn(b'/blog/paged-1/" class="blog-post-link"', response.data)
+        next_cursor = encode_cursor(start + datetime.timedelta(minutes=2), 3)
+        self.assertIn(next_cursor.encode('ascii'), response.data)
+        response = self.client.get('/blog?after=' + next_cursor)
+        self.assertIn(b'/blog/paged-0/" class="blog-post-link"', response.data)
+        self.assertNotIn(b'/blog/paged-2/" class="blog-post-link"', response.data)
+        
+    #Test old numbered pages redirect to the cursor url
+    def test_blog_page_number_redirect(self):
+        for i in range(7):
+            db.session.add(BlogPost("Paged post {}".format(i), "content", timestamp=datetime.datetime(2020, 1, 1, 0, i), author_id=1, slug="paged-{}".format(i)))
+        db.session.commit()
+        self.login()
+        response = self.client.get('/blog/2')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('after=' + encode_cursor(datetime.datetime(2020, 1, 1, 0, 2), 3), response.location)
+        self.assertEqual(self.client.get('/blog/5').status_code, 404)
+        self.assertEqual(self.client.get('/blog?after=notacursor').status_code, 404)
+        
     #Test posts can be added
     def test_post_add(self):
         post = BlogPost("Another test", "adding another test", timestamp=datetime.datetime.utcnow(),author_id=1, slug="Another test")
@@ -299,6 +741,130 @@ class BlogViewsTests(BaseTestCase):
         response = self.client.post('/blog/delete/test/',follow_redirects = True)
         self.assertIn(b'Post Deleted.', response.data)    
         
+    #Test post and comment counters are maintained and can be recomputed
+    def test_post_and_comment_counters(self):
+        self.add_post()
+        self.login()
+        self.client.post('blog/test/add_comment', data=dict(comment="counted comment"))
+        post = BlogPost.query.filter_by(slug='test').one()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(User.query.get(1).post_count, 1)
+        self.client.post('/blog/test/delete_comment/2')
+        db.session.expire_all()
+        self.assertEqual(post.comment_count, 0)
+        #setUp adds a comment to post 1 before the post exists
+        recount_all()
+        self.assertEqual(post.comment_count, 1)
+        
+    #Test deleting a post removes its comments with a single DELETE
+    def test_post_delete_removes_comments(self):
+        self.add_post()
+        for i in range(5):
+            db.session.add(Comments('bulk {}'.format(i), timestamp=datetime.datetime.utcnow(), post_id=1, comment_user_id=3, comment_post_title="test"))
+        db.session.commit()
+        self.login()
+        #the indexer is not part of the request outside of tests
+        app.config['SEARCH_INDEX_SYNC'] = False
+        self.addCleanup(app.config.__setitem__, 'SEARCH_INDEX_SYNC', True)
+        with self.assertMaxQueries(8) as statements:
+            self.client.post('/blog/delete/test/')
+        self.assertEqual(len([s for s in statements if s.startswith('DELETE FROM comments')]), 1)
+        self.assertEqual(Comments.query.count(), 0)
+        self.assertEqual(User.query.get(1).post_count, 0)
+        
+    #Test several posts can be deleted at once
+    def test_bulk_post_delete(self):
+        for i in range(3):
+            db.session.add(BlogPost("Bulk {}".format(i), "content", timestamp=datetime.datetime.utcnow(), author_id=1, slug="bulk-{}".format(i)))
+        db.session.commit()
+        self.login()
+        response = self.client.post('/blog/delete_posts', data={'slug': ['bulk-0', 'bulk-2']}, follow_redirects=True)
+        self.assertIn(b'2 Posts Deleted.', response.data)
+        self.assertEqual([p.slug for p in BlogPost.query.all()], ['bulk-1'])
+        
+    #Test an editor upload is stored by content hash and served as its default variant
+    def test_editor_image_upload(self):
+        self.addCleanup(app.config.__setitem__, 'CK_UPLOAD_PATH', app.config['CK_UPLOAD_PATH'])
+        app.config['CK_UPLOAD_PATH'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, app.config['CK_UPLOAD_PATH'])
+        self.login()
+        with open(app.config['TEST_IMG_PATH'],'rb') as img:
+            data = img.read()
+        response = self.client.post('/blog/upload', content_type='multipart/form-data',
+                                    data={'upload': (BytesIO(data), 'photo.jpg')})
+        name = '{}-700.jpg'.format(content_digest(data))
+        url = '/files/{}?sig={}'.format(name, upload_signature(name))
+        self.assertIn(url, response.get_data(as_text=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+        files = self.client.get('/blog/files').get_json()
+        self.assertEqual([(f['image'], f['width'], f['uploader']) for f in files], [(url, 700, 'admin')])
+        #the type is the last extension
+        response = self.client.post('/blog/upload', content_type='multipart/form-data',
+                                    data={'upload': (BytesIO(data), 'my.photo.jpg')})
+        self.assertIn(url, response.get_data(as_text=True))
+        response = self.client.post('/blog/upload', content_type='multipart/form-data',
+                                    data={'upload': (BytesIO(data), 'photo.jpg.exe')})
+        self.assertIn('Images only', response.get_data(as_text=True))
+        
+    #Test the file browser pages through the upload index and can be backfilled from disk
+    def test_file_browser_index(self):
+        self.addCleanup(app.config.__setitem__, 'CK_UPLOAD_PATH', app.config['CK_UPLOAD_PATH'])
+        app.config['CK_UPLOAD_PATH'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, app.config['CK_UPLOAD_PATH'])
+        for i in range(3):
+            Image.new('RGB', (20 + i, 10)).save(os.path.join(app.config['CK_UPLOAD_PATH'], 'old{}.png'.format(i)))
+        self.assertEqual(index_directory(app.config['CK_UPLOAD_PATH'], is_listed_upload), 3)
+        self.assertEqual(index_directory(app.config['CK_UPLOAD_PATH'], is_listed_upload), 0)
+        self.login()
+        response = self.client.get('/blog/files?per_page=2')
+        self.assertEqual(len(response.get_json()), 2)
+        self.assertIn('rel="next"', response.headers['Link'])
+        rest = self.client.get('/blog/files?per_page=2&after={}'.format(response.headers['X-Next-Cursor'])).get_json()
+        self.assertEqual(len(rest), 1)
+        self.assertEqual(self.client.get('/blog/files?q=old1').get_json()[0]['width'], 21)
+        
+    #Test a signed upload url is served with caching headers and without a login or query
+    def test_signed_upload_serving(self):
+        self.addCleanup(app.config.__setitem__, 'CK_UPLOAD_PATH', app.config['CK_UPLOAD_PATH'])
+        app.config['CK_UPLOAD_PATH'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, app.config['CK_UPLOAD_PATH'])
+        name = '0123456789abcdef-700.jpg'
+        with open(os.path.join(app.config['CK_UPLOAD_PATH'], name), 'wb') as f:
+            f.write(b'0123456789')
+        url = '/files/{}?sig={}'.format(name, upload_signature(name))
+        with self.assertMaxQueries(0):
+            response = self.client.get(url)
+            cached = self.client.get(url, headers={'If-None-Match': response.headers['ETag']})
+            partial = self.client.get(url, headers={'Range': 'bytes=2-4'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual((partial.status_code, partial.data), (206, b'234'))
+        response = self.client.get('/files/{}?sig=forged'.format(name), follow_redirects=True)
+        self.assertIn(b'Please log in to access this page.', response.data)
+        #a logged in user isn't loaded for it either
+        self.login()
+        cache.clear()
+        with self.assertMaxQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        
+    #Test rendered post fragments are reused until the post or its comments change
+    def test_fragment_cache(self):
+        self.add_post()
+        self.login()
+        self.assertIn(b'This is a test. Only a test.', self.client.get('/blog/test/').data)
+        #a write that skips the ORM events is not seen
+        db.session.execute(BlogPost.__table__.update().values(content='Changed behind the cache'))
+        db.session.commit()
+        self.assertIn(b'This is a test. Only a test.', self.client.get('/blog/test/').data)
+        post = BlogPost.query.one()
+        post.content = 'Edited through the ORM'
+        db.session.commit()
+        self.assertIn(b'Edited through the ORM', self.client.get('/blog/test/').data)
+        self.assertIn(b'Edited through the ORM', self.client.get('/blog').data)
+        self.client.post('/blog/test/add_comment', data=dict(comment='a cached comment block'))
+        self.assertIn(b'a cached comment block', self.client.get('/blog/test/').data)
+        
     #Test comment can be added
     def test_comment_add(self):
         self.add_post()
@@ -316,8 +882,121 @@ class BlogViewsTests(BaseTestCase):
     #Search for posts test
     def test_search_post(self):
         post1 = self.add_post()
-        results = BlogPost.query.msearch('test').all()
-        self.assertEqual(len(results), 1)
+        results = search_posts('test')
+        self.assertEqual(len(list(results)), 1)
+        
+    #Test a reindex keeps the live index searchable and drops deleted posts at the end
+    def test_reindex_in_place(self):
+        now = datetime.datetime.utcnow()
+        db.session.add_all([BlogPost("Reindex one", "text", timestamp=now, author_id=1, slug="one"),
+                            BlogPost("Reindex two", "text", timestamp=now, author_id=1, slug="two")])
+        db.session.commit()
+        backend().index(db.session.connection(), [(99, 'Reindex ghost', 'deleted post')])
+        db.session.commit()
+        with mock.patch.object(backend(), 'index', side_effect=[None, IOError('killed')]):
+            with self.assertRaises(IOError):
+                reindex(batch_size=1)
+        self.assertEqual(search_posts('reindex').total, 3)
+        self.assertEqual(reindex(batch_size=1), 2)
+        self.assertEqual(sorted(post.slug for hit, post in search_posts('reindex')), ['one', 'two'])
+        self.assertEqual(search_posts('reindex').total, 2)
+        
+    #Test search ranks title matches first, strips the post html and highlights matches
+    def test_search_ranking_and_highlight(self):
+        now = datetime.datetime.utcnow()
+        db.session.add(BlogPost("Gardening notes", "<p>Tomatoes &amp; <b>zucchini</b></p>", timestamp=now, author_id=1, slug="garden"))
+        db.session.add(BlogPost("Zucchini recipes", "<p>Bread</p>", timestamp=now, author_id=1, slug="recipes"))
+        db.session.commit()
+        results = search_posts('zucchini')
+        self.assertEqual([post.slug for hit, post in results], ['recipes', 'garden'])
+        hit = results.hits[1]
+        self.assertEqual(hit.snippet, 'Tomatoes &amp; <mark>zucchini</mark>')
+        self.assertEqual(search_posts('zucchini', page=2, per_page=1).hits[0].post_id, hit.post_id)
+        BlogPost.query.filter_by(slug='garden').one().content = 'Nothing here'
+        db.session.commit()
+        self.assertEqual(search_posts('zucchini').total, 1)
+        self.login()
+        response = self.client.post('/blog/search', data={'search': 'Zucchini'}, follow_redirects=True)
+        self.assertIn(b'<mark>Zucchini</mark> recipes', response.data)
+        
+    #Test search pages are cached per normalized query until a post changes
+    def test_search_result_cache(self):
+        self.add_post()
+        self.login()
+        response = self.client.get('/blog/search?q=Test')
+        self.assertIn(b'<mark>Test</mark> post', response.data)
+        self.assertIn('private', response.headers['Cache-Control'])
+        with self.assertMaxQueries(10) as statements:
+            self.client.get('/blog/search?q=test++')
+        self.assertFalse([s for s in statements if 'post_search' in s])
+        cached = self.client.get('/blog/search?q=Test', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+        db.session.add(BlogPost("Another test", "content", timestamp=datetime.datetime.utcnow(), author_id=1, slug="another"))
+        db.session.commit()
+        self.assertIn(b'<mark>Another</mark> <mark>test</mark>', self.client.get('/blog/search?q=another+test').data)
+        self.assertEqual(search_posts('test').total, 2)
+        
+    #Test the search page carries no CSRF token, so its ETag holds across requests
+    def test_search_page_etag_with_csrf(self):
+        self.add_post()
+        self.login()
+        self.addCleanup(app.config.__setitem__, 'WTF_CSRF_ENABLED', False)
+        app.config['WTF_CSRF_ENABLED'] = True
+        response = self.client.get('/blog/search?q=Test')
+        self.assertNotIn(b'csrf_token', response.data)
+        cached = self.client.get('/blog/search?q=Test', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+        
+    #Test title suggestions follow post changes
+    def test_search_suggest(self):
+        self.add_post()
+        self.login()
+        self.assertEqual(self.client.get('/blog/search/suggest?q=te').get_json(),
+                         [{'title': 'Test post', 'url': '/blog/test/'}])
+        post = BlogPost.query.one()
+        post.title = 'Renamed'
+        db.session.commit()
+        self.assertEqual(self.client.get('/blog/search/suggest?q=te').get_json(), [])
+        self.assertEqual(len(self.client.get('/blog/search/suggest?q=ren').get_json()), 1)
+    
+    #Test a process catches its title index up from the posts another process indexed
+    def test_search_suggest_catch_up(self):
+        self.add_post()
+        self.assertEqual(suggestions('te'), [('Test post', 'test')])
+        post = BlogPost.query.one()
+        #the indexer runs in another process, with an index of its own
+        with mock.patch('project.suggest._index', PrefixIndex()):
+            post.title = 'Renamed'
+            db.session.add(BlogPost("Second", "content", timestamp=datetime.datetime.utcnow(), author_id=1, slug="second"))
+            db.session.commit()
+        with self.assertMaxQueries(1) as statements:
+            self.assertEqual(suggestions('ren'), [('Renamed', 'test')])
+        self.assertIn(' IN (', statements[0])
+        self.assertEqual(suggestions('te'), [])
+        self.assertEqual(suggestions('sec'), [('Second', 'second')])
+        #after a full rebuild it reloads
+        reindex()
+        with self.assertMaxQueries(1) as statements:
+            suggestions('ren')
+        self.assertNotIn(' IN (', statements[0])
+        
+    #Test post changes are queued and indexed later when the indexer is not running
+    def test_search_outbox(self):
+        app.config['SEARCH_INDEX_SYNC'] = False
+        self.addCleanup(app.config.__setitem__, 'SEARCH_INDEX_SYNC', True)
+        self.add_post()
+        self.assertEqual(search_posts('test').total, 0)
+        self.assertEqual(indexing_lag()[0], 1)
+        post = BlogPost.query.one()
+        post.title = 'Renamed post'
+        db.session.commit()
+        self.assertEqual(SearchIndexer().drain(), 2)
+        self.assertEqual(indexing_lag(), (0, 0.0))
+        self.assertEqual(search_posts('renamed').total, 1)
+        db.session.delete(post)
+        db.session.commit()
+        SearchIndexer().drain()
+        self.assertEqual(search_posts('renamed').total, 0)
     
     ###TEST ROUTE REQUIRES LOGIN###
     #blog index 
@@ -368,6 +1047,11 @@ class BlogViewsTests(BaseTestCase):
         login = self.client.post('/login',data=dict(email="peter@test.com", password="456789",follow_redirects=True))
         response = self.client.post('/blog/delete/test/',follow_redirects = True)
         self.assertFalse(b'Post Deleted.' in response.data)
+    #bulk delete blog posts
+    def test_bulk_delete_posts_requires_admin(self):
+        login = self.client.post('/login',data=dict(email="peter@test.com", password="456789",follow_redirects=True))
+        response = self.client.post('/blog/delete_posts', data={'slug': ['test']}, follow_redirects = True)
+        self.assertFalse(b'Posts Deleted.' in response.data)
     #delete comment in post
     def test_delete_comment_requires_admin(self):
         login = self.client.post('/login',data=dict(email="peter@test.com", password="456789",follow_redirects = True))
@@ -401,6 +1085,135 @@ class BlogViewsTests(BaseTestCase):
         form = SearchForm(search="test")
         self.assertTrue(form.validate())    
             
+
+class DatabaseTests(BaseTestCase):
+    def _replica(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        uri = 'sqlite:///' + os.path.join(directory, 'replica.db')
+        engine = db.create_engine_for(app, uri)
+        db.metadata.create_all(engine)
+        #the replica has the users, but only a post of its own
+        engine.execute(User.__table__.insert(), [dict(row) for row in db.session.execute(User.__table__.select())])
+        engine.execute(BlogPost.__table__.insert(), {'title': 'Replica post', 'content': 'Replica', 'slug': 'replica',
+                                                     'author_id': 1, 'timestamp': datetime.datetime.utcnow()})
+        engine.dispose()
+        for key in ('SQLALCHEMY_REPLICA_URIS', 'DB_REPLICA_LAG_CHECK_INTERVAL'):
+            self.addCleanup(app.config.__setitem__, key, app.config[key])
+        self.addCleanup(db.replicas().dispose)
+        app.config['SQLALCHEMY_REPLICA_URIS'] = [uri]
+
+    #Test read only views read from the replica, except right after the user wrote or while it lags
+    def test_replica_routing(self):
+        self.add_post()
+        self._replica()
+        self.login()
+        self.assertEqual(self.client.get('/blog/replica/').status_code, 200)
+        self.assertEqual(self.client.get('/blog/test/').status_code, 404)
+        self.client.post('/blog/test/add_comment', data=dict(comment='Fresh comment'))
+        response = self.client.get('/blog/test/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Fresh comment', response.data)
+        with self.client.session_transaction() as session:
+            session[LAST_WRITE_KEY] -= app.config['DB_REPLICA_MAX_LAG'] + 1
+        self.assertEqual(self.client.get('/blog/test/').status_code, 404)
+        app.config['DB_REPLICA_LAG_CHECK_INTERVAL'] = 0
+        with mock.patch('project.database.replica_lag', return_value=app.config['DB_REPLICA_MAX_LAG'] + 1):
+            self.assertEqual(self.client.get('/blog/test/').status_code, 200)
+        with mock.patch('project.database.replica_lag', side_effect=OperationalError('SELECT 1', {}, None)):
+            self.assertEqual(self.client.get('/blog/test/').status_code, 200)
+        self.assertEqual(self.client.get('/blog/replica/').status_code, 200)
+
+    #Test statements of a request are interrupted after DB_STATEMENT_TIMEOUT_MS
+    def test_statement_timeout(self):
+        self.addCleanup(app.config.__setitem__, 'DB_STATEMENT_TIMEOUT_MS', app.config['DB_STATEMENT_TIMEOUT_MS'])
+        app.config['DB_STATEMENT_TIMEOUT_MS'] = 50
+        slow = text('WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 1000000000) '
+                    'SELECT count(*) FROM c')
+        with app.test_request_context('/blog'):
+            with self.assertRaises(OperationalError):
+                db.session.execute(slow).scalar()
+            db.session.rollback()
+        #the connection went back to the pool without the limit
+        with db.engine.connect() as connection:
+            self.assertNotIn('statement_timeout', connection.info)
+        self.assertEqual(User.query.count(), 3)
+
+
+class ChangeBusTests(BaseTestCase):
+    #Test commit subscribers get one batch per commit with the changed columns, nothing after a rollback
+    def test_change_batches(self):
+        batches = []
+        changes.on_commit(BlogPost, ops=('insert', 'update'))(batches.append)
+        self.addCleanup(changes.unsubscribe, batches.append)
+        self.add_post()
+        post = BlogPost.query.one()
+        post.title = 'Renamed post'
+        db.session.add(BlogPost('Second post', 'Second', timestamp=datetime.datetime.utcnow(), author_id=1, slug='second'))
+        db.session.commit()
+        self.assertEqual(len(batches), 2)
+        self.assertEqual([(change.op, change.id) for change in batches[0]], [('insert', post.id)])
+        self.assertEqual(sorted((change.op, change.values['slug'], sorted(change.fields)) for change in batches[1]),
+                         [('insert', 'second', []), ('update', 'test', ['title'])])
+        post.title = 'Rolled back'
+        db.session.flush()
+        db.session.rollback()
+        db.session.delete(BlogPost.query.filter_by(slug='second').one())
+        db.session.commit()
+        self.assertEqual(len(batches), 2)
+        #only the recorded models can be subscribed to
+        with self.assertRaises(ValueError):
+            changes.on_commit(QueuedEmail)
+
+class BenchmarkTests(BaseTestCase):
+    #Test the benchmark harness runs on generated data and flags regressions
+    def test_benchmark_harness(self):
+        for key in ('RATELIMIT_ENABLED', 'PERF_SLOW_REQUEST_MS'):
+            self.addCleanup(app.config.__setitem__, key, app.config[key])
+        self.assertEqual(generate(users=5, posts=10, comments=40, follows=2), (5, 10, 40, 8))
+        bench0 = User.query.filter_by(name='bench0').one()
+        self.assertEqual(bench0.follower_count, bench0.followers.count())
+        results = micro.run(iterations=3, warmup=1, only=['blog.home', 'post_detail', 'search'])
+        self.assertEqual(sorted(results), ['blog.home', 'post_detail', 'search'])
+        self.assertLessEqual(results['blog.home']['p50'], results['blog.home']['p99'])
+        self.assertGreater(results['post_detail']['queries'], 0)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'baseline.json')
+        micro.save_baseline(results, path)
+        self.assertEqual(micro.compare(results, path), [])
+        results['search']['queries'] += 1
+        self.assertEqual(micro.compare(results, path), ['search: {:.2f} queries, baseline {:.2f}'.format(
+            results['search']['queries'], results['search']['queries'] - 1)])
+
+
+class ServingTests(unittest.TestCase):
+    def _settings(self, **env):
+        with mock.patch.dict(os.environ, env):
+            return runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py'))
+
+    def test_gunicorn_settings(self):
+        settings = self._settings(APP_WORKER_CLASS='sync', APP_WORKERS='3', APP_PRELOAD='1', PORT='5005')
+        self.assertEqual((settings['worker_class'], settings['workers'], settings['bind']), ('sync', 3, '0.0.0.0:5005'))
+        self.assertTrue(settings['preload_app'])
+        #gevent patches the standard library in the workers, the app can't be preloaded
+        settings = self._settings(APP_WORKER_CLASS='gevent', APP_PRELOAD='1', APP_WORKER_CONNECTIONS='20')
+        self.assertFalse(settings['preload_app'])
+        self.assertEqual(settings['worker_connections'], 20)
+        self.assertEqual(settings['workers'], multiprocessing.cpu_count() + 1)
+
+    #Per worker caches are refused with several workers
+    def test_gunicorn_refuses_local_caches(self):
+        settings = self._settings()
+        server = mock.Mock()
+        server.cfg.workers = 3
+        with mock.patch.dict(os.environ, APP_SETTINGS='config.TestConfig'):
+            with self.assertRaises(RuntimeError):
+                settings['on_starting'](server)
+            server.cfg.workers = 1
+            settings['on_starting'](server)
+        self.assertEqual(settings['local_caches'](mock.Mock(CACHE_TYPE='redis', FRAGMENT_CACHE_TYPE='redis')), [])
+        
         
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file